@@ -1,7 +1,6 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi import Depends, HTTPException, status
@@ -9,24 +8,42 @@ from fastapi.security import OAuth2PasswordBearer
 from app.config import settings
 from app.models import User
 from app.database import get_db
+from app.services.password_hasher import PasswordHasherBusy, password_hasher
+from app.services.user_cache import current_user_cache
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (same policy as the async hashing pool, for scripts)
+pwd_context = password_hasher.context
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash"""
+    """Verify a password against a hash (blocking, for scripts)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
+    """Hash a password (blocking, for scripts)"""
     return pwd_context.hash(password)
 
 
+def _password_hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the password hashing pool"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token"""
     to_encode = data.copy()
@@ -51,8 +68,18 @@ async def authenticate_user(db: AsyncSession, email: str, password: str) -> Opti
     user = await get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.password_hash):
+
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(password, user.password_hash)
+    except PasswordHasherBusy:
+        raise _password_hasher_busy()
+    if not valid:
         return None
+
+    if new_hash:
+        # Stored hash uses an outdated cost factor: upgrade it now that we know the password
+        user.password_hash = new_hash
+        await db.commit()
     return user
 
 
@@ -72,9 +99,12 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_email(db, email)
+    user = current_user_cache.get(email)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_email(db, email)
+        if user is None:
+            raise credentials_exception
+        current_user_cache.put(user)
     
     return user
 
@@ -1,27 +1,116 @@
 """
 Background tasks for handling prescription timeouts and automated processes
+
+Validation timeouts are kept in an in-memory min-heap of deadlines, fed by the
+upload and retry endpoints and cancelled on validation, so a request expires
+at its deadline instead of on the next polling pass. Every worker fires the
+deadlines of its own uploads; the expiry UPDATE only returns the rows it
+changed, so a request expired by two workers is still notified once. A
+low-frequency scan (backed by a partial index on pending requests), run by a
+single leader-elected worker, expires what was missed and seeds that worker's
+heap with every pending request.
 """
 import asyncio
+import heapq
 import logging
-from datetime import datetime
-from typing import List
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import select, update
+from sqlalchemy import func, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.database import AsyncSessionLocal
-from app.models import PrescriptionRequest, PrescriptionStatus, Pharmacy, Product
-from app.services.notification_service import NotificationService
+from app.models import Notification, PrescriptionRequest, PrescriptionStatus, Pharmacy, PharmacyInventory, Product
+from app.services.notification_counter import record_unread_changes
+from app.services.pharmacy_locator import pharmacy_locator
 
 logger = logging.getLogger(__name__)
 
+# Above this many pharmacies in range, stock is looked up by product alone and filtered by distance here
+MAX_ALTERNATIVE_CANDIDATES = 500
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Naive UTC datetime, as validation_timeout_at is written"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class TimeoutScheduler:
+    """Min-heap of request deadlines; cancelled entries are skipped when they reach the top"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str]] = []
+        self._deadlines: Dict[str, datetime] = {}
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def schedule(self, request_id: str, deadline: datetime):
+        """Set (or move) the deadline of a request"""
+        deadline = _as_utc(deadline)
+        if self._deadlines.get(request_id) == deadline:
+            return
+        self._deadlines[request_id] = deadline
+        heapq.heappush(self._heap, (deadline, request_id))
+        if self._heap[0][1] == request_id:
+            # New earliest deadline: the waiting loop must sleep less
+            self._changed.set()
+
+    def cancel(self, request_id: str):
+        if self._deadlines.pop(request_id, None) is not None and len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, request_id) for request_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def next_deadline(self) -> Optional[datetime]:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[str]:
+        """Remove and return the requests whose deadline has passed"""
+        due = []
+        while (deadline := self.next_deadline()) is not None and deadline <= now:
+            _, request_id = heapq.heappop(self._heap)
+            del self._deadlines[request_id]
+            due.append(request_id)
+        return due
+
+    async def wait(self, timeout: Optional[float]):
+        """Sleep for timeout seconds (None: indefinitely), or until an earlier deadline is scheduled"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._changed.clear()
+
+    def wake(self):
+        self._changed.set()
+
+
 class BackgroundTaskManager:
     """Manages background tasks for prescription validation timeouts"""
 
     def __init__(self):
-        self.notification_service = NotificationService()
+        self.timeouts = TimeoutScheduler()
         self._running = False
 
+    def schedule_timeout(self, request_id: str, validation_timeout_at: Optional[datetime]):
+        """Expire a committed pending request at its validation deadline"""
+        if validation_timeout_at is not None:
+            self.timeouts.schedule(request_id, validation_timeout_at)
+
+    def cancel_timeout(self, request_id: str):
+        """Forget the deadline of a request that was validated"""
+        self.timeouts.cancel(request_id)
+
     async def start_timeout_monitor(self):
         """Start the prescription timeout monitoring task"""
         self._running = True
@@ -29,9 +118,13 @@ class BackgroundTaskManager:
 
         while self._running:
             try:
-                await self.process_expired_prescriptions()
-                # Check every 30 seconds
-                await asyncio.sleep(30)
+                due = self.timeouts.pop_due(datetime.utcnow())
+                if due:
+                    await self.process_expired_prescriptions(due)
+
+                deadline = self.timeouts.next_deadline()
+                delay = None if deadline is None else max((deadline - datetime.utcnow()).total_seconds(), 0)
+                await self.timeouts.wait(delay)
             except Exception as e:
                 logger.error(f"Error in timeout monitor: {str(e)}")
                 await asyncio.sleep(60)  # Wait longer on error
@@ -39,95 +132,138 @@ class BackgroundTaskManager:
     def stop_timeout_monitor(self):
         """Stop the prescription timeout monitoring task"""
         self._running = False
+        self.timeouts.wake()
         logger.info("Stopping prescription timeout monitor...")
 
-    async def process_expired_prescriptions(self):
-        """Process all expired prescription requests"""
-        async with AsyncSessionLocal() as db:
-            try:
-                # Find all pending prescriptions that have timed out
-                current_time = datetime.utcnow()
-
-                result = await db.execute(
-                    select(PrescriptionRequest, Pharmacy, Product).
-                    join(Pharmacy, PrescriptionRequest.pharmacy_id == Pharmacy.id).
-                    join(Product, PrescriptionRequest.product_id == Product.id).
-                    where(
-                        PrescriptionRequest.status == PrescriptionStatus.PENDING,
-                        PrescriptionRequest.validation_timeout_at < current_time
-                    )
-                )
-
-                expired_requests = result.all()
+    async def reconcile_timeouts(self):
+        """Expire overdue requests and schedule the pending ones missing from the heap.
 
-                if not expired_requests:
-                    return
+        A leader-elected job (see main.py): one worker scans for all of them.
+        """
+        await self.process_expired_prescriptions()
 
-                logger.info(f"Found {len(expired_requests)} expired prescription requests")
-
-                for request, pharmacy, product in expired_requests:
-                    await self.expire_prescription_request(db, request, pharmacy, product)
-
-                await db.commit()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(PrescriptionRequest.id, PrescriptionRequest.validation_timeout_at).where(
+                    PrescriptionRequest.status == PrescriptionStatus.PENDING,
+                    PrescriptionRequest.validation_timeout_at.is_not(None)
+                )
+            )
+            for request_id, validation_timeout_at in result.all():
+                self.timeouts.schedule(request_id, validation_timeout_at)
 
+    async def process_expired_prescriptions(self, request_ids: Optional[List[str]] = None):
+        """Process expired prescription requests (all of them, or only request_ids)"""
+        async with AsyncSessionLocal() as db:
+            try:
+                expired = await self.expire_timed_out_requests(db, request_ids)
+                if expired:
+                    logger.info(f"Expired {expired} prescription requests")
             except Exception as e:
                 logger.error(f"Error processing expired prescriptions: {str(e)}")
                 await db.rollback()
 
-    async def expire_prescription_request(
+    async def expire_timed_out_requests(
         self,
         db: AsyncSession,
-        request: PrescriptionRequest,
-        pharmacy: Pharmacy,
-        product: Product
-    ):
-        """Expire a single prescription request"""
-        try:
-            # Update status to EXPIRED with rejection reason
+        request_ids: Optional[List[str]] = None,
+        chunk_size: Optional[int] = None
+    ) -> int:
+        """Expire timed-out pending requests and notify their users; returns how many.
+
+        Works in chunks of PRESCRIPTION_EXPIRY_CHUNK_SIZE requests, each one
+        UPDATE ... RETURNING, one lookup of pharmacy and product names, one
+        multi-row notification insert and one unread counter upsert, committed
+        before the next chunk.
+        """
+        chunk_size = chunk_size or settings.PRESCRIPTION_EXPIRY_CHUNK_SIZE
+        expired = 0
+
+        while True:
+            current_time = datetime.utcnow()
+            due = (
+                select(PrescriptionRequest.id)
+                .where(
+                    PrescriptionRequest.status == PrescriptionStatus.PENDING,
+                    PrescriptionRequest.validation_timeout_at <= current_time
+                )
+                .order_by(PrescriptionRequest.validation_timeout_at)
+                .limit(chunk_size)
+            )
+            if request_ids is not None:
+                due = due.where(PrescriptionRequest.id.in_(request_ids))
+
+            pharmacy_name = func.coalesce(
+                select(Pharmacy.name).where(Pharmacy.id == PrescriptionRequest.pharmacy_id).scalar_subquery(), ""
+            )
             rejection_reason = (
-                f"La pharmacie \"{pharmacy.name}\" n'a malheureusement pas pris en charge "
-                f"votre demande dans le délai imparti (15 minutes). Veuillez essayer avec "
-                f"une autre pharmacie."
+                literal("La pharmacie \"") + pharmacy_name +
+                literal("\" n'a malheureusement pas pris en charge votre demande dans le délai imparti "
+                        "(15 minutes). Veuillez essayer avec une autre pharmacie.")
             )
 
-            # Update the prescription request
-            await db.execute(
-                update(PrescriptionRequest).
-                where(PrescriptionRequest.id == request.id).
-                values(
+            # The status condition is checked again in case another process expired or validated a request
+            result = await db.execute(
+                update(PrescriptionRequest)
+                .where(
+                    PrescriptionRequest.id.in_(due.scalar_subquery()),
+                    PrescriptionRequest.status == PrescriptionStatus.PENDING
+                )
+                .values(
                     status=PrescriptionStatus.EXPIRED,
                     rejection_reason=rejection_reason,
-                    validated_at=datetime.utcnow()
+                    validated_at=current_time
                 )
+                .returning(
+                    PrescriptionRequest.id, PrescriptionRequest.user_id,
+                    PrescriptionRequest.pharmacy_id, PrescriptionRequest.product_id
+                )
+                .execution_options(synchronize_session=False)
             )
-
-            # Create notification for the user
-            notification_message = (
-                f"⏰ Votre demande de prescription pour \"{product.name}\" a expiré. "
-                f"La pharmacie {pharmacy.name} n'a pas répondu dans les délais. "
-                f"Vous pouvez essayer avec une autre pharmacie."
-            )
-
-            notification_data = {
-                "prescription_request_id": str(request.id),
-                "pharmacy_name": pharmacy.name,
-                "product_name": product.name,
-                "action": "expired"
-            }
-
-            await self.notification_service.create_notification(
-                db=db,
-                user_id=request.user_id,
-                title="Prescription expirée",
-                message=notification_message,
-                type_="prescription_expired",
-                data=notification_data
-            )
-
-            logger.info(f"Expired prescription request {request.id} for user {request.user_id}")
-
-        except Exception as e:
-            logger.error(f"Error expiring prescription request {request.id}: {str(e)}")
+            rows = result.all()
+            if not rows:
+                break
+
+            pharmacy_names = dict((await db.execute(
+                select(Pharmacy.id, Pharmacy.name).where(Pharmacy.id.in_({row.pharmacy_id for row in rows}))
+            )).all())
+            product_names = dict((await db.execute(
+                select(Product.id, Product.name).where(Product.id.in_({row.product_id for row in rows}))
+            )).all())
+
+            notifications = []
+            for request_id, user_id, pharmacy_id, product_id in rows:
+                pharmacy_name = pharmacy_names.get(pharmacy_id)
+                product_name = product_names.get(product_id)
+                notifications.append({
+                    "id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "type": "prescription_expired",
+                    "title": "Prescription expirée",
+                    "message": (
+                        f"⏰ Votre demande de prescription pour \"{product_name}\" a expiré. "
+                        f"La pharmacie {pharmacy_name} n'a pas répondu dans les délais. "
+                        f"Vous pouvez essayer avec une autre pharmacie."
+                    ),
+                    "is_read": False,
+                    "meta_data": {
+                        "prescription_request_id": str(request_id),
+                        "pharmacy_name": pharmacy_name,
+                        "product_name": product_name,
+                        "action": "expired"
+                    },
+                    "created_at": current_time
+                })
+            await db.execute(insert(Notification), notifications)
+            # The multi-row insert bypasses the ORM hooks that maintain unread counters
+            await record_unread_changes(db, Counter(notification["user_id"] for notification in notifications))
+            await db.commit()
+
+            expired += len(rows)
+            if len(rows) < chunk_size:
+                break
+
+        return expired
 
     async def get_alternative_pharmacies(
         self,
@@ -136,66 +272,70 @@ class BackgroundTaskManager:
         max_distance_km: float = 50.0,
         limit: int = 5
     ) -> List[dict]:
-        """Get alternative pharmacies that sell the same product"""
+        """Get the nearest other pharmacies with the requested quantity of the product in stock"""
         try:
-            # Get the original pharmacy's location
-            original_pharmacy_result = await db.execute(
-                select(Pharmacy).where(Pharmacy.id == expired_request.pharmacy_id)
-            )
-            original_pharmacy = original_pharmacy_result.scalar_one_or_none()
-
-            if not original_pharmacy or not original_pharmacy.latitude or not original_pharmacy.longitude:
-                logger.warning(f"Original pharmacy {expired_request.pharmacy_id} not found or missing coordinates")
+            index = await pharmacy_locator.get_index(db)
+            origin = index.points.get(expired_request.pharmacy_id)
+            if origin is not None:
+                latitude, longitude = origin.latitude, origin.longitude
+            else:
+                # No longer indexed (e.g. unverified since): read its location
+                result = await db.execute(
+                    select(Pharmacy.latitude, Pharmacy.longitude).where(Pharmacy.id == expired_request.pharmacy_id)
+                )
+                location = result.first()
+                if not location or location.latitude is None or location.longitude is None:
+                    logger.warning(f"Original pharmacy {expired_request.pharmacy_id} not found or missing coordinates")
+                    return []
+                latitude, longitude = float(location.latitude), float(location.longitude)
+
+            # Spatial candidates from the in-memory index, nearest first
+            distances = dict(index.within_radius(
+                latitude, longitude, max_distance_km, exclude=[expired_request.pharmacy_id]
+            ))
+            if not distances:
                 return []
 
-            # Find pharmacies that have the product in stock
-            # Note: This would need to be implemented based on your inventory system
-            # For now, we'll find nearby pharmacies
-
-            from sqlalchemy import text, func
-
-            # Calculate distance using Haversine formula
-            distance_formula = func.round(
-                func.sqrt(
-                    func.pow(
-                        69.1 * (Pharmacy.latitude - original_pharmacy.latitude), 2
-                    ) +
-                    func.pow(
-                        69.1 * (original_pharmacy.longitude - Pharmacy.longitude) *
-                        func.cos(Pharmacy.latitude / 57.3), 2
-                    )
-                ), 2
-            ).label('distance_km')
+            # Stock of the product per candidate pharmacy (summed over batches), through the
+            # pharmacy_inventory.product_id index, joined with the pharmacy details in one query
+            stock = (
+                select(
+                    PharmacyInventory.pharmacy_id,
+                    func.min(PharmacyInventory.price).label("price"),
+                    func.sum(PharmacyInventory.quantity).label("quantity")
+                )
+                .where(
+                    PharmacyInventory.product_id == expired_request.product_id,
+                    PharmacyInventory.quantity > 0
+                )
+                .group_by(PharmacyInventory.pharmacy_id)
+                .having(func.sum(PharmacyInventory.quantity) >= (expired_request.quantity_requested or 1))
+            )
+            if len(distances) <= MAX_ALTERNATIVE_CANDIDATES:
+                stock = stock.where(PharmacyInventory.pharmacy_id.in_(list(distances)))
+            stock = stock.subquery()
 
             result = await db.execute(
-                select(
-                    Pharmacy,
-                    distance_formula
-                ).
-                where(
-                    Pharmacy.id != expired_request.pharmacy_id,
-                    Pharmacy.is_active == True,
-                    Pharmacy.is_verified == True,
-                    Pharmacy.latitude.is_not(None),
-                    Pharmacy.longitude.is_not(None)
-                ).
-                order_by(distance_formula).
-                limit(limit)
+                select(Pharmacy, stock.c.price)
+                .join(stock, stock.c.pharmacy_id == Pharmacy.id)
+                .where(Pharmacy.is_active == True)
             )
+            stocked = [(pharmacy, price) for pharmacy, price in result.all() if pharmacy.id in distances]
+            stocked.sort(key=lambda item: (distances[item[0].id], item[0].id))
 
             alternatives = []
-            for pharmacy, distance in result.all():
-                if distance <= max_distance_km:
-                    alternatives.append({
-                        "id": pharmacy.id,
-                        "name": pharmacy.name,
-                        "address": pharmacy.address,
-                        "city": pharmacy.city,
-                        "phone": pharmacy.phone,
-                        "distance_km": float(distance),
-                        "latitude": float(pharmacy.latitude) if pharmacy.latitude else None,
-                        "longitude": float(pharmacy.longitude) if pharmacy.longitude else None
-                    })
+            for pharmacy, price in stocked[:limit]:
+                alternatives.append({
+                    "id": pharmacy.id,
+                    "name": pharmacy.name,
+                    "address": pharmacy.address,
+                    "city": pharmacy.city,
+                    "phone": pharmacy.phone,
+                    "distance_km": round(distances[pharmacy.id], 2),
+                    "latitude": float(pharmacy.latitude) if pharmacy.latitude else None,
+                    "longitude": float(pharmacy.longitude) if pharmacy.longitude else None,
+                    "price": float(price) if price is not None else None
+                })
 
             logger.info(f"Found {len(alternatives)} alternative pharmacies for prescription {expired_request.id}")
             return alternatives
@@ -14,6 +14,12 @@ class Settings(BaseSettings):
     # Security
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Password hashing (bcrypt cost factor; existing hashes are upgraded on login)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+    PASSWORD_HASH_WAIT_SECONDS: float = 2.0
     
     # CORS
     CORS_ORIGINS: List[str] = [
@@ -38,15 +44,80 @@ class Settings(BaseSettings):
     PAYPAL_CLIENT_SECRET: Optional[str] = None
     PAYPAL_MODE: str = "sandbox"
 
+    # Uploads: files larger than this are rejected while streaming; multipart
+    # requests whose Content-Length already exceeds it are refused unread
+    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024
+
+    # Prescription image derivatives (longest side in pixels), rendered on a process pool
+    PRESCRIPTION_THUMBNAIL_SIZE: int = 320
+    PRESCRIPTION_PREVIEW_SIZE: int = 1600
+    PRESCRIPTION_IMAGE_WORKERS: int = 1
+    # Pending uploads still without derivatives past the grace period are re-rendered periodically
+    PRESCRIPTION_IMAGE_RERENDER_SECONDS: int = 600
+    PRESCRIPTION_IMAGE_RERENDER_GRACE_SECONDS: int = 300
+    PRESCRIPTION_IMAGE_RERENDER_BATCH: int = 50
+
+    # Content-addressed prescription files: unreferenced files are deleted by a periodic
+    # sweep once untouched for the grace period (which covers uploads not yet committed)
+    PRESCRIPTION_GC_INTERVAL_SECONDS: int = 3600
+    PRESCRIPTION_GC_GRACE_SECONDS: int = 3600
+
+    # Validation timeouts fire from an in-memory timer heap; this periodic database scan
+    # only catches requests it missed (e.g. created by another process)
+    PRESCRIPTION_TIMEOUT_RECONCILE_SECONDS: int = 300
+    PRESCRIPTION_EXPIRY_CHUNK_SIZE: int = 500
+
+    # Periodic jobs run in the one worker holding their lease (a system_config row)
+    JOB_LEASE_SECONDS: int = 30
+    JOB_LEASE_RENEW_SECONDS: int = 10
+
     # AWS S3
     AWS_ACCESS_KEY_ID: Optional[str] = None
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_S3_BUCKET: Optional[str] = None
     AWS_S3_REGION: str = "eu-west-1"
 
+    # Object storage of order prescription images: "local" (files under OBJECT_STORAGE_DIR,
+    # served by signed /storage URLs) or "s3" (AWS_S3_BUCKET, presigned URLs)
+    OBJECT_STORAGE_BACKEND: str = "local"
+    OBJECT_STORAGE_DIR: str = "uploads/objects"
+    OBJECT_STORAGE_URL_EXPIRES_SECONDS: int = 900
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024
+    S3_MULTIPART_CONCURRENCY: int = 4
+    S3_MAX_POOL_CONNECTIONS: int = 10
+
     # Google Maps
     GOOGLE_MAPS_API_KEY: Optional[str] = None
 
+    # Google Vision OCR (VISION_API_URL can point at a local fake server)
+    GOOGLE_VISION_API_KEY: Optional[str] = None
+    VISION_API_URL: str = "https://vision.googleapis.com/v1/images:annotate"
+    VISION_MAX_CONCURRENCY: int = 4
+    VISION_TIMEOUT_SECONDS: float = 15.0  # Whole call: queueing, image preparation and request
+    VISION_MAX_IMAGE_DIMENSION: int = 1600
+    VISION_JPEG_QUALITY: int = 85
+
+    # OCR result cache: "sha256" (exact image bytes) or "dhash" (perceptual, survives re-encoding)
+    VISION_CACHE_KEY: str = "sha256"
+    VISION_CACHE_SIZE: int = 2048
+    VISION_CACHE_DIR: Optional[str] = None  # Enables the disk tier
+    VISION_CACHE_DISK_MAX_ENTRIES: int = 50000
+
+    # In-memory pharmacy spatial index refresh interval (picks up other workers' changes)
+    PHARMACY_INDEX_TTL_SECONDS: int = 300
+
+    # In-memory product indexes (suggestions, packaging matching) reload interval, same purpose
+    PRODUCT_INDEX_TTL_SECONDS: int = 300
+
+    # Authenticated user cache (per process); bounds how long other workers see stale users
+    CURRENT_USER_CACHE_TTL_SECONDS: int = 30
+    CURRENT_USER_CACHE_SIZE: int = 1024
+
+    # Unread notification counts (per process cache; the counters are reconciled periodically)
+    NOTIFICATION_COUNT_CACHE_TTL_SECONDS: int = 10
+    NOTIFICATION_COUNT_CACHE_SIZE: int = 4096
+    NOTIFICATION_COUNT_RECONCILE_SECONDS: int = 3600
+
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
 
@@ -55,7 +126,22 @@ class Settings(BaseSettings):
     SMTP_PORT: int = 587
     SMTP_USER: Optional[str] = None
     SMTP_PASSWORD: Optional[str] = None
-    
+    SMTP_USE_TLS: bool = True  # STARTTLS; disable for a local test SMTP server
+    SMTP_TIMEOUT_SECONDS: float = 10.0
+    EMAIL_FROM: str = "noreply@pharmafinder.com"
+    # "smtp" delivers through SMTP_HOST, "log" only logs queued messages (development)
+    EMAIL_BACKEND: str = "log"
+
+    # Outbound email queue (app.services.email_queue)
+    EMAIL_QUEUE_BATCH_SIZE: int = 50
+    EMAIL_QUEUE_POLL_SECONDS: float = 5.0
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = 6
+    EMAIL_RETRY_BASE_SECONDS: float = 30.0
+    EMAIL_RETRY_MAX_SECONDS: float = 3600.0
+    EMAIL_QUEUE_CLAIM_TIMEOUT_SECONDS: int = 300  # Reclaim batches of a crashed worker
+    SMTP_POOL_SIZE: int = 2
+    SMTP_IDLE_SECONDS: float = 60.0  # Reconnect instead of reusing older idle connections
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -1,39 +1,60 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, text, Integer
+from sqlalchemy import select, func, and_, or_
 from sqlalchemy.orm import selectinload
 from uuid import UUID, uuid4
 from datetime import datetime, date
+from decimal import Decimal
 import random
 import string
-import unicodedata
 
 from app.models import (
     User, Pharmacy, Product, Category, PharmacyInventory, 
     Order, OrderItem, ClientAddress, Payment, Review, 
-    Notification, SystemConfig, UserRole, OrderStatus
+    Notification, SystemConfig, UserRole, OrderStatus, ProductOfferSummary
 )
 from app.schemas import (
     UserCreate, PharmacyCreate, ProductCreate, PharmacyInventoryCreate,
     OrderCreate, ClientAddressCreate, PaymentCreate, ReviewCreate
 )
-from app.auth import get_password_hash
+from app.auth import hash_password
+from app.pagination import (
+    encode_cursor, encode_sort_cursor, decode_cursor, decode_decimal, decode_sort_cursor,
+    decode_timestamp, keyset_filter, paginate, stored_value, timestamp_cursor, timestamp_keyset
+)
+from app.search_index import normalize_search_text, search_subquery
+from app.services.pharmacy_locator import pharmacy_locator
+from app.services.product_suggest import product_suggester
+from app.services.product_matcher import product_matcher
 
 
 def normalize_search_query(query: str) -> str:
     """Normalize search query by removing accents and converting to lowercase"""
-    if not query:
-        return ""
-    # Remove accents and normalize unicode
-    normalized = unicodedata.normalize('NFD', query)
-    ascii_text = normalized.encode('ascii', 'ignore').decode('ascii')
-    return ascii_text.lower().strip()
+    return normalize_search_text(query)
+
+
+def _legacy_search_filter(query: str):
+    """ILIKE fallback for databases without a product search index"""
+    normalized_query = normalize_search_query(query)
+    return or_(
+        # Original query search (exact match including accents)
+        Product.name.ilike(f"%{query}%"),
+        Product.generic_name.ilike(f"%{query}%"),
+        Product.active_ingredient.ilike(f"%{query}%"),
+        # Normalized query search (accent-insensitive)
+        func.lower(func.replace(func.replace(func.replace(
+            Product.name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
+        func.lower(func.replace(func.replace(func.replace(
+            Product.generic_name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
+        func.lower(func.replace(func.replace(func.replace(
+            Product.active_ingredient, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%")
+    )
 
 
 # User CRUD operations
 async def create_user(db: AsyncSession, user: UserCreate) -> User:
     """Create a new user"""
-    password_hash = get_password_hash(user.password)
+    password_hash = await hash_password(user.password)
     db_user = User(
         email=user.email,
         password_hash=password_hash,
@@ -70,6 +91,7 @@ async def create_pharmacy(db: AsyncSession, pharmacy: PharmacyCreate, owner_id:
     db.add(db_pharmacy)
     await db.commit()
     await db.refresh(db_pharmacy)
+    await pharmacy_locator.rebuild(db)
     return db_pharmacy
 
 
@@ -86,14 +108,26 @@ async def get_pharmacy(db: AsyncSession, pharmacy_id: UUID) -> Optional[Pharmacy
         return None
 
 
-async def get_pharmacies(db: AsyncSession, skip: int = 0, limit: int = 100, verified_only: bool = False) -> List[Pharmacy]:
-    """Get list of pharmacies"""
+async def get_pharmacies(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: int = 100,
+    verified_only: bool = False,
+    cursor: Optional[str] = None
+) -> Tuple[List[Pharmacy], Optional[str]]:
+    """Get list of pharmacies, oldest first, and the cursor of the next page"""
     query = select(Pharmacy).options(selectinload(Pharmacy.owner))
     if verified_only:
         query = query.where(Pharmacy.is_verified == True)
-    query = query.offset(skip).limit(limit)
+
+    after = timestamp_keyset(Pharmacy, Pharmacy.created_at, cursor, descending=False)
+    query = query.where(after) if after is not None else query.offset(skip)
+    query = query.order_by(Pharmacy.created_at, Pharmacy.id).limit(limit + 1)
     result = await db.execute(query)
-    return result.scalars().all()
+    return paginate(
+        result.scalars().all(), limit,
+        lambda pharmacy: timestamp_cursor(pharmacy.created_at, pharmacy.id)
+    )
 
 
 async def search_pharmacies_by_location(
@@ -102,29 +136,33 @@ async def search_pharmacies_by_location(
     longitude: float, 
     max_distance: float = 10.0,
     limit: int = 20
-) -> List[Pharmacy]:
-    """Search pharmacies by geographic location using Haversine formula"""
-    # Haversine formula in SQL
-    distance_query = text(f"""
-        SELECT *, (
-            6371 * acos(
-                cos(radians({latitude})) * 
-                cos(radians(latitude)) * 
-                cos(radians(longitude) - radians({longitude})) + 
-                sin(radians({latitude})) * 
-                sin(radians(latitude))
+) -> List[Tuple[Pharmacy, float]]:
+    """Search pharmacies by geographic location, nearest first.
+
+    Distances come from the in-memory pharmacy spatial index; the database is
+    only queried for the rows of the matching pharmacies.
+    """
+    index = await pharmacy_locator.get_index(db)
+    matches = index.within_radius(latitude, longitude, max_distance)[:limit]
+    if not matches:
+        return []
+
+    result = await db.execute(
+        select(Pharmacy).where(
+            and_(
+                Pharmacy.id.in_([pharmacy_id for pharmacy_id, _ in matches]),
+                Pharmacy.is_active == True,
+                Pharmacy.is_verified == True
             )
-        ) AS distance
-        FROM pharmacies 
-        WHERE is_active = true AND is_verified = true
-        AND latitude IS NOT NULL AND longitude IS NOT NULL
-        HAVING distance < {max_distance}
-        ORDER BY distance
-        LIMIT {limit}
-    """)
-    
-    result = await db.execute(distance_query)
-    return result.fetchall()
+        )
+    )
+    pharmacies = {pharmacy.id: pharmacy for pharmacy in result.scalars().all()}
+
+    return [
+        (pharmacies[pharmacy_id], distance)
+        for pharmacy_id, distance in matches
+        if pharmacy_id in pharmacies
+    ]
 
 
 # Product CRUD operations
@@ -134,6 +172,8 @@ async def create_product(db: AsyncSession, product: ProductCreate) -> Product:
     db.add(db_product)
     await db.commit()
     await db.refresh(db_product)
+    product_suggester.refresh_product(db_product)
+    product_matcher.refresh_product(db_product)
     return db_product
 
 
@@ -142,7 +182,7 @@ async def get_product(db: AsyncSession, product_id: UUID) -> Optional[Product]:
     result = await db.execute(
         select(Product)
         .options(selectinload(Product.category))
-        .where(Product.id == product_id)
+        .where(Product.id == str(product_id))
     )
     return result.scalar_one_or_none()
 
@@ -153,65 +193,88 @@ async def search_products(
     category_id: Optional[UUID] = None,
     requires_prescription: Optional[bool] = None,
     skip: int = 0,
-    limit: int = 20
-) -> List[Product]:
-    """Search products with filters and sponsored priority"""
-    from sqlalchemy.orm import joinedload
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Tuple[List[Product], Optional[str]]:
+    """Search products with filters and sponsored priority.
+
+    Pages are selected with skip, or with the cursor returned for the previous
+    page (which takes precedence). Returns the products and the next cursor.
+    """
     from sqlalchemy.sql import func, case
 
     # Join with PharmacyInventory to get sponsored info
+    sponsor_rank = func.coalesce(
+        func.max(
+            case(
+                (PharmacyInventory.is_sponsored == True, PharmacyInventory.sponsor_rank),
+                else_=0
+            )
+        ),
+        0
+    )
+    ranked = search_subquery(db.bind.dialect.name, query) if query else None
+    relevance = func.min(ranked.c.rank) if ranked is not None else None
+
     db_query = (
-        select(Product)
+        select(Product, sponsor_rank, *([relevance] if relevance is not None else []))
         .options(selectinload(Product.category))
         .outerjoin(PharmacyInventory, Product.id == PharmacyInventory.product_id)
         .where(Product.is_active == True)
     )
 
-    if query:
-        # Normalize the search query to handle accents
-        normalized_query = normalize_search_query(query)
-        search_filter = or_(
-            # Original query search (exact match including accents)
-            Product.name.ilike(f"%{query}%"),
-            Product.generic_name.ilike(f"%{query}%"),
-            Product.active_ingredient.ilike(f"%{query}%"),
-            # Normalized query search (accent-insensitive)
-            func.lower(func.replace(func.replace(func.replace(
-                Product.name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
-            func.lower(func.replace(func.replace(func.replace(
-                Product.generic_name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
-            func.lower(func.replace(func.replace(func.replace(
-                Product.active_ingredient, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%")
-        )
-        db_query = db_query.where(search_filter)
+    # Relevance-ranked matches from the search index (legacy ILIKE scan without one)
+    if ranked is not None:
+        db_query = db_query.join(ranked, ranked.c.product_id == Product.id)
+    elif query:
+        db_query = db_query.where(_legacy_search_filter(query))
     
     if category_id:
         db_query = db_query.where(Product.category_id == category_id)
     
     if requires_prescription is not None:
         db_query = db_query.where(Product.requires_prescription == requires_prescription)
+
+    # Keyset on (sponsor rank, relevance, created_at, id), the ordering below
+    after = decode_cursor(cursor, 4)
+    if after:
+        created_at = stored_value(Product, Product.created_at, after[3], decode_timestamp(after[2]))
+        db_query = db_query.group_by(Product.id).having(keyset_filter([
+            (sponsor_rank, after[0], True),
+            *([(relevance, after[1], False)] if relevance is not None else []),
+            (Product.created_at, created_at, True),
+            (Product.id, after[3], True),
+        ]))
+    else:
+        db_query = db_query.group_by(Product.id).offset(skip)
     
     # Group by product to avoid duplicates and order by sponsoring status
     db_query = (
         db_query
-        .group_by(Product.id)
         .order_by(
             # Sponsored products first, ordered by sponsor_rank descending
-            func.max(
-                case(
-                    (PharmacyInventory.is_sponsored == True, PharmacyInventory.sponsor_rank),
-                    else_=0
-                )
-            ).desc(),
+            sponsor_rank.desc(),
+            # Then by relevance to the search query
+            *([relevance] if relevance is not None else []),
             # Then by creation date (newest first)
-            Product.created_at.desc()
+            Product.created_at.desc(),
+            Product.id.desc()
         )
-        .offset(skip)
-        .limit(limit)
+        .limit(limit + 1)
     )
     
     result = await db.execute(db_query)
-    return result.scalars().all()
+    rows, next_cursor = paginate(
+        result.all(),
+        limit,
+        lambda row: encode_cursor([
+            row[1],
+            row[2] if relevance is not None else None,
+            row[0].created_at,
+            row[0].id
+        ])
+    )
+    return [row[0] for row in rows], next_cursor
 
 
 async def search_products_with_pharmacy_info(
@@ -226,70 +289,29 @@ async def search_products_with_pharmacy_info(
     from sqlalchemy.orm import joinedload
     from sqlalchemy.sql import func
     
-    # Select products with their best pharmacy offers (lowest price, highest sponsoring)
-    # Also get the pharmacy info for sponsored products
-    subquery = (
-        select(
-            PharmacyInventory.product_id,
-            func.min(PharmacyInventory.price).label('min_price'),
-            func.max(PharmacyInventory.sponsor_rank).label('max_sponsor_rank'),
-            func.max(PharmacyInventory.is_sponsored.cast(Integer)).label('has_sponsored')
-        )
-        .where(PharmacyInventory.quantity > 0)
-        .group_by(PharmacyInventory.product_id)
-        .subquery()
-    )
-
-    # Get the pharmacy for sponsored products
-    sponsored_pharmacy_subquery = (
-        select(
-            PharmacyInventory.product_id,
-            PharmacyInventory.pharmacy_id,
-            Pharmacy.name.label('pharmacy_name')
-        )
-        .join(Pharmacy, PharmacyInventory.pharmacy_id == Pharmacy.id)
-        .where(
-            and_(
-                PharmacyInventory.quantity > 0,
-                PharmacyInventory.is_sponsored == True
-            )
-        )
-        .order_by(PharmacyInventory.sponsor_rank.desc())
-        .subquery()
-    )
-    
+    # Best offers and sponsoring come from the maintained per-product summary
+    # (one row per product), with the sponsored pharmacy's name
     db_query = (
         select(
             Product,
-            subquery.c.min_price,
-            subquery.c.max_sponsor_rank,
-            subquery.c.has_sponsored,
-            sponsored_pharmacy_subquery.c.pharmacy_id,
-            sponsored_pharmacy_subquery.c.pharmacy_name
+            ProductOfferSummary.min_price,
+            ProductOfferSummary.max_sponsor_rank,
+            ProductOfferSummary.has_sponsored,
+            Pharmacy.id,
+            Pharmacy.name
         )
         .options(selectinload(Product.category))
-        .outerjoin(subquery, Product.id == subquery.c.product_id)
-        .outerjoin(sponsored_pharmacy_subquery, Product.id == sponsored_pharmacy_subquery.c.product_id)
+        .outerjoin(ProductOfferSummary, Product.id == ProductOfferSummary.product_id)
+        .outerjoin(Pharmacy, ProductOfferSummary.sponsored_pharmacy_id == Pharmacy.id)
         .where(Product.is_active == True)
     )
     
-    if query:
-        # Normalize the search query to handle accents
-        normalized_query = normalize_search_query(query)
-        search_filter = or_(
-            # Original query search (exact match including accents)
-            Product.name.ilike(f"%{query}%"),
-            Product.generic_name.ilike(f"%{query}%"),
-            Product.active_ingredient.ilike(f"%{query}%"),
-            # Normalized query search (accent-insensitive)
-            func.lower(func.replace(func.replace(func.replace(
-                Product.name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
-            func.lower(func.replace(func.replace(func.replace(
-                Product.generic_name, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%"),
-            func.lower(func.replace(func.replace(func.replace(
-                Product.active_ingredient, 'é', 'e'), 'è', 'e'), 'à', 'a')).like(f"%{normalized_query}%")
-        )
-        db_query = db_query.where(search_filter)
+    # Relevance-ranked matches from the search index (legacy ILIKE scan without one)
+    ranked = search_subquery(db.bind.dialect.name, query) if query else None
+    if ranked is not None:
+        db_query = db_query.join(ranked, ranked.c.product_id == Product.id)
+    elif query:
+        db_query = db_query.where(_legacy_search_filter(query))
 
     if category_id:
         db_query = db_query.where(Product.category_id == category_id)
@@ -301,10 +323,12 @@ async def search_products_with_pharmacy_info(
     db_query = (
         db_query
         .order_by(
-            subquery.c.has_sponsored.desc().nullslast(),
-            subquery.c.max_sponsor_rank.desc().nullslast(),
-            subquery.c.min_price.asc().nullslast(),
-            Product.created_at.desc()
+            ProductOfferSummary.has_sponsored.desc().nullslast(),
+            ProductOfferSummary.max_sponsor_rank.desc().nullslast(),
+            *([ranked.c.rank.asc()] if ranked is not None else []),
+            ProductOfferSummary.min_price.asc().nullslast(),
+            Product.created_at.desc(),
+            Product.id
         )
         .offset(skip)
         .limit(limit)
@@ -312,11 +336,10 @@ async def search_products_with_pharmacy_info(
     
     result = await db.execute(db_query)
     rows = result.all()
-    
+
     # Format results with sponsoring info
     products_with_info = []
-    for row in rows:
-        product, min_price, max_sponsor_rank, has_sponsored, pharmacy_id, pharmacy_name = row
+    for product, min_price, max_sponsor_rank, has_sponsored, pharmacy_id, pharmacy_name in rows:
         product_dict = {
             "id": str(product.id),
             "name": product.name,
@@ -379,33 +402,112 @@ async def create_inventory(db: AsyncSession, inventory: PharmacyInventoryCreate)
         return db_inventory
 
 
+AVAILABILITY_SORTS = ("distance", "price", "score")
+NUMBER = (int, float)
+
+
 async def get_product_availability(
     db: AsyncSession,
     product_id: UUID,
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
-    max_distance: Optional[float] = None
-) -> List[PharmacyInventory]:
-    """Get product availability across pharmacies"""
+    max_distance: Optional[float] = None,
+    sort_by: str = "distance",
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Tuple[List[Tuple[PharmacyInventory, Pharmacy, Optional[float]]], Optional[str]]:
+    """Get product availability across pharmacies, one page at a time.
+
+    Without a location, results are sorted by price and paginated by keyset in
+    SQL. With a location, pharmacies are restricted to max_distance through the
+    pharmacy spatial index and sorted by distance, price (then distance) or
+    score, where score = price / cheapest price + distance / max_distance
+    (lower is better). The score depends on every matching row, so this mode
+    loads the pharmacies in the radius that stock the product and paginates in
+    memory; cursors carry their sort mode and are rejected by the other modes.
+
+    Returns (inventory, pharmacy, distance_km) rows and the cursor of the next page.
+    """
     query = (
-        select(PharmacyInventory)
-        .options(
-            selectinload(PharmacyInventory.pharmacy),
-            selectinload(PharmacyInventory.product)
-        )
-        .join(Pharmacy)
+        select(PharmacyInventory, Pharmacy)
+        .join(Pharmacy, PharmacyInventory.pharmacy_id == Pharmacy.id)
         .where(
             and_(
-                PharmacyInventory.product_id == product_id,
+                PharmacyInventory.product_id == str(product_id),
                 PharmacyInventory.quantity > 0,
                 Pharmacy.is_active == True,
                 Pharmacy.is_verified == True
             )
         )
     )
-    
+
+    if latitude is None or longitude is None:
+        after = decode_sort_cursor(cursor, "price", (str, str))
+        if after:
+            after_price, after_pharmacy_id = decode_decimal(after[0]), after[1]
+            query = query.where(
+                or_(
+                    PharmacyInventory.price > after_price,
+                    and_(PharmacyInventory.price == after_price, PharmacyInventory.pharmacy_id > after_pharmacy_id)
+                )
+            )
+        query = query.order_by(PharmacyInventory.price, PharmacyInventory.pharmacy_id).limit(limit + 1)
+        result = await db.execute(query)
+        return paginate(
+            [(inventory, pharmacy, None) for inventory, pharmacy in result.all()],
+            limit,
+            lambda row: encode_sort_cursor("price", [str(row[0].price), row[0].pharmacy_id])
+        )
+
+    mode = f"nearby-{sort_by}"
+    key_types = (NUMBER, NUMBER, str) if sort_by == "price" else (NUMBER, str)
+    after = decode_sort_cursor(cursor, mode, key_types)
+
+    index = await pharmacy_locator.get_index(db)
+    if max_distance is not None:
+        distances = dict(index.within_radius(latitude, longitude, max_distance))
+        if not distances:
+            return [], None
+        query = query.where(Pharmacy.id.in_(list(distances)))
     result = await db.execute(query)
-    return result.scalars().all()
+
+    rows = []
+    for inventory, pharmacy in result.all():
+        if max_distance is not None:
+            distance = distances[pharmacy.id]
+        else:
+            # Pharmacies without coordinates are not indexed and sort last
+            distance = index.distance_to(pharmacy.id, latitude, longitude)
+        rows.append((inventory, pharmacy, distance))
+
+    if not rows:
+        return [], None
+
+    far_away = float("inf")
+    known_distances = [distance for _, _, distance in rows if distance is not None]
+    distance_scale = max_distance or (max(known_distances) if known_distances else 0) or 1.0
+    cheapest = min(float(inventory.price) for inventory, _, _ in rows) or 1.0
+
+    def sort_key(row) -> list:
+        inventory, pharmacy, distance = row
+        distance = far_away if distance is None else round(distance, 6)
+        price = float(inventory.price)
+        if sort_by == "price":
+            return [price, distance, pharmacy.id]
+        if sort_by == "score":
+            return [round(price / cheapest + distance / distance_scale, 6), pharmacy.id]
+        return [distance, pharmacy.id]
+
+    keyed_rows = sorted(((sort_key(row), row) for row in rows), key=lambda keyed: keyed[0])
+    if after:
+        keyed_rows = [keyed for keyed in keyed_rows if keyed[0] > after]
+
+    next_cursor = None
+    if len(keyed_rows) > limit:
+        keyed_rows = keyed_rows[:limit]
+        next_cursor = encode_sort_cursor(mode, keyed_rows[-1][0])
+
+    return [row for _, row in keyed_rows], next_cursor
 
 
 # Order CRUD operations
@@ -497,24 +599,43 @@ async def get_order(db: AsyncSession, order_id: UUID) -> Optional[Order]:
     return result.scalar_one_or_none()
 
 
-async def get_user_orders(db: AsyncSession, user_id: UUID, skip: int = 0, limit: int = 20) -> List[Order]:
-    """Get orders for a specific user"""
-    result = await db.execute(
+async def get_user_orders(
+    db: AsyncSession,
+    user_id: UUID,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Tuple[List[Order], Optional[str]]:
+    """Get orders for a specific user, newest first, and the cursor of the next page"""
+    query = (
         select(Order)
         .options(
             selectinload(Order.pharmacy),
             selectinload(Order.items).selectinload(OrderItem.product)
         )
         .where(Order.client_id == user_id)
-        .order_by(Order.created_at.desc())
-        .offset(skip)
-        .limit(limit)
     )
-    return result.scalars().all()
+
+    after = timestamp_keyset(Order, Order.created_at, cursor)
+    query = query.where(after) if after is not None else query.offset(skip)
+    result = await db.execute(
+        query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+    )
+    return paginate(
+        result.scalars().all(), limit,
+        lambda order: timestamp_cursor(order.created_at, order.id)
+    )
 
 
-async def get_pharmacy_orders(db: AsyncSession, pharmacy_id: UUID, status: Optional[OrderStatus] = None, skip: int = 0, limit: int = 20) -> List[Order]:
-    """Get orders for a specific pharmacy"""
+async def get_pharmacy_orders(
+    db: AsyncSession,
+    pharmacy_id: UUID,
+    status: Optional[OrderStatus] = None,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Tuple[List[Order], Optional[str]]:
+    """Get orders for a specific pharmacy, newest first, and the cursor of the next page"""
     query = (
         select(Order)
         .options(
@@ -527,10 +648,15 @@ async def get_pharmacy_orders(db: AsyncSession, pharmacy_id: UUID, status: Optio
     
     if status:
         query = query.where(Order.status == status)
-    
-    query = query.order_by(Order.created_at.desc()).offset(skip).limit(limit)
+
+    after = timestamp_keyset(Order, Order.created_at, cursor)
+    query = query.where(after) if after is not None else query.offset(skip)
+    query = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
     result = await db.execute(query)
-    return result.scalars().all()
+    return paginate(
+        result.scalars().all(), limit,
+        lambda order: timestamp_cursor(order.created_at, order.id)
+    )
 
 
 async def update_order_status(db: AsyncSession, order_id: UUID, status: OrderStatus) -> Optional[Order]:
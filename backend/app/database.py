@@ -31,6 +31,15 @@ async def get_db():
             await session.close()
 
 
+def dialect_insert(dialect_name: str):
+    """INSERT construct of the dialect, for ON CONFLICT upserts"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
 def get_sync_db():
     """Get sync database session for migrations"""
     db = SyncSessionLocal()
@@ -0,0 +1,256 @@
+"""
+Precompiled HTML email templates.
+
+Each email layout is compiled once into static fragments and named slots. The
+shared header and footer, the platform details and the footer year are
+substituted at compile time, so rendering an email only joins the cached
+static fragments with the per-order values. Templates are recompiled when the
+year changes.
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SLOT_PATTERN = re.compile(r"\{\{\s*([A-Za-z_]\w*)\s*\}\}")
+
+
+class CompiledTemplate:
+    """Template source split once into static fragments around its slots"""
+
+    def __init__(self, source: str, constants: Optional[Dict[str, object]] = None):
+        constants = constants or {}
+        self.fragments: List[str] = []
+        self.slots: List[str] = []
+
+        static = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(source):
+            static.append(source[position:match.start()])
+            name = match.group(1)
+            if name in constants:
+                static.append(str(constants[name]))
+            else:
+                self.fragments.append("".join(static))
+                self.slots.append(name)
+                static = []
+            position = match.end()
+        static.append(source[position:])
+        self.fragments.append("".join(static))
+
+        # (slot, static fragment that follows it) pairs, walked by render()
+        self._parts = list(zip(self.slots, self.fragments[1:]))
+
+    def render(self, **values: object) -> str:
+        """Fill the slots (a KeyError names a missing one); values are inserted as-is, not escaped"""
+        parts = [self.fragments[0]]
+        for slot, fragment in self._parts:
+            parts.append(str(values[slot]))
+            parts.append(fragment)
+        return "".join(parts)
+
+
+HEADER = """
+        <div style="max-width: 600px; margin: 0 auto; font-family: Arial, sans-serif;">
+            <header style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center; color: white;">
+                <h1 style="margin: 0; font-size: 28px; font-weight: bold;">
+                    💊 {{ platform_name }}
+                </h1>
+                <p style="margin: 5px 0 0 0; font-size: 14px; opacity: 0.9;">
+                    Votre pharmacie en ligne de confiance
+                </p>
+            </header>
+        """
+
+FOOTER = """
+            <footer style="background-color: #f8f9fa; padding: 20px; margin-top: 30px; border-top: 1px solid #e9ecef;">
+                <div style="text-align: center; color: #6c757d; font-size: 14px;">
+                    <h3 style="color: #495057; margin-bottom: 15px;">{{ platform_name }}</h3>
+                    <p style="margin: 5px 0;">
+                        📧 Email: <a href="mailto:{{ platform_email }}" style="color: #667eea;">{{ platform_email }}</a>
+                    </p>
+                    <p style="margin: 5px 0;">
+                        📞 Téléphone: {{ platform_phone }}
+                    </p>
+                    <p style="margin: 5px 0;">
+                        📍 Adresse: {{ platform_address }}
+                    </p>
+                    <p style="margin: 15px 0 5px 0;">
+                        🌐 <a href="{{ platform_website }}" style="color: #667eea;">{{ platform_website }}</a>
+                    </p>
+                    <hr style="border: none; height: 1px; background-color: #e9ecef; margin: 20px 0;">
+                    <p style="font-size: 12px; color: #868e96;">
+                        © {{ year }} {{ platform_name }}. Tous droits réservés.<br>
+                        Cet email a été envoyé automatiquement, veuillez ne pas y répondre.
+                    </p>
+                </div>
+            </footer>
+        </div>
+        """
+
+ORDER_CONFIRMATION = """
+            <div style="padding: 20px;">
+                <h2 style="color: #28a745; margin-bottom: 20px;">
+                    🎉 Merci pour votre commande, {{ user_name }} !
+                </h2>
+
+                <p style="font-size: 16px; color: #495057; line-height: 1.6;">
+                    Votre commande a été reçue avec succès. Nous préparons vos médicaments
+                    et vous tiendrons informé de l'avancement.
+                </p>
+
+                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                    <h3 style="color: #495057; margin-top: 0;">📋 Récapitulatif de la commande</h3>
+                    <p><strong>Nombre de commandes:</strong> {{ orders_count }}</p>
+                    <p><strong>Nombre total d'articles:</strong> {{ total_items }}</p>
+                    <p><strong>Montant total:</strong> {{ total_amount }} FCFA</p>
+                    <p><strong>Date:</strong> {{ date }}</p>
+                </div>
+
+                <h3 style="color: #495057;">🏥 Détails par pharmacie</h3>
+            {{ orders }}
+                <div style="background-color: #d1ecf1; padding: 15px; border-radius: 8px; margin: 20px 0; border-left: 4px solid #17a2b8;">
+                    <h4 style="color: #0c5460; margin-top: 0;">📞 Prochaines étapes</h4>
+                    <ul style="color: #0c5460; padding-left: 20px;">
+                        <li>Vous recevrez un SMS/email de confirmation de préparation</li>
+                        <li>Pour les retraits: présentez-vous avec votre code de retrait</li>
+                        <li>Pour les livraisons: nous vous contacterons pour planifier</li>
+                        <li>En cas de question: contactez-nous au {{ platform_phone }}</li>
+                    </ul>
+                </div>
+
+                <p style="text-align: center; margin: 30px 0;">
+                    <a href="{{ platform_website }}/orders"
+                       style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                              color: white; padding: 12px 30px; text-decoration: none;
+                              border-radius: 25px; font-weight: bold; display: inline-block;">
+                        📱 Suivre mes commandes
+                    </a>
+                </p>
+            </div>
+            """
+
+CONFIRMATION_ORDER = """
+                <div style="border: 1px solid #e9ecef; border-radius: 8px; padding: 15px; margin: 15px 0;">
+                    <h4 style="color: #667eea; margin-top: 0;">
+                        Commande #{{ order_number }}
+                    </h4>
+                    <p><strong>Pharmacie:</strong> {{ pharmacy_name }}</p>
+                    <p><strong>Type:</strong> {{ delivery_type }}</p>
+                    <p><strong>Articles:</strong> {{ items_count }}</p>
+                    <p><strong>Total:</strong> {{ total_amount }} FCFA</p>
+                    {{ pickup_code }}
+                </div>
+                """
+
+PICKUP_CODE = """<p><strong>Code de retrait:</strong> <span style="font-family: monospace; background-color: #fff3cd; padding: 2px 6px; border-radius: 4px;">{{ pickup_code }}</span></p>"""
+
+ORDER_RECEIPT = """
+            <div style="padding: 20px;">
+                <h2 style="color: #495057; margin-bottom: 20px;">
+                    🧾 Reçu de commande
+                </h2>
+
+                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <tr>
+                            <td><strong>Client:</strong></td>
+                            <td>{{ user_name }}</td>
+                        </tr>
+                        <tr>
+                            <td><strong>Email:</strong></td>
+                            <td>{{ user_email }}</td>
+                        </tr>
+                        <tr>
+                            <td><strong>Date:</strong></td>
+                            <td>{{ date }}</td>
+                        </tr>
+                        <tr>
+                            <td><strong>Nombre de commandes:</strong></td>
+                            <td>{{ orders_count }}</td>
+                        </tr>
+                    </table>
+                </div>
+
+                <h3 style="color: #495057;">📦 Détail des articles</h3>
+            {{ orders }}
+                <div style="background-color: #d4edda; padding: 15px; border-radius: 8px; margin: 30px 0; text-align: center;">
+                    <h3 style="color: #155724; margin-top: 0;">💰 Total général: {{ total_amount }} FCFA</h3>
+                </div>
+
+                <p style="font-size: 14px; color: #6c757d; text-align: center; margin-top: 30px;">
+                    Ce reçu fait foi pour toute réclamation ou remboursement.<br>
+                    Conservez-le précieusement.
+                </p>
+            </div>
+            """
+
+RECEIPT_ORDER = """
+                <div style="border: 1px solid #e9ecef; border-radius: 8px; padding: 15px; margin: 15px 0;">
+                    <h4 style="color: #667eea; margin-top: 0;">
+                        {{ pharmacy_name }} - #{{ order_number }}
+                    </h4>
+                    <table style="width: 100%; border-collapse: collapse; margin-top: 10px;">
+                        <thead>
+                            <tr style="background-color: #f8f9fa;">
+                                <th style="padding: 8px; border-bottom: 1px solid #dee2e6; text-align: left;">Article</th>
+                                <th style="padding: 8px; border-bottom: 1px solid #dee2e6; text-align: center;">Qté</th>
+                                <th style="padding: 8px; border-bottom: 1px solid #dee2e6; text-align: right;">Prix</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                {{ items }}
+                        </tbody>
+                        <tfoot>
+                            <tr style="font-weight: bold; background-color: #e9ecef;">
+                                <td style="padding: 8px; border-top: 2px solid #dee2e6;">Sous-total</td>
+                                <td style="padding: 8px; border-top: 2px solid #dee2e6;"></td>
+                                <td style="padding: 8px; border-top: 2px solid #dee2e6; text-align: right;">{{ subtotal }} FCFA</td>
+                            </tr>
+                            <tr>
+                                <td style="padding: 8px;">Frais de livraison</td>
+                                <td style="padding: 8px;"></td>
+                                <td style="padding: 8px; text-align: right;">{{ delivery_fee }} FCFA</td>
+                            </tr>
+                            <tr style="font-weight: bold; font-size: 16px; background-color: #d4edda;">
+                                <td style="padding: 8px; border-top: 2px solid #c3e6cb;">Total</td>
+                                <td style="padding: 8px; border-top: 2px solid #c3e6cb;"></td>
+                                <td style="padding: 8px; border-top: 2px solid #c3e6cb; text-align: right;">{{ total_amount }} FCFA</td>
+                            </tr>
+                        </tfoot>
+                    </table>
+                </div>
+                """
+
+RECEIPT_ITEM = """
+                            <tr>
+                                <td style="padding: 8px; border-bottom: 1px solid #f8f9fa;">Médicament #{{ number }}</td>
+                                <td style="padding: 8px; border-bottom: 1px solid #f8f9fa; text-align: center;">1</td>
+                                <td style="padding: 8px; border-bottom: 1px solid #f8f9fa; text-align: right;">{{ price }} FCFA</td>
+                            </tr>
+                    """
+
+
+class EmailTemplates:
+    """The platform's compiled email templates"""
+
+    def __init__(self, platform: Dict[str, str]):
+        self.platform = platform
+        self.year: Optional[int] = None
+        self._compile(datetime.now().year)
+
+    def _compile(self, year: int):
+        constants = {**self.platform, "year": year}
+        self.order_confirmation = CompiledTemplate(HEADER + ORDER_CONFIRMATION + FOOTER, constants)
+        self.confirmation_order = CompiledTemplate(CONFIRMATION_ORDER, constants)
+        self.pickup_code = CompiledTemplate(PICKUP_CODE, constants)
+        self.order_receipt = CompiledTemplate(HEADER + ORDER_RECEIPT + FOOTER, constants)
+        self.receipt_order = CompiledTemplate(RECEIPT_ORDER, constants)
+        self.receipt_item = CompiledTemplate(RECEIPT_ITEM, constants)
+        self.year = year
+
+    def current(self) -> "EmailTemplates":
+        """The templates, recompiled first if the footer year is out of date"""
+        year = datetime.now().year
+        if year != self.year:
+            self._compile(year)
+        return self
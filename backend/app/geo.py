@@ -0,0 +1,39 @@
+"""
+Geographic helpers: Haversine distance and bounding boxes.
+
+Proximity searches go through the in-memory pharmacy spatial index
+(app.services.pharmacy_locator), which is built on these.
+"""
+import math
+from typing import Tuple
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+BoundingBox = Tuple[float, float, float, float]  # (min_lat, max_lat, min_lon, max_lon)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2 - lon1)
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    """Smallest lat/lon box containing every point within radius_km"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(latitude))
+    # Near the poles the longitude span covers the whole circle
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+
+    return (
+        max(-90.0, latitude - dlat),
+        min(90.0, latitude + dlat),
+        max(-180.0, longitude - dlon),
+        min(180.0, longitude + dlon)
+    )
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Migration 006: Add FTS5 product search index
+"""
+import os
+import sqlite3
+import sys
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from app.search_index import SEARCH_INDEX_TABLE, normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create the product search index virtual table and index existing products"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+                product_id UNINDEXED,
+                name,
+                generic_name,
+                active_ingredient,
+                tokenize = 'trigram'
+            )
+        """)
+
+        # (Re)index every active product
+        cursor.execute(f"DELETE FROM {SEARCH_INDEX_TABLE}")
+        cursor.execute("""
+            SELECT id, name, generic_name, active_ingredient FROM products
+            WHERE is_active = 1 OR is_active IS NULL
+        """)
+        rows = cursor.fetchall()
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_INDEX_TABLE} (product_id, name, generic_name, active_ingredient) "
+            f"VALUES (?, ?, ?, ?)",
+            [
+                (product_id, normalize_search_text(name), normalize_search_text(generic_name),
+                 normalize_search_text(active_ingredient))
+                for product_id, name, generic_name, active_ingredient in rows
+            ]
+        )
+        logger.info(f"Indexed {len(rows)} products")
+
+        conn.commit()
+        logger.info("✅ Migration 006 completed: Added product search index")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 006 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the product search index"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migration 007: Add product offer summary table
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create product_offer_summary and fill it from the current inventory"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_offer_summary (
+                product_id VARCHAR(36) NOT NULL PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+                min_price NUMERIC(10, 2),
+                max_price NUMERIC(10, 2),
+                in_stock_pharmacy_count INTEGER NOT NULL DEFAULT 0,
+                has_sponsored BOOLEAN NOT NULL DEFAULT 0,
+                max_sponsor_rank INTEGER NOT NULL DEFAULT 0,
+                sponsored_pharmacy_id VARCHAR(36) REFERENCES pharmacies(id) ON DELETE SET NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_product_offer_summary_ranking
+            ON product_offer_summary (has_sponsored, max_sponsor_rank, min_price)
+        """)
+
+        # Summarize in-stock inventory; the sponsored pharmacy is the highest
+        # ranked sponsored offer, then the cheapest
+        cursor.execute("DELETE FROM product_offer_summary")
+        cursor.execute("""
+            INSERT INTO product_offer_summary (
+                product_id, min_price, max_price, in_stock_pharmacy_count,
+                has_sponsored, max_sponsor_rank, sponsored_pharmacy_id, updated_at
+            )
+            SELECT
+                i.product_id,
+                MIN(i.price),
+                MAX(i.price),
+                COUNT(DISTINCT i.pharmacy_id),
+                MAX(CASE WHEN i.is_sponsored = 1 THEN 1 ELSE 0 END),
+                COALESCE(MAX(i.sponsor_rank), 0),
+                (
+                    SELECT s.pharmacy_id FROM pharmacy_inventory s
+                    WHERE s.product_id = i.product_id AND s.quantity > 0 AND s.is_sponsored = 1
+                    ORDER BY s.sponsor_rank DESC, s.price ASC, s.pharmacy_id ASC
+                    LIMIT 1
+                ),
+                CURRENT_TIMESTAMP
+            FROM pharmacy_inventory i
+            WHERE i.quantity > 0
+            GROUP BY i.product_id
+        """)
+        logger.info(f"Summarized offers of {cursor.rowcount} products")
+
+        conn.commit()
+        logger.info("✅ Migration 007 completed: Added product offer summary")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 007 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the product offer summary table"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS product_offer_summary")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
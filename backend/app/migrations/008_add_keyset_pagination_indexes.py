@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Migration 008: Add composite indexes for keyset pagination
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEXES = [
+    ("ix_pharmacies_created_at_id", "pharmacies", "created_at, id"),
+    ("ix_pharmacies_is_verified_created_at_id", "pharmacies", "is_verified, created_at, id"),
+    ("ix_pharmacy_inventory_pharmacy_id_product_id_id", "pharmacy_inventory", "pharmacy_id, product_id, id"),
+    ("ix_orders_client_id_created_at_id", "orders", "client_id, created_at, id"),
+    ("ix_orders_pharmacy_id_created_at_id", "orders", "pharmacy_id, created_at, id"),
+    ("ix_notifications_user_id_created_at_id", "notifications", "user_id, created_at, id"),
+]
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create the (filter, sort key, id) indexes used by cursor-paginated listings"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        for name, table, columns in INDEXES:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            logger.info(f"Created index {name}")
+
+        conn.commit()
+        logger.info("✅ Migration 008 completed: Added keyset pagination indexes")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 008 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the keyset pagination indexes"""
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, _, _ in INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Migration 009: Add outbound email queue table
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create the outbound_emails table drained by the email queue worker"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbound_emails (
+                id VARCHAR(36) NOT NULL PRIMARY KEY,
+                recipient VARCHAR(255) NOT NULL,
+                subject VARCHAR(255) NOT NULL,
+                html_body TEXT NOT NULL,
+                status VARCHAR(7) NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                claimed_by VARCHAR(36),
+                claimed_at DATETIME,
+                last_error TEXT,
+                sent_at DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_outbound_emails_status_next_attempt_at
+            ON outbound_emails (status, next_attempt_at)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_outbound_emails_claimed_by
+            ON outbound_emails (claimed_by)
+        """)
+
+        conn.commit()
+        logger.info("✅ Migration 009 completed: Added outbound email queue")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 009 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the outbound email queue table"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS outbound_emails")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration 010: Add prescription image derivative URLs
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Add thumbnail_url and preview_url to prescription_requests"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(prescription_requests)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        for column in ("thumbnail_url", "preview_url"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE prescription_requests ADD COLUMN {column} VARCHAR(500)")
+                logger.info(f"Added {column} column")
+
+        conn.commit()
+        logger.info("✅ Migration 010 completed: Added prescription image derivatives")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 010 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the derivative URL columns (SQLite 3.35+)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        for column in ("thumbnail_url", "preview_url"):
+            conn.execute(f"ALTER TABLE prescription_requests DROP COLUMN {column}")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
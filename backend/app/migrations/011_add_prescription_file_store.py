@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Migration 011: Add content-addressed prescription file references
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create prescription_files and index prescription_requests.prescription_image_url"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS prescription_files (
+                url VARCHAR(500) NOT NULL PRIMARY KEY,
+                sha256 VARCHAR(64) NOT NULL,
+                size INTEGER,
+                reference_count INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_prescription_files_sha256
+            ON prescription_files (sha256)
+        """)
+        # Reference recounts by the garbage collector
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_prescription_requests_prescription_image_url
+            ON prescription_requests (prescription_image_url)
+        """)
+
+        conn.commit()
+        logger.info("✅ Migration 011 completed: Added prescription file store")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 011 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the prescription file references"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP INDEX IF EXISTS ix_prescription_requests_prescription_image_url")
+        conn.execute("DROP TABLE IF EXISTS prescription_files")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Migration 012: Add partial index on pending prescription timeouts
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Index validation_timeout_at of pending prescription requests"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_prescription_requests_pending_timeout
+            ON prescription_requests (validation_timeout_at)
+            WHERE status = 'PENDING'
+        """)
+
+        conn.commit()
+        logger.info("✅ Migration 012 completed: Added pending timeout index")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 012 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the pending timeout index"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP INDEX IF EXISTS ix_prescription_requests_pending_timeout")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
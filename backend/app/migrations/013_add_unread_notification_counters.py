@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Migration 013: Add per-user unread notification counters
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Create and fill user_notification_counters, index unread notifications"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_notification_counters (
+                user_id VARCHAR(36) NOT NULL PRIMARY KEY,
+                unread_count INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO user_notification_counters (user_id, unread_count)
+            SELECT user_id, COUNT(*) FROM notifications
+            WHERE is_read = 0 AND user_id IS NOT NULL
+            GROUP BY user_id
+        """)
+        logger.info(f"Initialized unread counters for {cursor.rowcount} users")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS ix_notifications_user_id_is_read_created_at
+            ON notifications (user_id, is_read, created_at)
+        """)
+
+        conn.commit()
+        logger.info("✅ Migration 013 completed: Added unread notification counters")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 013 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the unread counters and their index"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("DROP INDEX IF EXISTS ix_notifications_user_id_is_read_created_at")
+        conn.execute("DROP TABLE IF EXISTS user_notification_counters")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Migration 014: Add the full-size prescription image derivative URL
+"""
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Add full_size_url to prescription_requests"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(prescription_requests)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if "full_size_url" not in columns:
+            cursor.execute("ALTER TABLE prescription_requests ADD COLUMN full_size_url VARCHAR(500)")
+            logger.info("Added full_size_url column")
+
+        conn.commit()
+        logger.info("✅ Migration 014 completed: Added full-size prescription image derivative")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 014 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the full-size derivative URL column (SQLite 3.35+)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("ALTER TABLE prescription_requests DROP COLUMN full_size_url")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Migration 015: Flag prescription uploads whose derivatives cannot be rendered,
+and render the derivatives of existing image uploads that have none
+"""
+import os
+import sqlite3
+import sys
+import logging
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from app.services.prescription_images import DERIVED_DIR, IMAGE_EXTENSIONS, render_derivatives
+
+logger = logging.getLogger(__name__)
+
+def upgrade(db_path: str = "pharmafinder.db"):
+    """Add derivatives_failed to prescription_requests and backfill the missing derivatives"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute("PRAGMA table_info(prescription_requests)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if "derivatives_failed" not in columns:
+            cursor.execute(
+                "ALTER TABLE prescription_requests ADD COLUMN derivatives_failed BOOLEAN NOT NULL DEFAULT 0"
+            )
+            logger.info("Added derivatives_failed column")
+
+        # Uploads from before the derivatives, or whose render was lost with a worker
+        cursor.execute("""
+            SELECT id, prescription_image_url FROM prescription_requests
+            WHERE preview_url IS NULL AND derivatives_failed = 0
+        """)
+        rendered = failed = 0
+        for prescription_request_id, url in cursor.fetchall():
+            source_path = url.lstrip("/")
+            stem, extension = os.path.splitext(os.path.basename(source_path))
+            if extension.lower() not in IMAGE_EXTENSIONS:
+                continue
+
+            filenames = render_derivatives(source_path, DERIVED_DIR, stem)
+            if filenames:
+                cursor.execute(
+                    "UPDATE prescription_requests SET thumbnail_url = ?, preview_url = ?, full_size_url = ? "
+                    "WHERE id = ?",
+                    (
+                        f"/{DERIVED_DIR}/{filenames['thumbnail']}",
+                        f"/{DERIVED_DIR}/{filenames['preview']}",
+                        f"/{DERIVED_DIR}/{filenames['full']}",
+                        prescription_request_id
+                    )
+                )
+                rendered += 1
+            else:
+                cursor.execute(
+                    "UPDATE prescription_requests SET derivatives_failed = 1 WHERE id = ?", (prescription_request_id,)
+                )
+                failed += 1
+        logger.info(f"Rendered derivatives of {rendered} prescription requests, {failed} could not be rendered")
+
+        conn.commit()
+        logger.info("✅ Migration 015 completed: Added prescription derivative failure flag")
+
+    except Exception as e:
+        logger.error(f"❌ Migration 015 failed: {str(e)}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def downgrade(db_path: str = "pharmafinder.db"):
+    """Drop the derivative failure flag (SQLite 3.35+); rendered derivatives are kept"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("ALTER TABLE prescription_requests DROP COLUMN derivatives_failed")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    upgrade()
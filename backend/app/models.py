@@ -1,7 +1,7 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, ForeignKey, Enum, Date, JSON, Numeric
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, ForeignKey, Enum, Date, JSON, Numeric, Index, event, inspect, text
 # For SQLite compatibility, we'll use String(36) instead of UUID
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, object_session
 from sqlalchemy.sql import func
 import uuid
 import enum
@@ -69,6 +69,19 @@ class User(Base):
     cart_items = relationship("CartItem", back_populates="user")
 
 
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """Drop the user from the current-user cache, now and once committed"""
+    from app.services.user_cache import current_user_cache, PENDING_INVALIDATIONS_KEY
+
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    current_user_cache.invalidate(*emails)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(PENDING_INVALIDATIONS_KEY, set()).update(emails)
+
+
 class Pharmacy(Base):
     __tablename__ = "pharmacies"
 
@@ -95,6 +108,12 @@ class Pharmacy(Base):
     orders = relationship("Order", back_populates="pharmacy")
     reviews = relationship("Review", back_populates="pharmacy")
 
+    __table_args__ = (
+        # Keyset pagination of the pharmacy list
+        Index("ix_pharmacies_created_at_id", "created_at", "id"),
+        Index("ix_pharmacies_is_verified_created_at_id", "is_verified", "created_at", "id"),
+    )
+
 
 class Category(Base):
     __tablename__ = "categories"
@@ -137,6 +156,33 @@ class Product(Base):
     order_items = relationship("OrderItem", back_populates="product")
 
 
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+def _index_product_for_search(mapper, connection, target):
+    """Keep the product search index in sync with product writes"""
+    from app.search_index import index_product
+
+    index_product(
+        connection, target.id, target.name, target.generic_name,
+        target.active_ingredient, target.is_active
+    )
+
+
+@event.listens_for(Product, "after_delete")
+def _unindex_product_for_search(mapper, connection, target):
+    from app.search_index import remove_product
+
+    remove_product(connection, target.id)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_product_search_index(target, connection, **kw):
+    """Create the search index alongside the tables (it is not a mapped table)"""
+    from app.search_index import create_search_index
+
+    create_search_index(connection)
+
+
 class PharmacyInventory(Base):
     __tablename__ = "pharmacy_inventory"
 
@@ -156,6 +202,45 @@ class PharmacyInventory(Base):
     pharmacy = relationship("Pharmacy", back_populates="inventory")
     product = relationship("Product", back_populates="inventory")
 
+    __table_args__ = (
+        # Keyset pagination of a pharmacy's inventory
+        Index("ix_pharmacy_inventory_pharmacy_id_product_id_id", "pharmacy_id", "product_id", "id"),
+    )
+
+
+class ProductOfferSummary(Base):
+    """Per-product aggregate of in-stock inventory, maintained on inventory writes"""
+    __tablename__ = "product_offer_summary"
+
+    product_id = Column(String(36), ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    min_price = Column(Numeric(10, 2))
+    max_price = Column(Numeric(10, 2))
+    in_stock_pharmacy_count = Column(Integer, nullable=False, default=0)
+    has_sponsored = Column(Boolean, nullable=False, default=False)
+    max_sponsor_rank = Column(Integer, nullable=False, default=0)
+    sponsored_pharmacy_id = Column(String(36), ForeignKey("pharmacies.id", ondelete="SET NULL"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Matches the enhanced search ordering (sponsored first, then cheapest)
+        Index("ix_product_offer_summary_ranking", has_sponsored, max_sponsor_rank, min_price),
+    )
+
+    # Relationships
+    sponsored_pharmacy = relationship("Pharmacy")
+
+
+@event.listens_for(PharmacyInventory, "after_insert")
+@event.listens_for(PharmacyInventory, "after_update")
+@event.listens_for(PharmacyInventory, "after_delete")
+def _refresh_product_offer_summary(mapper, connection, target):
+    """Keep the offer summaries of the product (and of a previous product) in sync with inventory writes"""
+    from app.offer_summary import refresh_offer_summary
+
+    product_ids = {target.product_id, *inspect(target).attrs.product_id.history.deleted}
+    for product_id in product_ids:
+        refresh_offer_summary(connection, product_id)
+
 
 class ClientAddress(Base):
     __tablename__ = "client_addresses"
@@ -218,6 +303,12 @@ class Order(Base):
     deliveries = relationship("Delivery", back_populates="order")
     reviews = relationship("Review", back_populates="order")
 
+    __table_args__ = (
+        # Keyset pagination of client and pharmacy order lists
+        Index("ix_orders_client_id_created_at_id", "client_id", "created_at", "id"),
+        Index("ix_orders_pharmacy_id_created_at_id", "pharmacy_id", "created_at", "id"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -305,6 +396,49 @@ class Notification(Base):
     # Relationships
     user = relationship("User", back_populates="notifications")
 
+    __table_args__ = (
+        # Keyset pagination of a user's notifications
+        Index("ix_notifications_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Unread notifications of a user (counting, listing)
+        Index("ix_notifications_user_id_is_read_created_at", "user_id", "is_read", "created_at"),
+    )
+
+
+@event.listens_for(Notification, "after_insert")
+def _count_new_notification(mapper, connection, target):
+    """Keep the user's unread counter in sync with notification writes (applied after the flush)"""
+    if target.is_read is not True:
+        from app.services.notification_counter import queue_unread_change
+
+        queue_unread_change(object_session(target), target.user_id, 1)
+
+
+@event.listens_for(Notification, "after_update")
+def _count_read_notification(mapper, connection, target):
+    history = inspect(target).attrs.is_read.history
+    if not history.has_changes() or bool(history.deleted and history.deleted[0]) == bool(target.is_read):
+        return
+    from app.services.notification_counter import queue_unread_change
+
+    queue_unread_change(object_session(target), target.user_id, -1 if target.is_read else 1)
+
+
+@event.listens_for(Notification, "after_delete")
+def _count_deleted_notification(mapper, connection, target):
+    if not target.is_read:
+        from app.services.notification_counter import queue_unread_change
+
+        queue_unread_change(object_session(target), target.user_id, -1)
+
+
+class UserNotificationCounter(Base):
+    """Number of unread notifications of a user, maintained on notification writes"""
+    __tablename__ = "user_notification_counters"
+
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 
 class SystemConfig(Base):
     __tablename__ = "system_config"
@@ -316,6 +450,37 @@ class SystemConfig(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+class OutboundEmailStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+class OutboundEmail(Base):
+    """Outgoing email, delivered by the email queue worker"""
+    __tablename__ = "outbound_emails"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    recipient = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    html_body = Column(Text, nullable=False)
+    status = Column(Enum(OutboundEmailStatus), nullable=False, default=OutboundEmailStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    claimed_by = Column(String(36))  # Worker batch currently sending the message
+    claimed_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    sent_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Due-message polling by the queue worker
+        Index("ix_outbound_emails_status_next_attempt_at", "status", "next_attempt_at"),
+        Index("ix_outbound_emails_claimed_by", "claimed_by"),
+    )
+
+
 class PrescriptionStatus(str, enum.Enum):
     PENDING = "pending"
     APPROVED = "approved"
@@ -330,10 +495,15 @@ class PrescriptionRequest(Base):
     user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(String(36), ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     pharmacy_id = Column(String(36), ForeignKey("pharmacies.id", ondelete="CASCADE"), nullable=False)
-    prescription_image_url = Column(String(500), nullable=False)
+    prescription_image_url = Column(String(500), nullable=False, index=True)
     original_filename = Column(String(255))
     file_size = Column(Integer)
     mime_type = Column(String(100))
+    # WebP derivatives rendered after upload (app.services.prescription_images)
+    thumbnail_url = Column(String(500))
+    preview_url = Column(String(500))
+    full_size_url = Column(String(500))  # Full resolution, without EXIF
+    derivatives_failed = Column(Boolean, nullable=False, default=False)  # Not a renderable image
     status = Column(Enum(PrescriptionStatus), default=PrescriptionStatus.PENDING)
     quantity_requested = Column(Integer, nullable=False, default=1)
 
@@ -356,6 +526,53 @@ class PrescriptionRequest(Base):
     pharmacy = relationship("Pharmacy")
     validator = relationship("User", foreign_keys=[validated_by])
 
+    __table_args__ = (
+        # Timeout reconciliation scan: only pending requests are indexed
+        Index(
+            "ix_prescription_requests_pending_timeout", "validation_timeout_at",
+            sqlite_where=text("status = 'PENDING'"), postgresql_where=text("status = 'PENDING'")
+        ),
+    )
+
+
+@event.listens_for(PrescriptionRequest, "after_insert")
+def _reference_prescription_file(mapper, connection, target):
+    """Count the request as a reference to its stored prescription file"""
+    from app.services.prescription_store import adjust_file_references
+
+    adjust_file_references(connection, target.prescription_image_url, 1, target.file_size)
+
+
+@event.listens_for(PrescriptionRequest, "after_update")
+def _rereference_prescription_file(mapper, connection, target):
+    history = inspect(target).attrs.prescription_image_url.history
+    if not history.has_changes():
+        return
+    from app.services.prescription_store import adjust_file_references
+
+    for url in history.deleted:
+        adjust_file_references(connection, url, -1)
+    adjust_file_references(connection, target.prescription_image_url, 1, target.file_size)
+
+
+@event.listens_for(PrescriptionRequest, "after_delete")
+def _dereference_prescription_file(mapper, connection, target):
+    from app.services.prescription_store import adjust_file_references
+
+    adjust_file_references(connection, target.prescription_image_url, -1)
+
+
+class PrescriptionFile(Base):
+    """A content-addressed prescription file and the number of requests pointing at it"""
+    __tablename__ = "prescription_files"
+
+    url = Column(String(500), primary_key=True)  # As stored in prescription_requests.prescription_image_url
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(Integer)
+    reference_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 
 class CartItem(Base):
     __tablename__ = "cart_items"
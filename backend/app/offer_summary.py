@@ -0,0 +1,97 @@
+"""
+Product offer summary maintenance.
+
+product_offer_summary holds, per product, the aggregates the enhanced search
+orders and displays by (min/max in-stock price, number of pharmacies with
+stock, best sponsored pharmacy). A product's row is recomputed from its own
+inventory rows, through the pharmacy_inventory.product_id index, whenever one
+of them is written (see the ORM hooks in app.models), so search reads it with
+a single primary-key join instead of grouping the whole inventory table.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, delete, func, insert, select
+
+from app.database import dialect_insert
+from app.models import PharmacyInventory, ProductOfferSummary
+
+inventory = PharmacyInventory.__table__
+summary = ProductOfferSummary.__table__
+
+
+def _aggregate_query():
+    """(product_id, min, max, count, has_sponsored, max_sponsor_rank) of in-stock inventory"""
+    return (
+        select(
+            inventory.c.product_id,
+            func.min(inventory.c.price),
+            func.max(inventory.c.price),
+            func.count(func.distinct(inventory.c.pharmacy_id)),
+            func.max(case((inventory.c.is_sponsored == True, 1), else_=0)),
+            func.coalesce(func.max(inventory.c.sponsor_rank), 0)
+        )
+        .where(inventory.c.quantity > 0)
+        .group_by(inventory.c.product_id)
+    )
+
+
+def _best_sponsor_query(product_id: str):
+    """Sponsored pharmacy shown for a product: highest rank, then cheapest"""
+    return (
+        select(inventory.c.pharmacy_id)
+        .where(
+            inventory.c.product_id == product_id,
+            inventory.c.quantity > 0,
+            inventory.c.is_sponsored == True
+        )
+        .order_by(inventory.c.sponsor_rank.desc(), inventory.c.price.asc(), inventory.c.pharmacy_id.asc())
+        .limit(1)
+    )
+
+
+def _summary_values(connection, row) -> dict:
+    product_id, min_price, max_price, pharmacy_count, has_sponsored, max_sponsor_rank = row
+    return {
+        "product_id": product_id,
+        "min_price": min_price,
+        "max_price": max_price,
+        "in_stock_pharmacy_count": pharmacy_count,
+        "has_sponsored": bool(has_sponsored),
+        "max_sponsor_rank": max_sponsor_rank or 0,
+        "sponsored_pharmacy_id": (
+            connection.execute(_best_sponsor_query(product_id)).scalar() if has_sponsored else None
+        ),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def refresh_offer_summary(connection, product_id: str):
+    """Recompute one product's summary row (removed when nothing is in stock)"""
+    if product_id is None:
+        return
+
+    row = connection.execute(
+        _aggregate_query().where(inventory.c.product_id == product_id)
+    ).first()
+    if row is None:
+        connection.execute(delete(summary).where(summary.c.product_id == product_id))
+        return
+
+    # An upsert, so concurrent inventory writes for the product cannot both insert the row
+    values = _summary_values(connection, row)
+    statement = dialect_insert(connection.dialect.name)(summary).values(**values)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[summary.c.product_id],
+            set_={column: value for column, value in values.items() if column != "product_id"}
+        )
+    )
+
+
+def rebuild_offer_summaries(connection) -> int:
+    """Recompute every summary row from the inventory, returns the number of products summarized"""
+    connection.execute(delete(summary))
+    rows = connection.execute(_aggregate_query()).all()
+    if rows:
+        connection.execute(insert(summary), [_summary_values(connection, row) for row in rows])
+    return len(rows)
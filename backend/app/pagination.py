@@ -0,0 +1,136 @@
+"""
+Opaque cursors for keyset pagination
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, func, or_, select, tuple_
+
+# (sort expression, value of the last returned row, descending)
+SortKey = Tuple[Any, Any, bool]
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid pagination cursor"
+    )
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode the sort key of the last returned row as an opaque cursor"""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """Decode a cursor produced by encode_cursor, checking it has `size` values"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        values = None
+
+    if not isinstance(values, list) or len(values) != size:
+        raise _invalid_cursor()
+    return values
+
+
+def encode_sort_cursor(mode: str, values: List[Any]) -> str:
+    """Cursor tagged with the sort mode it was produced by"""
+    return encode_cursor([mode, *values])
+
+
+def decode_sort_cursor(cursor: Optional[str], mode: str, types: Sequence[Any]) -> Optional[List[Any]]:
+    """Decode a cursor from encode_sort_cursor, checking its mode and the type of each value"""
+    values = decode_cursor(cursor, len(types) + 1)
+    if values is None:
+        return None
+    if values[0] != mode or any(
+        isinstance(value, bool) or not isinstance(value, expected)
+        for value, expected in zip(values[1:], types)
+    ):
+        raise _invalid_cursor()
+    return values[1:]
+
+
+def keyset_filter(keys: Sequence[SortKey]):
+    """Predicate selecting the rows that sort strictly after the given key values.
+
+    keys are listed in ORDER BY order; the last one must be unique (the id).
+    When every key sorts the same way this is a row-value comparison, which
+    databases turn into a range seek on the matching composite index.
+    """
+    directions = {descending for _, _, descending in keys}
+    if len(directions) == 1:
+        expressions = tuple_(*[expression for expression, _, _ in keys])
+        values = tuple_(*[value for _, value, _ in keys])
+        return expressions < values if directions.pop() else expressions > values
+
+    clauses = []
+    for position, (expression, value, descending) in enumerate(keys):
+        after = expression < value if descending else expression > value
+        clauses.append(and_(*[previous == previous_value for previous, previous_value, _ in keys[:position]], after))
+    return or_(*clauses)
+
+
+def decode_timestamp(value: Any) -> datetime:
+    """Timestamp stored in a cursor by encode_cursor"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise _invalid_cursor()
+
+
+def decode_decimal(value: Any) -> Decimal:
+    """Decimal stored in a cursor as a string"""
+    try:
+        number = Decimal(value) if isinstance(value, str) else None
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        raise _invalid_cursor()
+    return number
+
+
+def stored_value(model, column, row_id: str, encoded: Any):
+    """Sort value of the cursor's row as stored in the database.
+
+    Comparing against the stored value keeps keysets exact on SQLite, which
+    keeps timestamps as text with or without microseconds. The encoded value
+    is only used if the row has since been deleted.
+    """
+    return func.coalesce(select(column).where(model.id == row_id).scalar_subquery(), encoded)
+
+
+def timestamp_keyset(model, column, cursor: Optional[str], descending: bool = True):
+    """Keyset predicate for listings ordered by (column, id), None without a cursor"""
+    after = decode_cursor(cursor, 2)
+    if after is None:
+        return None
+    if not isinstance(after[1], str):
+        raise _invalid_cursor()
+
+    return keyset_filter([
+        (column, stored_value(model, column, after[1], decode_timestamp(after[0])), descending),
+        (model.id, after[1], descending),
+    ])
+
+
+def timestamp_cursor(timestamp: Optional[datetime], row_id: str) -> str:
+    """Cursor of a row for timestamp_keyset"""
+    return encode_cursor([timestamp.isoformat() if timestamp else None, row_id])
+
+
+def paginate(rows: List[Any], limit: int, cursor_for: Callable[[Any], str]) -> Tuple[List[Any], Optional[str]]:
+    """Trim a `limit + 1` fetch to `limit` rows, with the next cursor if there are more"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, cursor_for(rows[-1])
@@ -5,12 +5,14 @@ from sqlalchemy import and_, select, func, delete
 from typing import List, Optional
 import uuid
 from datetime import datetime
-import math
 
 from ..database import get_db
 from ..models import User, Product, Pharmacy, CartItem, PharmacyInventory
 from ..auth import get_current_user
 from ..email_service import email_service
+from ..services.email_queue import email_queue
+from ..geo import haversine_km
+from ..services.cart_service import hydrate_cart, FALLBACK_PRICE
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/cart", tags=["cart"])
@@ -23,24 +25,7 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
         return None
 
-    # Convert latitude and longitude from degrees to radians
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
-
-    # Haversine formula
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-
-    # Radius of Earth in kilometers
-    R = 6371
-    distance = R * c
-
-    return round(distance, 2)
+    return round(haversine_km(float(lat1), float(lon1), float(lat2), float(lon2)), 2)
 
 # Pydantic models
 class CartItemCreate(BaseModel):
@@ -94,6 +79,7 @@ class CartItemResponse(BaseModel):
     product: dict
     pharmacy: dict
     price: float
+    price_is_fallback: bool = False
 
     class Config:
         from_attributes = True
@@ -116,38 +102,12 @@ async def get_cart_items(
 ):
     """Get all items in user's cart"""
     try:
-        # Get cart items with product and pharmacy details using async ORM
-        result = await db.execute(
-            select(CartItem).where(CartItem.user_id == current_user.id)
-            .order_by(CartItem.created_at.desc())
-        )
-        cart_items = result.scalars().all()
+        # Load cart lines with their products, pharmacies and prices in bulk
+        cart_lines = await hydrate_cart(db, current_user.id)
 
         response_items = []
-        for item in cart_items:
-            # Get product details
-            product_result = await db.execute(
-                select(Product).where(Product.id == item.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-
-            # Get pharmacy details
-            pharmacy_result = await db.execute(
-                select(Pharmacy).where(Pharmacy.id == item.pharmacy_id)
-            )
-            pharmacy = pharmacy_result.scalar_one_or_none()
-
-            # Get price from pharmacy inventory
-            inventory_result = await db.execute(
-                select(PharmacyInventory).where(
-                    and_(
-                        PharmacyInventory.product_id == item.product_id,
-                        PharmacyInventory.pharmacy_id == item.pharmacy_id
-                    )
-                )
-            )
-            inventory = inventory_result.scalar_one_or_none()
-            price = float(inventory.price) if inventory else 1000.0  # Default fallback
+        for line in cart_lines:
+            item, product, pharmacy = line.item, line.product, line.pharmacy
 
             response_items.append(CartItemResponse(
                 id=item.id,
@@ -172,7 +132,8 @@ async def get_cart_items(
                     "address": pharmacy.address if pharmacy else None,
                     "phone": pharmacy.phone if pharmacy else None
                 },
-                price=price
+                price=line.price,
+                price_is_fallback=line.price_is_fallback
             ))
 
         return response_items
@@ -398,14 +359,10 @@ async def validate_delivery_constraints(
 ):
     """Validate delivery constraints and provide suggestions"""
     try:
-        # Get cart items
-        result = await db.execute(
-            select(CartItem).where(CartItem.user_id == current_user.id)
-            .order_by(CartItem.created_at.desc())
-        )
-        cart_items = result.scalars().all()
+        # Get cart items with products, pharmacies and prices
+        cart_lines = await hydrate_cart(db, current_user.id)
 
-        if not cart_items:
+        if not cart_lines:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Cart is empty"
@@ -414,31 +371,11 @@ async def validate_delivery_constraints(
         # Group items by pharmacy
         pharmacy_groups = {}
         total_cart_price = 0
+        fallback_products = []
 
-        for item in cart_items:
-            # Get product details
-            product_result = await db.execute(
-                select(Product).where(Product.id == item.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-
-            # Get pharmacy details
-            pharmacy_result = await db.execute(
-                select(Pharmacy).where(Pharmacy.id == item.pharmacy_id)
-            )
-            pharmacy = pharmacy_result.scalar_one_or_none()
-
-            # Get price from pharmacy inventory
-            inventory_result = await db.execute(
-                select(PharmacyInventory).where(
-                    and_(
-                        PharmacyInventory.product_id == item.product_id,
-                        PharmacyInventory.pharmacy_id == item.pharmacy_id
-                    )
-                )
-            )
-            inventory = inventory_result.scalar_one_or_none()
-            price = float(inventory.price) if inventory else 1000.0
+        for line in cart_lines:
+            item, product, pharmacy = line.item, line.product, line.pharmacy
+            price = line.price
 
             if item.pharmacy_id not in pharmacy_groups:
                 pharmacy_groups[item.pharmacy_id] = {
@@ -453,7 +390,7 @@ async def validate_delivery_constraints(
                     'delivery_fee': 2000.0 if request.delivery_type == "home_delivery" else 0.0
                 }
 
-            item_total = price * item.quantity
+            item_total = line.total_price
             total_cart_price += item_total
 
             pharmacy_groups[item.pharmacy_id]['items'].append({
@@ -461,10 +398,14 @@ async def validate_delivery_constraints(
                 'product_name': product.name if product else 'Produit inconnu',
                 'quantity': item.quantity,
                 'unit_price': price,
-                'total_price': item_total
+                'total_price': item_total,
+                'price_is_fallback': line.price_is_fallback
             })
             pharmacy_groups[item.pharmacy_id]['total_price'] += item_total
 
+            if line.price_is_fallback:
+                fallback_products.append(product.name if product else 'Produit inconnu')
+
         # Convert to list format
         pharmacy_list = list(pharmacy_groups.values())
         total_deliveries = len(pharmacy_list)
@@ -505,6 +446,12 @@ async def validate_delivery_constraints(
         # Add distance warnings first
         warnings.extend(distance_warnings)
 
+        if fallback_products:
+            warnings.append(
+                f"Prix indisponible pour: {', '.join(fallback_products)}. "
+                f"Un prix estimé de {FALLBACK_PRICE:,.0f} FCFA est affiché."
+            )
+
         if request.delivery_type == "pickup":
             if total_deliveries > 1:
                 is_valid = True  # We'll allow it with duplication
@@ -623,14 +570,10 @@ async def create_multi_order(
 ):
     """Create multiple orders from cart (one per pharmacy)"""
     try:
-        # Get cart items first
-        cart_result = await db.execute(
-            select(CartItem).where(CartItem.user_id == current_user.id)
-            .order_by(CartItem.created_at.desc())
-        )
-        cart_items = cart_result.scalars().all()
+        # Get cart items with products, pharmacies and prices
+        cart_lines = await hydrate_cart(db, current_user.id)
 
-        if not cart_items:
+        if not cart_lines:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Cart is empty"
@@ -638,45 +581,28 @@ async def create_multi_order(
 
         # Group items by pharmacy (same logic as validation)
         pharmacy_groups = {}
-        for item in cart_items:
-            # Get product and pharmacy details
-            product_result = await db.execute(
-                select(Product).where(Product.id == item.product_id)
-            )
-            product = product_result.scalar_one_or_none()
-
-            pharmacy_result = await db.execute(
-                select(Pharmacy).where(Pharmacy.id == item.pharmacy_id)
-            )
-            pharmacy = pharmacy_result.scalar_one_or_none()
-
-            # Get price from inventory
-            inventory_result = await db.execute(
-                select(PharmacyInventory).where(
-                    and_(
-                        PharmacyInventory.product_id == item.product_id,
-                        PharmacyInventory.pharmacy_id == item.pharmacy_id
-                    )
-                )
-            )
-            inventory = inventory_result.scalar_one_or_none()
-            price = float(inventory.price) if inventory else 1000.0
+        for line in cart_lines:
+            item = line.item
 
             if item.pharmacy_id not in pharmacy_groups:
                 pharmacy_groups[item.pharmacy_id] = {
-                    'pharmacy': pharmacy,
+                    'pharmacy': line.pharmacy,
                     'items': [],
-                    'total_amount': 0
+                    'total_amount': 0,
+                    'has_fallback_price': False
                 }
 
-            item_total = price * item.quantity
+            item_total = line.total_price
             pharmacy_groups[item.pharmacy_id]['items'].append({
-                'product': product,
+                'product': line.product,
                 'quantity': item.quantity,
-                'unit_price': price,
-                'total_price': item_total
+                'unit_price': line.price,
+                'total_price': item_total,
+                'price_is_fallback': line.price_is_fallback
             })
             pharmacy_groups[item.pharmacy_id]['total_amount'] += item_total
+            if line.price_is_fallback:
+                pharmacy_groups[item.pharmacy_id]['has_fallback_price'] = True
 
         # Validate home delivery address if needed
         if request.delivery_type == "home_delivery":
@@ -711,6 +637,7 @@ async def create_multi_order(
                 'subtotal': group['total_amount'],
                 'delivery_fee': delivery_fee,
                 'total_amount': order_total,
+                'has_fallback_price': group['has_fallback_price'],
                 'pickup_code': f"{random.randint(1000, 9999)}" if request.delivery_type == "pickup" else None,
                 'status': 'pending_payment' if request.payment_method != 'cash' else 'pending'
             }
@@ -718,12 +645,8 @@ async def create_multi_order(
             created_orders.append(new_order)
             total_payment_amount += order_total
 
-        # Clear cart after order creation
-        delete_query = delete(CartItem).where(CartItem.user_id == current_user.id)
-        await db.execute(delete_query)
-        await db.commit()
-
-        # Envoyer les emails de confirmation et reçu
+        # Queue the confirmation and receipt emails in the same transaction as
+        # the order; the email queue worker sends them after the commit
         try:
             user_name = f"{current_user.first_name} {current_user.last_name}".strip()
             if not user_name:
@@ -731,6 +654,7 @@ async def create_multi_order(
 
             # Email de confirmation de commande
             email_service.send_order_confirmation_email(
+                db,
                 user_email=current_user.email,
                 user_name=user_name,
                 orders=created_orders
@@ -738,6 +662,7 @@ async def create_multi_order(
 
             # Email de reçu détaillé
             email_service.send_order_receipt_email(
+                db,
                 user_email=current_user.email,
                 user_name=user_name,
                 orders=created_orders,
@@ -748,6 +673,12 @@ async def create_multi_order(
             # L'erreur d'email ne doit pas empêcher la commande
             print(f"⚠️ Erreur lors de l'envoi des emails: {str(e)}")
 
+        # Clear cart after order creation
+        delete_query = delete(CartItem).where(CartItem.user_id == current_user.id)
+        await db.execute(delete_query)
+        await db.commit()
+        email_queue.wake()
+
         # Determine if payment is required now
         payment_required = request.payment_method in ['card', 'mobile_money', 'paypal']
 
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, delete as sql_delete
 from sqlalchemy.orm import selectinload
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 from ..database import get_db
 from ..auth import get_current_user
 from ..models import User, Notification
+from ..pagination import paginate, timestamp_cursor, timestamp_keyset
+from ..services.notification_counter import get_unread_count as count_unread, record_unread_changes
 from ..schemas import Notification as NotificationSchema
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
@@ -15,20 +17,30 @@ router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 @router.get("/", response_model=List[NotificationSchema])
 async def get_notifications(
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces offset)")
 ):
-    """Get user's notifications"""
+    """Get user's notifications, newest first"""
+    query = select(Notification).where(Notification.user_id == current_user.id)
+    after = timestamp_keyset(Notification, Notification.created_at, cursor)
+    query = query.where(after) if after is not None else query.offset(offset)
+
     result = await db.execute(
-        select(Notification)
-        .where(Notification.user_id == current_user.id)
-        .order_by(Notification.created_at.desc())
-        .offset(offset)
-        .limit(limit)
+        query
+        .order_by(Notification.created_at.desc(), Notification.id.desc())
+        .limit(limit + 1)
     )
-    return result.scalars().all()
+    notifications, next_cursor = paginate(
+        result.scalars().all(), limit,
+        lambda notification: timestamp_cursor(notification.created_at, notification.id)
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return notifications
 
 
 @router.get("/unread-count")
@@ -37,15 +49,7 @@ async def get_unread_count(
     current_user: User = Depends(get_current_user)
 ):
     """Get count of unread notifications"""
-    result = await db.execute(
-        select(Notification)
-        .where(
-            Notification.user_id == current_user.id,
-            Notification.is_read == False
-        )
-    )
-    notifications = result.scalars().all()
-    return {"count": len(notifications)}
+    return {"count": await count_unread(db, current_user.id)}
 
 
 @router.patch("/{notification_id}/read")
@@ -68,11 +72,12 @@ async def mark_as_read(
         raise HTTPException(status_code=404, detail="Notification not found")
 
     # Mark as read
-    await db.execute(
+    result = await db.execute(
         update(Notification)
-        .where(Notification.id == notification_id)
+        .where(Notification.id == notification_id, Notification.is_read == False)
         .values(is_read=True)
     )
+    await record_unread_changes(db, {current_user.id: -result.rowcount})
     await db.commit()
 
     return {"message": "Notification marked as read"}
@@ -84,7 +89,7 @@ async def mark_all_as_read(
     current_user: User = Depends(get_current_user)
 ):
     """Mark all notifications as read for current user"""
-    await db.execute(
+    result = await db.execute(
         update(Notification)
         .where(
             Notification.user_id == current_user.id,
@@ -92,6 +97,7 @@ async def mark_all_as_read(
         )
         .values(is_read=True)
     )
+    await record_unread_changes(db, {current_user.id: -result.rowcount})
     await db.commit()
 
     return {"message": "All notifications marked as read"}
@@ -117,9 +123,13 @@ async def delete_notification(
         raise HTTPException(status_code=404, detail="Notification not found")
 
     # Delete notification
-    await db.execute(
-        sql_delete(Notification).where(Notification.id == notification_id)
+    result = await db.execute(
+        sql_delete(Notification)
+        .where(Notification.id == notification_id)
+        .returning(Notification.is_read)
     )
+    unread = sum(1 for is_read in result.scalars() if not is_read)
+    await record_unread_changes(db, {current_user.id: -unread})
     await db.commit()
 
     return {"message": "Notification deleted"}
@@ -131,9 +141,13 @@ async def clear_all_notifications(
     current_user: User = Depends(get_current_user)
 ):
     """Delete all notifications for current user"""
-    await db.execute(
-        sql_delete(Notification).where(Notification.user_id == current_user.id)
+    result = await db.execute(
+        sql_delete(Notification)
+        .where(Notification.user_id == current_user.id)
+        .returning(Notification.is_read)
     )
+    unread = sum(1 for is_read in result.scalars() if not is_read)
+    await record_unread_changes(db, {current_user.id: -unread})
     await db.commit()
 
     return {"message": "All notifications deleted"}
\ No newline at end of file
@@ -1,8 +1,11 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-import boto3
+from datetime import datetime
+import mimetypes
+import uuid
 from botocore.exceptions import ClientError
 
 from app.database import get_db
@@ -14,44 +17,33 @@ from app.crud import (
 from app.auth import get_current_active_user, get_current_pharmacist
 from app.models import User, OrderStatus
 from app.config import settings
+from app.services.object_storage import object_storage
+from app.uploads import UploadTooLarge
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
 
-async def upload_prescription_to_s3(file: UploadFile) -> str:
-    """Upload prescription image to AWS S3"""
-    if not file.content_type.startswith('image/'):
+async def store_prescription_image(file: UploadFile) -> str:
+    """Store an order prescription image; returns its object storage key"""
+    if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File must be an image"
         )
     
-    # Create S3 client
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION
-    )
-    
-    # Generate unique filename
-    import uuid
-    from datetime import datetime
+    # Generate unique key
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"prescriptions/{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
+    extension = mimetypes.guess_extension(file.content_type) or ".jpg"
+    key = f"prescriptions/{timestamp}_{uuid.uuid4().hex[:8]}{extension}"
     
     try:
-        # Upload file
-        s3_client.upload_fileobj(
-            file.file,
-            settings.AWS_S3_BUCKET,
-            filename,
-            ExtraArgs={'ContentType': file.content_type}
+        await object_storage.put(key, file, file.content_type, settings.MAX_UPLOAD_SIZE)
+        return key
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File size too large (max 10MB)"
         )
-        
-        # Return public URL
-        return f"https://{settings.AWS_S3_BUCKET}.s3.{settings.AWS_S3_REGION}.amazonaws.com/{filename}"
-    
     except ClientError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -102,10 +94,20 @@ async def upload_prescription(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Upload prescription image"""
+    """Upload prescription image.
+
+    image_url is the reference to send as the order's prescription_image_url;
+    download_url is a short-lived link to the uploaded image.
+    """
     try:
-        image_url = await upload_prescription_to_s3(file)
-        return {"image_url": image_url}
+        key = await store_prescription_image(file)
+        return {
+            "image_url": key,
+            "download_url": object_storage.download_url(key),
+            "expires_in": settings.OBJECT_STORAGE_URL_EXPIRES_SECONDS
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -115,18 +117,23 @@ async def upload_prescription(
 
 @router.get("/", response_model=List[Order])
 async def get_my_orders(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces skip)"),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get current user's orders"""
-    orders = await get_user_orders(
+    orders, next_cursor = await get_user_orders(
         db=db,
         user_id=current_user.id,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return orders
 
 
@@ -159,6 +166,43 @@ async def get_order_details(
     return order
 
 
+@router.get("/{order_id}/prescription")
+async def get_order_prescription(
+    order_id: UUID,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Redirect to a short-lived download URL of the order's prescription image"""
+    order = await get_order(db, order_id)
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    
+    if current_user.role == "client" and order.client_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view this order"
+        )
+    elif current_user.role == "pharmacist" and order.pharmacy.owner_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view this order"
+        )
+    
+    if not order.prescription_image_url:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No prescription image uploaded for this order"
+        )
+    
+    # Orders from before object storage hold a full public URL
+    if order.prescription_image_url.startswith(("http://", "https://")):
+        return RedirectResponse(order.prescription_image_url)
+    return RedirectResponse(object_storage.download_url(order.prescription_image_url))
+
+
 @router.put("/{order_id}/status", response_model=Order)
 async def update_order_status_endpoint(
     order_id: UUID,
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
@@ -11,24 +11,31 @@ from app.crud import (
 )
 from app.auth import get_current_active_user, get_current_pharmacist
 from app.models import User
+from app.pagination import decode_sort_cursor, encode_sort_cursor, keyset_filter, paginate
+from app.services.pharmacy_locator import pharmacy_locator
 
 router = APIRouter(prefix="/pharmacies", tags=["pharmacies"])
 
 
 @router.get("/", response_model=List[Pharmacy])
 async def list_pharmacies(
+    response: Response,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(20, ge=1, le=100, description="Maximum number of records to return"),
     verified_only: bool = Query(True, description="Return only verified pharmacies"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """List all pharmacies"""
-    pharmacies = await get_pharmacies(
+    pharmacies, next_cursor = await get_pharmacies(
         db=db,
         skip=skip,
         limit=limit,
-        verified_only=verified_only
+        verified_only=verified_only,
+        cursor=cursor
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return pharmacies
 
 
@@ -51,7 +58,7 @@ async def search_pharmacies_by_location_endpoint(
     
     # Format response with distance
     result = []
-    for pharmacy in pharmacies:
+    for pharmacy, distance in pharmacies:
         pharmacy_data = {
             "id": pharmacy.id,
             "name": pharmacy.name,
@@ -64,7 +71,7 @@ async def search_pharmacies_by_location_endpoint(
             "longitude": float(pharmacy.longitude) if pharmacy.longitude else None,
             "opening_hours": pharmacy.opening_hours,
             "is_verified": pharmacy.is_verified,
-            "distance_km": round(pharmacy.distance, 2) if hasattr(pharmacy, 'distance') else None,
+            "distance_km": round(distance, 2),
             "created_at": pharmacy.created_at
         }
         result.append(pharmacy_data)
@@ -155,22 +162,32 @@ async def update_pharmacy(
     
     await db.commit()
     await db.refresh(pharmacy)
+    await pharmacy_locator.rebuild(db)
     return pharmacy
 
 
 @router.get("/{pharmacy_id}/inventory", response_model=List[dict])
 async def get_pharmacy_inventory(
     pharmacy_id: UUID,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
     in_stock_only: bool = Query(True, description="Show only products in stock"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces skip)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get pharmacy inventory - simplified to avoid problematic pharmacy lookup"""
+    """Get pharmacy inventory, ordered by product.
+
+    The keyset is (product_id, id), which stock writes do not change, compared
+    with the values encoded in the cursor; last_updated moves on every write.
+    """
     from sqlalchemy import select
     from sqlalchemy.orm import selectinload
     from app.models import PharmacyInventory
 
+    # Outside the try below so that a bad cursor is a 400, not an empty page
+    after = decode_sort_cursor(cursor, "product", (str, str))
+
     try:
         # Convert UUID properly to string format
         pharmacy_uuid_str = str(pharmacy_id)
@@ -186,9 +203,21 @@ async def get_pharmacy_inventory(
         if in_stock_only:
             query = query.where(PharmacyInventory.quantity > 0)
 
-        query = query.offset(skip).limit(limit)
+        if after is not None:
+            query = query.where(keyset_filter([
+                (PharmacyInventory.product_id, after[0], False),
+                (PharmacyInventory.id, after[1], False),
+            ]))
+        else:
+            query = query.offset(skip)
+        query = query.order_by(PharmacyInventory.product_id, PharmacyInventory.id).limit(limit + 1)
         result = await db.execute(query)
-        inventory_items = result.scalars().all()
+        inventory_items, next_cursor = paginate(
+            result.scalars().all(), limit,
+            lambda item: encode_sort_cursor("product", [item.product_id, item.id])
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
 
         print(f"DEBUG: Found {len(inventory_items)} inventory items")
 
@@ -225,9 +254,11 @@ async def get_pharmacy_inventory(
 @router.get("/{pharmacy_id}/orders", response_model=List[dict])
 async def get_pharmacy_orders_endpoint(
     pharmacy_id: UUID,
+    response: Response,
     status: Optional[str] = Query(None, description="Filter by order status"),
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces skip)"),
     current_user: User = Depends(get_current_pharmacist),
     db: AsyncSession = Depends(get_db)
 ):
@@ -257,13 +288,16 @@ async def get_pharmacy_orders_endpoint(
                 detail="Invalid order status"
             )
     
-    orders = await get_pharmacy_orders(
+    orders, next_cursor = await get_pharmacy_orders(
         db=db,
         pharmacy_id=pharmacy_id,
         status=order_status,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     # Format response
     orders_data = []
@@ -4,14 +4,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
-import uuid
 import os
 import shutil
 from datetime import datetime, timedelta
-import aiofiles
 
+from ..config import settings
 from ..database import get_db
 from ..auth import get_current_user
+from ..background_tasks import background_task_manager
+from ..services.prescription_images import prescription_image_pipeline
+from ..services.prescription_store import prescription_store
+from ..uploads import StoredUpload, UploadTooLarge
 from ..models import User, PrescriptionRequest, PrescriptionStatus, Product, Pharmacy, Notification, Category
 from ..schemas import (
     PrescriptionRequest as PrescriptionRequestSchema,
@@ -26,12 +29,20 @@ security = HTTPBearer()
 # Configuration
 UPLOAD_DIR = "uploads/prescriptions"
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf"}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE  # 10MB
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
+async def store_prescription_file(file: UploadFile, file_ext: str) -> StoredUpload:
+    """Save an uploaded prescription in the content-addressed store, rejecting files over MAX_FILE_SIZE"""
+    try:
+        return await prescription_store.save(file, file_ext, MAX_FILE_SIZE)
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="File size too large (max 10MB)")
+
+
 @router.post("/upload", response_model=PrescriptionRequestSchema)
 async def upload_prescription(
     product_id: str = Form(...),
@@ -54,14 +65,6 @@ async def upload_prescription(
             detail=f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
-    # Check file size
-    file_size = 0
-    content = await file.read()
-    file_size = len(content)
-
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File size too large (max 10MB)")
-
     # Verify product requires prescription
     result = await db.execute(
         select(Product).where(Product.id == product_id)
@@ -81,23 +84,17 @@ async def upload_prescription(
     if not pharmacy:
         raise HTTPException(status_code=404, detail="Pharmacy not found")
 
-    # Generate unique filename
-    file_id = str(uuid.uuid4())
-    filename = f"{file_id}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(content)
+    # Stream the file to disk, checking its size
+    stored = await store_prescription_file(file, file_ext)
 
     # Create prescription request
     prescription_request = PrescriptionRequest(
         user_id=current_user.id,
         product_id=product_id,
         pharmacy_id=pharmacy_id,
-        prescription_image_url=f"/uploads/prescriptions/{filename}",
+        prescription_image_url=f"/uploads/prescriptions/{stored.filename}",
         original_filename=file.filename,
-        file_size=file_size,
+        file_size=stored.size,
         mime_type=file.content_type,
         quantity_requested=quantity_requested,
         expires_at=datetime.utcnow() + timedelta(days=30),  # 30 days expiry
@@ -107,6 +104,8 @@ async def upload_prescription(
 
     db.add(prescription_request)
     await db.commit()
+    background_task_manager.schedule_timeout(prescription_request.id, prescription_request.validation_timeout_at)
+    prescription_image_pipeline.schedule(prescription_request.id, stored.path)
 
     # Reload with eager loading for relationships to avoid MissingGreenlet errors
     result = await db.execute(
@@ -263,6 +262,7 @@ async def validate_prescription(
     db.add(notification)
 
     await db.commit()
+    background_task_manager.cancel_timeout(prescription_request.id)
 
     return {"message": f"Prescription {validation.action}ed successfully"}
 
@@ -310,7 +310,6 @@ async def get_alternative_pharmacies(
     current_user: User = Depends(get_current_user)
 ):
     """Get alternative pharmacies for an expired prescription request"""
-    from app.background_tasks import background_task_manager
 
     # Get the prescription request
     result = await db.execute(
@@ -390,36 +389,18 @@ async def retry_prescription_with_alternative_pharmacy(
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="File type not allowed")
 
-    # Create upload directory if it doesn't exist
-    UPLOAD_DIR = "uploads/prescriptions"
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File size too large (max 10MB)")
-
-    # Generate unique filename
+    # Stream the file to disk, checking its size
     file_ext = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
-    file_id = str(uuid.uuid4())
-    filename = f"{file_id}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        await f.write(content)
+    stored = await store_prescription_file(file, file_ext)
 
     # Create new prescription request with alternative pharmacy
     new_prescription_request = PrescriptionRequest(
         user_id=current_user.id,
         product_id=original_request.product_id,
         pharmacy_id=alternative_pharmacy_id,
-        prescription_image_url=f"/uploads/prescriptions/{filename}",
+        prescription_image_url=f"/uploads/prescriptions/{stored.filename}",
         original_filename=file.filename,
-        file_size=file_size,
+        file_size=stored.size,
         mime_type=file.content_type,
         quantity_requested=quantity_requested,
         expires_at=datetime.utcnow() + timedelta(days=30),  # 30 days expiry
@@ -429,6 +410,8 @@ async def retry_prescription_with_alternative_pharmacy(
 
     db.add(new_prescription_request)
     await db.commit()
+    background_task_manager.schedule_timeout(new_prescription_request.id, new_prescription_request.validation_timeout_at)
+    prescription_image_pipeline.schedule(new_prescription_request.id, stored.path)
 
     # Reload with eager loading for relationships to avoid MissingGreenlet errors
     result = await db.execute(
@@ -1,5 +1,5 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
@@ -7,32 +7,38 @@ from app.database import get_db
 from app.schemas import Product, ProductSearchQuery, ProductAvailability
 from app.crud import (
     get_product, search_products, search_products_with_pharmacy_info, 
-    get_product_availability, get_categories
+    get_product_availability, get_categories, AVAILABILITY_SORTS
 )
 from app.auth import get_current_active_user
 from app.models import User
+from app.services.product_suggest import product_suggester
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 
 @router.get("/", response_model=List[Product])
 async def search_products_endpoint(
+    response: Response,
     query: Optional[str] = Query(None, description="Search term for product name, generic name, or active ingredient"),
     category_id: Optional[UUID] = Query(None, description="Filter by category"),
     requires_prescription: Optional[bool] = Query(None, description="Filter by prescription requirement"),
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(20, ge=1, le=100, description="Maximum number of records to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page (replaces skip)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Search products with filters"""
-    products = await search_products(
+    products, next_cursor = await search_products(
         db=db,
         query=query,
         category_id=category_id,
         requires_prescription=requires_prescription,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return products
 
 
@@ -57,6 +63,24 @@ async def search_products_enhanced(
     return products
 
 
+@router.get("/suggest", response_model=List[dict])
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100, description="Partial product name, generic name or active ingredient"),
+    limit: int = Query(10, ge=1, le=20, description="Maximum number of suggestions"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Typo-tolerant autocomplete over product names (served from memory)"""
+    index = await product_suggester.get_index(db)
+    return [
+        {
+            "id": product_id,
+            "name": index.names[product_id],
+            "distance": distance
+        }
+        for product_id, distance in index.suggest(q, limit=limit)
+    ]
+
+
 @router.get("/{product_id}", response_model=Product)
 async def get_product_details(
     product_id: UUID,
@@ -75,12 +99,22 @@ async def get_product_details(
 @router.get("/{product_id}/availability", response_model=List[dict])
 async def get_product_availability_endpoint(
     product_id: UUID,
+    response: Response,
     latitude: Optional[float] = Query(None, description="User latitude for distance calculation"),
     longitude: Optional[float] = Query(None, description="User longitude for distance calculation"),
-    max_distance: Optional[float] = Query(10.0, description="Maximum distance in km"),
+    max_distance: Optional[float] = Query(10.0, gt=0, description="Maximum distance in km"),
+    sort_by: str = Query("distance", description="Sort order when a location is given: distance, price or score"),
+    limit: int = Query(50, ge=1, le=200, description="Maximum number of pharmacies to return"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get product availability across pharmacies"""
+    """Get product availability across pharmacies, nearest first when a location is given"""
+    if sort_by not in AVAILABILITY_SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort_by must be one of: {', '.join(AVAILABILITY_SORTS)}"
+        )
+
     product = await get_product(db, product_id)
     if not product:
         raise HTTPException(
@@ -88,24 +122,30 @@ async def get_product_availability_endpoint(
             detail="Product not found"
         )
     
-    availability = await get_product_availability(
+    availability, next_cursor = await get_product_availability(
         db=db,
         product_id=product_id,
         latitude=latitude,
         longitude=longitude,
-        max_distance=max_distance
+        max_distance=max_distance,
+        sort_by=sort_by,
+        limit=limit,
+        cursor=cursor
     )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     # Format response with pharmacy details
     result = []
-    for item in availability:
+    for item, pharmacy, distance in availability:
         pharmacy_data = {
-            "pharmacy_id": item.pharmacy.id,
-            "pharmacy_name": item.pharmacy.name,
-            "pharmacy_address": item.pharmacy.address,
-            "pharmacy_phone": item.pharmacy.phone,
-            "latitude": float(item.pharmacy.latitude) if item.pharmacy.latitude else None,
-            "longitude": float(item.pharmacy.longitude) if item.pharmacy.longitude else None,
+            "pharmacy_id": pharmacy.id,
+            "pharmacy_name": pharmacy.name,
+            "pharmacy_address": pharmacy.address,
+            "pharmacy_phone": pharmacy.phone,
+            "latitude": float(pharmacy.latitude) if pharmacy.latitude else None,
+            "longitude": float(pharmacy.longitude) if pharmacy.longitude else None,
+            "distance_km": round(distance, 2) if distance is not None else None,
             "quantity": item.quantity,
             "price": float(item.price),
             "expiry_date": item.expiry_date,
@@ -131,7 +171,7 @@ async def get_similar_products(
         )
     
     # Find products with same active ingredient or same category
-    similar_products = await search_products(
+    similar_products, _ = await search_products(
         db=db,
         query=product.active_ingredient or product.generic_name,
         category_id=product.category_id,
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+import os
+
+from ..services.object_storage import LocalObjectStorage, object_storage
+
+router = APIRouter(prefix="/storage", tags=["storage"])
+
+
+@router.get("/{key:path}")
+async def download_object(
+    key: str,
+    expires: int = Query(...),
+    signature: str = Query(...)
+):
+    """Serve an object of the local storage backend through a signed URL"""
+    if not isinstance(object_storage, LocalObjectStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not object_storage.verify(key, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+
+    path = object_storage.path_of(key)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, headers={"Cache-Control": "private, max-age=300"})
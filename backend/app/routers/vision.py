@@ -1,122 +1,89 @@
-from fastapi import APIRouter, HTTPException, status
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-import base64
-import os
-import requests
-import json
 
-router = APIRouter(prefix="/vision", tags=["vision"])
+from ..database import get_db
+from ..services.product_matcher import product_matcher
+
+from ..services.ocr_cache import ocr_cache
+from ..services.vision_client import vision_client, VisionError, VisionTimeout, VisionRejected, InvalidImage
 
-# Configuration Google Vision API
-GOOGLE_API_KEY = "AQ.Ab8RN6KMZund5AGf2mmkJQ4XVI8FkEQWJDXZM1AvQOsdjRVueQ"
-VISION_API_URL = "https://vision.googleapis.com/v1/images:annotate"
+router = APIRouter(prefix="/vision", tags=["vision"])
 
 class ImageAnalysisRequest(BaseModel):
     image_base64: str
 
+class ProductMatch(BaseModel):
+    product_id: str
+    name: str
+    score: float
+
 class ImageAnalysisResponse(BaseModel):
     detected_text: str
     confidence: float
+    matches: List[ProductMatch] = []
+
+class TextMatchRequest(BaseModel):
+    text: str = Field(..., max_length=5000)
+    limit: int = Field(5, ge=1, le=20)
+
+async def match_products(db: AsyncSession, text: str, limit: int = 5) -> List[ProductMatch]:
+    """Catalog products named in OCR text, best first"""
+    if not text:
+        return []
+    index = await product_matcher.get_index(db)
+    return [
+        ProductMatch(product_id=product_id, name=index.names[product_id], score=score)
+        for product_id, score in index.match(text, limit=limit)
+    ]
 
 @router.post("/analyze", response_model=ImageAnalysisResponse)
-async def analyze_image(request: ImageAnalysisRequest):
+async def analyze_image(request: ImageAnalysisRequest, db: AsyncSession = Depends(get_db)):
     """
-    Analyze image using Google Vision API for text detection
+    Analyze image using Google Vision API for text detection, and match the
+    detected text to catalog products
     """
-    try:
-        # Prepare Google Vision API request
-        vision_request = {
-            "requests": [
-                {
-                    "image": {
-                        "content": request.image_base64
-                    },
-                    "features": [
-                        {
-                            "type": "TEXT_DETECTION",
-                            "maxResults": 50
-                        }
-                    ],
-                    "imageContext": {
-                        "languageHints": ["fr", "en"]  # French and English for pharmaceutical terms
-                    }
-                }
-            ]
-        }
-
-        # Make request to Google Vision API
-        response = requests.post(
-            f"{VISION_API_URL}?key={GOOGLE_API_KEY}",
-            headers={"Content-Type": "application/json"},
-            json=vision_request,
-            timeout=30
+    if not vision_client.api_key:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google Vision API is not configured"
         )
 
-        if response.status_code != 200:
-            print(f"Google Vision API error: {response.status_code} - {response.text}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Google Vision API request failed: {response.status_code}"
-            )
-
-        vision_result = response.json()
-
-        # Check for errors in the response
-        if "responses" not in vision_result or not vision_result["responses"]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No response from Google Vision API"
-            )
-
-        vision_response = vision_result["responses"][0]
-
-        # Check for errors in the vision response
-        if "error" in vision_response:
-            error_msg = vision_response["error"].get("message", "Unknown error")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Google Vision API error: {error_msg}"
-            )
-
-        # Extract text annotations
-        if "textAnnotations" in vision_response and vision_response["textAnnotations"]:
-            # The first annotation contains all detected text
-            full_text = vision_response["textAnnotations"][0]["description"]
-            confidence = vision_response["textAnnotations"][0].get("confidence", 0.9)
-
-            print(f"🎯 Google Vision detected: {full_text}")
-
-            return ImageAnalysisResponse(
-                detected_text=full_text.strip(),
-                confidence=confidence
-            )
-        else:
-            # No text detected
-            return ImageAnalysisResponse(
-                detected_text="",
-                confidence=0.0
-            )
-
-    except requests.exceptions.Timeout:
+    try:
+        full_text, confidence = await vision_client.detect_text(request.image_base64)
+    except VisionTimeout:
         raise HTTPException(
             status_code=status.HTTP_408_REQUEST_TIMEOUT,
             detail="Google Vision API request timed out"
         )
-    except requests.exceptions.RequestException as e:
-        print(f"Request error: {str(e)}")
+    except (InvalidImage, VisionRejected) as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to connect to Google Vision API"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-    except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+    except VisionError as e:
+        print(f"Vision error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred during image analysis"
+            detail="Failed to analyze image with Google Vision API"
         )
 
+    if full_text:
+        print(f"🎯 Google Vision detected: {full_text}")
+
+    return ImageAnalysisResponse(
+        detected_text=full_text,
+        confidence=confidence,
+        matches=await match_products(db, full_text)
+    )
+
+@router.post("/match", response_model=List[ProductMatch])
+async def match_text(request: TextMatchRequest, db: AsyncSession = Depends(get_db)):
+    """Match already extracted packaging text to catalog products (ranked, served from memory)"""
+    return await match_products(db, request.text, request.limit)
+
 @router.get("/health")
 async def vision_health_check():
     """Health check for Vision API"""
-    return {"status": "healthy", "service": "Google Vision API"}
\ No newline at end of file
+    return {"status": "healthy", "service": "Google Vision API", "ocr_cache": ocr_cache.stats()}
\ No newline at end of file
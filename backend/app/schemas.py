@@ -418,6 +418,10 @@ class PrescriptionRequest(PrescriptionRequestBase):
     id: UUID
     user_id: UUID
     prescription_image_url: str
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    full_size_url: Optional[str] = None
+    derivatives_failed: bool = False
     original_filename: Optional[str] = None
     file_size: Optional[int] = None
     mime_type: Optional[str] = None
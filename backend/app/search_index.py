@@ -0,0 +1,193 @@
+"""
+Product full-text search index.
+
+Product names, generic names and active ingredients are stored accent-folded
+and lowercased (same normalization as normalize_search_query) in a dedicated
+index table:
+
+* SQLite: an FTS5 virtual table with the trigram tokenizer, so that substring
+  queries are answered from the index and ranked with bm25().
+* PostgreSQL: a table with a weighted tsvector and pg_trgm GIN indexes, so
+  that ILIKE substring queries use the index and are ranked with ts_rank()
+  and similarity().
+
+The index is kept in sync by ORM hooks on Product (see app.models).
+"""
+import sqlite3
+import unicodedata
+from typing import Optional
+
+from sqlalchemy import Float, String, text
+
+SEARCH_INDEX_TABLE = "product_search_index"
+
+# Column weights: name matches rank above generic name, then active ingredient
+NAME_WEIGHT = 10.0
+GENERIC_NAME_WEIGHT = 5.0
+ACTIVE_INGREDIENT_WEIGHT = 3.0
+
+TRIGRAM_MIN_LENGTH = 3
+SQLITE_TRIGRAM_SUPPORTED = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """Remove accents and lowercase, as normalize_search_query does"""
+    if not value:
+        return ""
+    normalized = unicodedata.normalize('NFD', value)
+    ascii_text = normalized.encode('ascii', 'ignore').decode('ascii')
+    return ascii_text.lower().strip()
+
+
+def is_supported(dialect_name: str) -> bool:
+    """Whether a search index exists for this database dialect"""
+    if dialect_name == "sqlite":
+        return SQLITE_TRIGRAM_SUPPORTED
+    return dialect_name == "postgresql"
+
+
+def create_search_index(connection):
+    """Create the search index table for the connection's dialect"""
+    dialect_name = connection.dialect.name
+    if not is_supported(dialect_name):
+        return
+
+    if dialect_name == "sqlite":
+        connection.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+                product_id UNINDEXED,
+                name,
+                generic_name,
+                active_ingredient,
+                tokenize = 'trigram'
+            )
+        """))
+        return
+
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} (
+            product_id VARCHAR(36) PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+            name TEXT NOT NULL DEFAULT '',
+            generic_name TEXT NOT NULL DEFAULT '',
+            active_ingredient TEXT NOT NULL DEFAULT '',
+            document TSVECTOR NOT NULL
+        )
+    """))
+    connection.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_INDEX_TABLE}_document "
+        f"ON {SEARCH_INDEX_TABLE} USING GIN (document)"
+    ))
+    for column in ("name", "generic_name", "active_ingredient"):
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_INDEX_TABLE}_{column}_trgm "
+            f"ON {SEARCH_INDEX_TABLE} USING GIN ({column} gin_trgm_ops)"
+        ))
+
+
+def index_product(
+    connection,
+    product_id: str,
+    name: Optional[str],
+    generic_name: Optional[str],
+    active_ingredient: Optional[str],
+    is_active: Optional[bool] = True
+):
+    """Insert or refresh a product's index entry (inactive products are removed)"""
+    dialect_name = connection.dialect.name
+    if not is_supported(dialect_name):
+        return
+
+    remove_product(connection, product_id)
+    if is_active is False:
+        return
+
+    values = {
+        "product_id": product_id,
+        "name": normalize_search_text(name),
+        "generic_name": normalize_search_text(generic_name),
+        "active_ingredient": normalize_search_text(active_ingredient),
+    }
+    if dialect_name == "sqlite":
+        connection.execute(text(
+            f"INSERT INTO {SEARCH_INDEX_TABLE} (product_id, name, generic_name, active_ingredient) "
+            f"VALUES (:product_id, :name, :generic_name, :active_ingredient)"
+        ), values)
+    else:
+        connection.execute(text(f"""
+            INSERT INTO {SEARCH_INDEX_TABLE} (product_id, name, generic_name, active_ingredient, document)
+            VALUES (
+                :product_id, :name, :generic_name, :active_ingredient,
+                setweight(to_tsvector('simple', :name), 'A') ||
+                setweight(to_tsvector('simple', :generic_name), 'B') ||
+                setweight(to_tsvector('simple', :active_ingredient), 'C')
+            )
+        """), values)
+
+
+def remove_product(connection, product_id: str):
+    """Drop a product's index entry"""
+    if not is_supported(connection.dialect.name):
+        return
+    connection.execute(
+        text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE product_id = :product_id"),
+        {"product_id": product_id}
+    )
+
+
+def rebuild_search_index(connection) -> int:
+    """Recreate every index entry from the products table, returns the number indexed"""
+    if not is_supported(connection.dialect.name):
+        return 0
+
+    create_search_index(connection)
+    connection.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE}"))
+    rows = connection.execute(text(
+        "SELECT id, name, generic_name, active_ingredient, is_active FROM products"
+    )).all()
+
+    for product_id, name, generic_name, active_ingredient, is_active in rows:
+        index_product(connection, product_id, name, generic_name, active_ingredient, is_active)
+    return len(rows)
+
+
+def search_subquery(dialect_name: str, query: str):
+    """Subquery of (product_id, rank) matching query, lower rank = more relevant.
+
+    Returns None when the dialect has no search index or the query is empty
+    after normalization.
+    """
+    normalized = normalize_search_text(query)
+    if not normalized or not is_supported(dialect_name):
+        return None
+
+    pattern = "%" + normalized.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    if dialect_name == "sqlite":
+        rank = f"bm25({SEARCH_INDEX_TABLE}, 0.0, {NAME_WEIGHT}, {GENERIC_NAME_WEIGHT}, {ACTIVE_INGREDIENT_WEIGHT})"
+        if len(normalized) >= TRIGRAM_MIN_LENGTH:
+            # A trigram phrase query matches the normalized text as a substring.
+            # LIMIT -1 keeps SQLite from flattening bm25() into the outer join.
+            statement = text(
+                f"SELECT product_id, {rank} AS rank FROM {SEARCH_INDEX_TABLE} "
+                f"WHERE {SEARCH_INDEX_TABLE} MATCH :match LIMIT -1"
+            ).bindparams(match='"' + normalized.replace('"', '""') + '"')
+        else:
+            # Too short for trigrams: scan the (small) index table instead
+            statement = text(
+                f"SELECT product_id, "
+                f"(CASE WHEN name LIKE :pattern ESCAPE '\\' THEN 0 ELSE 1 END) AS rank "
+                f"FROM {SEARCH_INDEX_TABLE} "
+                f"WHERE name LIKE :pattern ESCAPE '\\' OR generic_name LIKE :pattern ESCAPE '\\' "
+                f"OR active_ingredient LIKE :pattern ESCAPE '\\'"
+            ).bindparams(pattern=pattern)
+    else:
+        statement = text(f"""
+            SELECT product_id,
+                   -(ts_rank(document, plainto_tsquery('simple', :query))
+                     + similarity(name, :query)) AS rank
+            FROM {SEARCH_INDEX_TABLE}
+            WHERE name ILIKE :pattern OR generic_name ILIKE :pattern OR active_ingredient ILIKE :pattern
+        """).bindparams(query=normalized, pattern=pattern)
+
+    return statement.columns(product_id=String, rank=Float).subquery("product_search")
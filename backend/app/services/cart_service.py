@@ -0,0 +1,93 @@
+"""
+Cart hydration: load a user's cart with its products, pharmacies and prices
+in a fixed number of set-based queries
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import CartItem, Pharmacy, PharmacyInventory, Product
+
+logger = logging.getLogger(__name__)
+
+# Price used when a cart line has no matching inventory row anymore
+FALLBACK_PRICE = 1000.0
+
+
+class HydratedCartItem:
+    """A cart line with its product, pharmacy and resolved unit price"""
+
+    __slots__ = ("item", "product", "pharmacy", "inventory", "price", "price_is_fallback")
+
+    def __init__(
+        self,
+        item: CartItem,
+        product: Optional[Product],
+        pharmacy: Optional[Pharmacy],
+        inventory: Optional[PharmacyInventory]
+    ):
+        self.item = item
+        self.product = product
+        self.pharmacy = pharmacy
+        self.inventory = inventory
+        self.price_is_fallback = inventory is None
+        self.price = FALLBACK_PRICE if inventory is None else float(inventory.price)
+
+    @property
+    def total_price(self) -> float:
+        return self.price * self.item.quantity
+
+
+async def hydrate_cart(db: AsyncSession, user_id: str) -> List[HydratedCartItem]:
+    """Load the user's cart lines (newest first) with products, pharmacies and prices.
+
+    Runs four queries whatever the cart size: cart items, products,
+    pharmacies and the inventory rows of every (product, pharmacy) pair.
+    """
+    result = await db.execute(
+        select(CartItem).where(CartItem.user_id == user_id)
+        .order_by(CartItem.created_at.desc())
+    )
+    cart_items = result.scalars().all()
+    if not cart_items:
+        return []
+
+    product_ids = {item.product_id for item in cart_items}
+    pharmacy_ids = {item.pharmacy_id for item in cart_items}
+
+    product_result = await db.execute(select(Product).where(Product.id.in_(product_ids)))
+    products = {product.id: product for product in product_result.scalars().all()}
+
+    pharmacy_result = await db.execute(select(Pharmacy).where(Pharmacy.id.in_(pharmacy_ids)))
+    pharmacies = {pharmacy.id: pharmacy for pharmacy in pharmacy_result.scalars().all()}
+
+    # Both IN lists are bounded by the cart size; pairs outside the cart are dropped below
+    inventory_result = await db.execute(
+        select(PharmacyInventory).where(
+            PharmacyInventory.product_id.in_(product_ids),
+            PharmacyInventory.pharmacy_id.in_(pharmacy_ids)
+        )
+    )
+    inventories: Dict[Tuple[str, str], PharmacyInventory] = {
+        (inventory.product_id, inventory.pharmacy_id): inventory
+        for inventory in inventory_result.scalars().all()
+    }
+
+    hydrated = []
+    for item in cart_items:
+        line = HydratedCartItem(
+            item=item,
+            product=products.get(item.product_id),
+            pharmacy=pharmacies.get(item.pharmacy_id),
+            inventory=inventories.get((item.product_id, item.pharmacy_id))
+        )
+        if line.price_is_fallback:
+            logger.warning(
+                f"No inventory price for product {item.product_id} at pharmacy "
+                f"{item.pharmacy_id} (cart item {item.id}), using fallback {FALLBACK_PRICE}"
+            )
+        hydrated.append(line)
+
+    return hydrated
@@ -0,0 +1,367 @@
+"""
+Outbound email queue.
+
+Messages are written to the outbound_emails table in the caller's transaction
+(an order and its confirmation email commit together) and delivered by a
+background worker, so request handlers never wait on SMTP. The worker claims
+due messages in batches, sends a batch over a small pool of persistent SMTP
+connections instead of one handshake per message, and reschedules failures
+with exponential backoff until EMAIL_QUEUE_MAX_ATTEMPTS. Several processes can
+run the worker: a batch is claimed with a conditional UPDATE tagged with a
+batch id, and batches of a crashed worker are reclaimed after a timeout.
+"""
+import asyncio
+import logging
+import random
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import OutboundEmail, OutboundEmailStatus
+
+logger = logging.getLogger(__name__)
+
+# (email id, error or None when sent, permanent failure)
+DeliveryResult = Tuple[str, Optional[str], bool]
+
+
+def _close_connection(connection: smtplib.SMTP):
+    try:
+        connection.quit()
+    except Exception:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class SMTPConnectionPool:
+    """Persistent SMTP connections shared by the sending threads"""
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: Optional[bool] = None,
+        size: Optional[int] = None,
+        idle_seconds: Optional[float] = None,
+        timeout: Optional[float] = None
+    ):
+        self.host = host or settings.SMTP_HOST
+        self.port = port or settings.SMTP_PORT
+        self.user = user if user is not None else settings.SMTP_USER
+        self.password = password if password is not None else settings.SMTP_PASSWORD
+        self.use_tls = use_tls if use_tls is not None else settings.SMTP_USE_TLS
+        self.size = size or settings.SMTP_POOL_SIZE
+        self.idle_seconds = idle_seconds if idle_seconds is not None else settings.SMTP_IDLE_SECONDS
+        self.timeout = timeout or settings.SMTP_TIMEOUT_SECONDS
+        self._idle: List[Tuple[float, smtplib.SMTP]] = []
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                connection.starttls(context=ssl.create_default_context())
+            if self.user:
+                connection.login(self.user, self.password or "")
+        except Exception:
+            _close_connection(connection)
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    def acquire(self) -> Tuple[smtplib.SMTP, bool]:
+        """A connection, and whether it is a reused idle one (the server may have dropped it)"""
+        now = time.monotonic()
+        expired = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                released_at, candidate = self._idle.pop()
+                if now - released_at <= self.idle_seconds:
+                    connection = candidate
+                    break
+                expired.append(candidate)
+        for stale in expired:
+            _close_connection(stale)
+
+        if connection is not None:
+            return connection, True
+        return self._connect(), False
+
+    def release(self, connection: smtplib.SMTP, reusable: bool = True):
+        if reusable:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append((time.monotonic(), connection))
+                    return
+        _close_connection(connection)
+
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, connection in idle:
+            _close_connection(connection)
+
+
+class EmailQueue:
+    """Database-backed outbound email queue and its delivery worker"""
+
+    def __init__(
+        self,
+        pool: Optional[SMTPConnectionPool] = None,
+        backend: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None
+    ):
+        self.pool = pool or SMTPConnectionPool()
+        self.backend = backend or settings.EMAIL_BACKEND
+        self.batch_size = batch_size or settings.EMAIL_QUEUE_BATCH_SIZE
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.EMAIL_QUEUE_POLL_SECONDS
+        self.max_attempts = max_attempts or settings.EMAIL_QUEUE_MAX_ATTEMPTS
+        self.sender = settings.EMAIL_FROM
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._running = False
+        self._counters: Dict[str, int] = {"batches": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    def enqueue(self, db: AsyncSession, recipient: str, subject: str, html_body: str) -> OutboundEmail:
+        """Queue a message in the caller's transaction; it is sent once committed"""
+        email = OutboundEmail(
+            recipient=recipient,
+            subject=subject,
+            html_body=html_body,
+            status=OutboundEmailStatus.PENDING,
+            next_attempt_at=datetime.utcnow()
+        )
+        db.add(email)
+        return email
+
+    def wake(self):
+        """Ask the worker to poll now instead of at its next interval (call after commit)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        """Deliver queued messages until stop() is called"""
+        self._running = True
+        self._wake = asyncio.Event()
+        logger.info(f"Starting email queue worker ({self.backend} backend)...")
+
+        while self._running:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Error in email queue worker: {str(e)}")
+                processed = 0
+
+            # A full batch means more messages are probably due
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def stop(self):
+        """Stop the worker and close pooled SMTP connections"""
+        self._running = False
+        self.wake()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.pool.close()
+        logger.info("Stopping email queue worker...")
+
+    async def process_batch(self) -> int:
+        """Claim, send and record one batch of due messages; returns the number processed"""
+        batch_id = str(uuid.uuid4())
+        async with AsyncSessionLocal() as db:
+            messages = await self._claim(db, batch_id)
+        if not messages:
+            return 0
+
+        results = await self._deliver(messages)
+        attempts = {message.id: message.attempts for message in messages}
+        async with AsyncSessionLocal() as db:
+            await self._record(db, batch_id, results, attempts)
+        self._counters["batches"] += 1
+        return len(messages)
+
+    async def _claim(self, db: AsyncSession, batch_id: str) -> list:
+        now = datetime.utcnow()
+        # Batches left half-sent by a crashed worker go back to the queue
+        await db.execute(
+            update(OutboundEmail)
+            .where(
+                OutboundEmail.status == OutboundEmailStatus.SENDING,
+                OutboundEmail.claimed_at < now - timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT_SECONDS)
+            )
+            .values(status=OutboundEmailStatus.PENDING, claimed_by=None, claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+
+        due_ids = (
+            select(OutboundEmail.id)
+            .where(OutboundEmail.status == OutboundEmailStatus.PENDING, OutboundEmail.next_attempt_at <= now)
+            .order_by(OutboundEmail.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        # The status condition keeps concurrent workers from claiming the same rows
+        await db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(due_ids), OutboundEmail.status == OutboundEmailStatus.PENDING)
+            .values(status=OutboundEmailStatus.SENDING, claimed_by=batch_id, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        result = await db.execute(
+            select(
+                OutboundEmail.id, OutboundEmail.recipient, OutboundEmail.subject,
+                OutboundEmail.html_body, OutboundEmail.attempts
+            ).where(OutboundEmail.claimed_by == batch_id)
+        )
+        return result.all()
+
+    async def _deliver(self, messages: list) -> List[DeliveryResult]:
+        if self.backend != "smtp":
+            for message in messages:
+                logger.info(f"📧 Email à {message.recipient}: {message.subject}")
+            return [(message.id, None, False) for message in messages]
+
+        # One chunk per pooled connection, sent concurrently
+        chunks = [messages[i::self.pool.size] for i in range(min(self.pool.size, len(messages)))]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix="email-queue")
+        loop = asyncio.get_running_loop()
+        chunk_results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._send_chunk, chunk) for chunk in chunks
+        ))
+        return [result for results in chunk_results for result in results]
+
+    def _build_message(self, email_id: str, recipient: str, subject: str, html_body: str) -> str:
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = self.sender
+        message["To"] = recipient
+        message["Date"] = formatdate(localtime=True)
+        # Stable across retries, so a message resent after a crash can be deduplicated
+        message["Message-ID"] = f"<{email_id}@{self.sender.rpartition('@')[2] or 'pharmafinder'}>"
+        message.attach(MIMEText(html_body, "html", "utf-8"))
+        return message.as_string()
+
+    def _send_chunk(self, messages: list) -> List[DeliveryResult]:
+        """Send messages one after another over a single pooled connection (worker thread)"""
+        results: List[DeliveryResult] = []
+        connection, reused = None, False
+
+        for index, message in enumerate(messages):
+            payload = self._build_message(message.id, message.recipient, message.subject, message.html_body)
+            while True:
+                if connection is None:
+                    try:
+                        connection, reused = self.pool.acquire()
+                    except (smtplib.SMTPException, OSError) as e:
+                        # Server unreachable: the rest of the chunk is retried later
+                        results.extend((pending.id, f"connect: {e}", False) for pending in messages[index:])
+                        return results
+
+                try:
+                    connection.sendmail(self.sender, [message.recipient], payload)
+                    results.append((message.id, None, False))
+                except smtplib.SMTPRecipientsRefused as e:
+                    results.append((message.id, str(e.recipients), True))
+                except smtplib.SMTPResponseException as e:
+                    error = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else e.smtp_error
+                    results.append((message.id, f"{e.smtp_code} {error}", e.smtp_code >= 500))
+                except (smtplib.SMTPException, OSError) as e:
+                    self.pool.release(connection, reusable=False)
+                    connection = None
+                    if reused:
+                        # An idle connection the server closed meanwhile: resend on another
+                        continue
+                    results.append((message.id, str(e), False))
+                break
+
+        if connection is not None:
+            self.pool.release(connection)
+        return results
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.EMAIL_RETRY_MAX_SECONDS)
+        # Jitter spreads out retries of messages that failed together
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _record(self, db: AsyncSession, batch_id: str, results: List[DeliveryResult], attempts: Dict[str, int]):
+        now = datetime.utcnow()
+        claimed = OutboundEmail.claimed_by == batch_id
+
+        sent_ids = [email_id for email_id, error, _ in results if error is None]
+        if sent_ids:
+            await db.execute(
+                update(OutboundEmail)
+                .where(OutboundEmail.id.in_(sent_ids), claimed)
+                .values(
+                    status=OutboundEmailStatus.SENT, attempts=OutboundEmail.attempts + 1,
+                    sent_at=now, last_error=None, claimed_by=None, claimed_at=None
+                )
+                .execution_options(synchronize_session=False)
+            )
+            self._counters["sent"] += len(sent_ids)
+
+        for email_id, error, permanent in results:
+            if error is None:
+                continue
+            attempt = attempts[email_id] + 1
+            values = {"attempts": attempt, "last_error": error[:1000], "claimed_by": None, "claimed_at": None}
+            if permanent or attempt >= self.max_attempts:
+                values["status"] = OutboundEmailStatus.FAILED
+                self._counters["failed"] += 1
+                logger.error(f"Email {email_id} abandoned after {attempt} attempt(s): {error}")
+            else:
+                values["status"] = OutboundEmailStatus.PENDING
+                values["next_attempt_at"] = now + timedelta(seconds=self._retry_delay(attempt))
+                self._counters["retried"] += 1
+                logger.warning(f"Email {email_id} attempt {attempt} failed, will retry: {error}")
+            await db.execute(
+                update(OutboundEmail)
+                .where(OutboundEmail.id == email_id, claimed)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+
+        await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Delivery counters since startup"""
+        return {
+            **self._counters,
+            "backend": self.backend,
+            "smtp_connections_opened": self.pool.connections_opened,
+        }
+
+
+# Global email queue instance
+email_queue = EmailQueue()
@@ -0,0 +1,176 @@
+"""
+Leader-elected periodic jobs.
+
+Every uvicorn worker runs the scheduler, but each registered job runs in only
+one process at a time: the holder of its lease, a "lease:<job>" row in
+system_config holding the holder's id and an expiry time. The holder renews
+the lease every JOB_LEASE_RENEW_SECONDS; if it dies, the lease expires after
+JOB_LEASE_SECONDS and the next worker to try takes the job over and runs it
+straight away. Leases are taken with a compare-and-swap UPDATE on the row's
+previous value, so two workers cannot both win the same expired lease. Jobs
+of one scheduler can be led by different workers.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Text, cast, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import SystemConfig
+
+logger = logging.getLogger(__name__)
+
+LEASE_KEY_PREFIX = "lease:"
+
+
+class PeriodicJob(NamedTuple):
+    name: str
+    interval_seconds: float
+    run: Callable[[], Awaitable[object]]
+
+
+class JobScheduler:
+    """Runs registered periodic jobs in the worker holding their lease"""
+
+    def __init__(self, lease_seconds: Optional[int] = None, renew_seconds: Optional[int] = None):
+        self.lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+        self.renew_seconds = renew_seconds or settings.JOB_LEASE_RENEW_SECONDS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs: Dict[str, PeriodicJob] = {}
+        self._next_run: Dict[str, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._held: Dict[str, bool] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._running = False
+
+    def register(self, name: str, interval_seconds: float, run: Callable[[], Awaitable[object]]):
+        """Run `run` every interval_seconds in whichever worker leads the job"""
+        self._jobs[name] = PeriodicJob(name, interval_seconds, run)
+        self._next_run[name] = 0.0
+
+    async def _acquire(self, name: str) -> bool:
+        """Take or renew the lease of a job"""
+        key = f"{LEASE_KEY_PREFIX}{name}"
+        now = time.time()
+        lease = {"holder": self.worker_id, "expires_at": now + self.lease_seconds}
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(cast(SystemConfig.value, Text)).where(SystemConfig.key == key))
+            current = result.scalar_one_or_none()
+
+            if current is None:
+                db.add(SystemConfig(key=key, value=lease, description=f"Lease of the {name} background job"))
+                try:
+                    await db.commit()
+                    return True
+                except IntegrityError:
+                    # Another worker created it first
+                    await db.rollback()
+                    return False
+
+            holder = json.loads(current)
+            if holder.get("holder") != self.worker_id and holder.get("expires_at", 0) > now:
+                return False
+
+            result = await db.execute(
+                update(SystemConfig)
+                .where(SystemConfig.key == key, cast(SystemConfig.value, Text) == current)
+                .values(value=lease)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return result.rowcount == 1
+
+    async def _release(self, name: str):
+        """Expire a lease we hold so another worker can take the job at once"""
+        key = f"{LEASE_KEY_PREFIX}{name}"
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(cast(SystemConfig.value, Text)).where(SystemConfig.key == key))
+            current = result.scalar_one_or_none()
+            if current is None or json.loads(current).get("holder") != self.worker_id:
+                return
+            await db.execute(
+                update(SystemConfig)
+                .where(SystemConfig.key == key, cast(SystemConfig.value, Text) == current)
+                .values(value={"holder": None, "expires_at": 0})
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _run_job(self, job: PeriodicJob):
+        try:
+            await job.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in background job {job.name}: {str(e)}")
+
+    async def _tick(self):
+        """Renew leases, then start the due jobs we lead and stop the ones we lost"""
+        for name, job in self._jobs.items():
+            try:
+                held = await self._acquire(name)
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of background job {name}: {str(e)}")
+                held = False
+
+            if held != self._held.get(name, False):
+                logger.info(f"Worker {self.worker_id} {'now leads' if held else 'no longer leads'} background job {name}")
+                self._held[name] = held
+
+            task = self._tasks.get(name)
+            if not held:
+                if task is not None and not task.done():
+                    task.cancel()
+                # Whoever takes the job over next runs it straight away
+                self._next_run[name] = 0.0
+                continue
+
+            if (task is None or task.done()) and time.monotonic() >= self._next_run[name]:
+                self._next_run[name] = time.monotonic() + job.interval_seconds
+                self._tasks[name] = asyncio.create_task(self._run_job(job))
+
+    async def run(self):
+        """Coordinate the registered jobs until stop() is called"""
+        self._running = True
+        self._wake = asyncio.Event()
+        logger.info(f"Starting background job scheduler as {self.worker_id}...")
+
+        while self._running:
+            await self._tick()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.renew_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        """Stop the running jobs and hand their leases over"""
+        self._running = False
+        if self._wake is not None:
+            self._wake.set()
+        for task in self._tasks.values():
+            task.cancel()
+        for name, held in self._held.items():
+            if held:
+                try:
+                    await self._release(name)
+                except Exception as e:
+                    logger.warning(f"Could not release the lease of background job {name}: {str(e)}")
+        self._held.clear()
+        logger.info("Stopping background job scheduler...")
+
+    def stats(self) -> Dict[str, object]:
+        leading: List[str] = [name for name, held in self._held.items() if held]
+        return {"worker": self.worker_id, "jobs": sorted(self._jobs), "leading": sorted(leading)}
+
+
+# Global background job scheduler instance
+job_scheduler = JobScheduler()
@@ -0,0 +1,216 @@
+"""
+Per-user unread notification counters.
+
+The notification badge is polled constantly, so instead of counting unread
+rows on every poll, user_notification_counters holds each user's unread count.
+It is adjusted in the transaction that writes the notifications: once per
+flush with the changes collected by the ORM hooks in app.models, and
+explicitly by the bulk statements that bypass them (marking as read,
+deleting, the expiry job's multi-row insert). A user without a counter row
+(tables created by create_all rather than migration 013) gets one counted
+from the notifications table on their next notification write. Reads go
+through a short per-process cache, dropped as soon as this process changes
+the user's count; a periodic leader-elected job recounts from the
+notifications table and corrects any drift.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, case, event, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models import Notification, UserNotificationCounter
+
+PENDING_INVALIDATIONS_KEY = "invalidated_unread_counts"
+PENDING_DELTAS_KEY = "unread_count_deltas"
+
+counters = UserNotificationCounter.__table__
+notifications = Notification.__table__
+
+
+def adjust_unread_counts(connection, deltas: Dict[str, int], session: Optional[Session] = None):
+    """Apply per-user deltas of notification writes already executed in the caller's transaction.
+
+    A missing counter row is inserted with the user's unread count, which
+    already includes those writes; existing rows take the delta.
+    """
+    changes = [
+        {"counter_user_id": user_id, "unread_delta": delta} for user_id, delta in deltas.items() if user_id and delta
+    ]
+    if not changes:
+        return
+
+    user_id, delta = bindparam("counter_user_id"), bindparam("unread_delta")
+    unread = (
+        select(func.count())
+        .select_from(notifications)
+        .where(notifications.c.user_id == user_id, notifications.c.is_read == False)
+        .scalar_subquery()
+    )
+    statement = dialect_insert(connection.dialect.name)(counters).values(user_id=user_id, unread_count=unread)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[counters.c.user_id],
+            set_={
+                "unread_count": case(
+                    (counters.c.unread_count + delta < 0, 0), else_=counters.c.unread_count + delta
+                ),
+                "updated_at": func.now()
+            }
+        ),
+        changes
+    )
+
+    user_ids = [change["counter_user_id"] for change in changes]
+    unread_count_cache.invalidate(*user_ids)
+    if session is not None:
+        session.info.setdefault(PENDING_INVALIDATIONS_KEY, set()).update(user_ids)
+
+
+def queue_unread_change(session: Session, user_id: Optional[str], delta: int):
+    """Record a notification object's effect on its user's count, applied at the end of the flush"""
+    if user_id:
+        session.info.setdefault(PENDING_DELTAS_KEY, Counter())[user_id] += delta
+
+
+async def record_unread_changes(db: AsyncSession, deltas: Dict[str, int]):
+    """adjust_unread_counts for an async session, after statements that bypass the ORM hooks"""
+    await db.run_sync(lambda session: adjust_unread_counts(session.connection(), deltas, session))
+
+
+class UnreadCountCache:
+    """LRU of unread counts with a time-to-live"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.NOTIFICATION_COUNT_CACHE_TTL_SECONDS
+        self.max_size = max_size if max_size is not None else settings.NOTIFICATION_COUNT_CACHE_SIZE
+        self._entries: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        # ORM hooks may invalidate from a worker thread (sync sessions)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            cached_at, count = entry
+            if time.monotonic() - cached_at > self.ttl_seconds:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return count
+
+    def put(self, user_id: str, count: int):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), count)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids: str):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global unread count cache instance
+unread_count_cache = UnreadCountCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_flushed_changes(session, flush_context):
+    """Apply the hooks' deltas once every statement of the flush has run"""
+    deltas = session.info.pop(PENDING_DELTAS_KEY, None)
+    if deltas:
+        adjust_unread_counts(session.connection(), deltas, session)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_counts(session):
+    """Invalidate again once the counter changes are committed (see app.services.user_cache)"""
+    user_ids = session.info.pop(PENDING_INVALIDATIONS_KEY, None)
+    if user_ids:
+        unread_count_cache.invalidate(*user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_counts(session):
+    session.info.pop(PENDING_INVALIDATIONS_KEY, None)
+    session.info.pop(PENDING_DELTAS_KEY, None)
+
+
+async def get_unread_count(db: AsyncSession, user_id: str) -> int:
+    """Unread notifications of a user, from the cache or the counter row"""
+    count = unread_count_cache.get(user_id)
+    if count is not None:
+        return count
+
+    result = await db.execute(select(counters.c.unread_count).where(counters.c.user_id == user_id))
+    count = result.scalar_one_or_none()
+    if count is None:
+        # No counter yet: count through the (user_id, is_read, created_at) index
+        result = await db.execute(
+            select(func.count()).select_from(notifications).where(
+                notifications.c.user_id == user_id,
+                notifications.c.is_read == False
+            )
+        )
+        count = result.scalar_one()
+
+    unread_count_cache.put(user_id, count)
+    return count
+
+
+async def reconcile_unread_counts() -> int:
+    """Correct counters that drifted from the notifications table; returns how many"""
+    actual = (
+        select(func.count())
+        .select_from(notifications)
+        .where(notifications.c.user_id == counters.c.user_id, notifications.c.is_read == False)
+        .scalar_subquery()
+    )
+    corrected = 0
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(counters.c.user_id, counters.c.unread_count, actual).where(counters.c.unread_count != actual)
+        )
+        for user_id, seen, count in result.all():
+            # Only if unchanged since read: a concurrent write will be checked on the next run
+            result = await db.execute(
+                update(counters)
+                .where(counters.c.user_id == user_id, counters.c.unread_count == seen)
+                .values(unread_count=count)
+            )
+            corrected += result.rowcount
+
+        result = await db.execute(
+            select(notifications.c.user_id, func.count())
+            .select_from(notifications.outerjoin(counters, counters.c.user_id == notifications.c.user_id))
+            .where(
+                notifications.c.is_read == False,
+                notifications.c.user_id.is_not(None),
+                counters.c.user_id.is_(None)
+            )
+            .group_by(notifications.c.user_id)
+        )
+        missing = [{"user_id": user_id, "unread_count": count} for user_id, count in result.all()]
+        if missing:
+            statement = dialect_insert(db.bind.dialect.name)(counters)
+            await db.execute(statement.on_conflict_do_nothing(index_elements=[counters.c.user_id]), missing)
+            corrected += len(missing)
+
+        await db.commit()
+
+    if corrected:
+        unread_count_cache.clear()
+    return corrected
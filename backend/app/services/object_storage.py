@@ -0,0 +1,138 @@
+"""
+Object storage for order prescription images.
+
+Two backends share one interface: "local" (the default, also used in tests)
+writes objects under OBJECT_STORAGE_DIR, and "s3" uploads them to
+AWS_S3_BUCKET through one long-lived boto3 client, whose blocking multipart
+transfer runs on a worker thread instead of the event loop. Objects are read
+through short-lived download URLs: S3 presigned URLs, or for the local backend
+/storage URLs signed with SECRET_KEY, so API handlers hand out links rather
+than passing image bytes through.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import UploadFile
+
+from app.config import settings
+from app.uploads import UploadTooLarge, stream_to_temporary_file
+
+
+class LocalObjectStorage:
+    """Objects stored as files, served by the signed /storage route"""
+
+    def __init__(self, directory: Optional[str] = None, secret: Optional[str] = None):
+        self.directory = directory or settings.OBJECT_STORAGE_DIR
+        self.secret = (secret or settings.SECRET_KEY).encode()
+
+    def path_of(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.directory, key))
+        if not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    async def put(self, key: str, file: UploadFile, content_type: str, max_size: int) -> int:
+        """Store an upload under key; returns its size, raises UploadTooLarge past max_size bytes"""
+        path = self.path_of(key)
+        directory = os.path.dirname(path)
+        temporary_path, size, _ = await stream_to_temporary_file(file, directory, max_size)
+        os.replace(temporary_path, path)
+        return size
+
+    def _signature(self, key: str, expires: int) -> str:
+        return hmac.new(self.secret, f"{key}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def download_url(self, key: str, expires_in: Optional[int] = None) -> str:
+        expires = int(time.time()) + (expires_in or settings.OBJECT_STORAGE_URL_EXPIRES_SECONDS)
+        query = urlencode({"expires": expires, "signature": self._signature(key, expires)})
+        return f"/storage/{quote(key)}?{query}"
+
+    def verify(self, key: str, expires: int, signature: str) -> bool:
+        """Whether a /storage URL was signed by us and has not expired"""
+        return expires >= time.time() and hmac.compare_digest(self._signature(key, expires), signature)
+
+    async def close(self):
+        pass
+
+
+class S3ObjectStorage:
+    """Objects stored in an S3 bucket through a shared client"""
+
+    def __init__(self, bucket: Optional[str] = None, region: Optional[str] = None):
+        self.bucket = bucket or settings.AWS_S3_BUCKET
+        self.region = region or settings.AWS_S3_REGION
+        self._client = None
+        self._transfer_config = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        # boto3 clients are thread-safe; one client keeps its connection pool across uploads
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from boto3.s3.transfer import TransferConfig
+                    from botocore.config import Config
+
+                    self._client = boto3.client(
+                        "s3",
+                        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                        region_name=self.region,
+                        config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS)
+                    )
+                    self._transfer_config = TransferConfig(
+                        multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+                        multipart_chunksize=settings.S3_MULTIPART_THRESHOLD,
+                        max_concurrency=settings.S3_MULTIPART_CONCURRENCY
+                    )
+        return self._client
+
+    async def put(self, key: str, file: UploadFile, content_type: str, max_size: int) -> int:
+        """Upload to the bucket under key; returns its size, raises UploadTooLarge past max_size bytes"""
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+        if size > max_size:
+            raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+
+        client = self._get_client()
+        await asyncio.to_thread(
+            client.upload_fileobj,
+            file.file,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type},
+            Config=self._transfer_config
+        )
+        return size
+
+    def download_url(self, key: str, expires_in: Optional[int] = None) -> str:
+        # Presigning is computed locally, without a request to S3
+        return self._get_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in or settings.OBJECT_STORAGE_URL_EXPIRES_SECONDS
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await asyncio.to_thread(self._client.close)
+            self._client = None
+
+
+def create_object_storage():
+    """The backend selected by OBJECT_STORAGE_BACKEND"""
+    if settings.OBJECT_STORAGE_BACKEND == "s3":
+        return S3ObjectStorage()
+    return LocalObjectStorage()
+
+
+# Global object storage instance
+object_storage = create_object_storage()
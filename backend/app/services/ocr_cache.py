@@ -0,0 +1,160 @@
+"""
+OCR result cache for /vision/analyze.
+
+Users scan the same boxes again and again; results are cached by image content
+so a repeated scan does not go back to the Vision API. Keys are either the
+SHA-256 of the decoded image (exact bytes) or a 64-bit difference hash of its
+9x8 grayscale thumbnail, which also matches the same picture re-encoded or
+resized by the client. Entries live in an in-memory LRU and, when
+VISION_CACHE_DIR is set, in JSON files there that survive restarts and are
+shared by workers.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+OCRResult = Tuple[str, float]
+
+
+def difference_hash(image_bytes: bytes) -> Optional[str]:
+    """64-bit dHash of an image as 16 hex digits, None if it cannot be decoded"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("L", (64, 64))
+        pixels = list(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+
+class OCRCache:
+    """In-memory LRU of OCR results, optionally backed by a directory"""
+
+    def __init__(self, max_size: Optional[int] = None, key_type: Optional[str] = None, directory: Optional[str] = None):
+        self.max_size = max_size if max_size is not None else settings.VISION_CACHE_SIZE
+        self.key_type = key_type or settings.VISION_CACHE_KEY
+        self.directory = directory if directory is not None else settings.VISION_CACHE_DIR
+        self._entries: "OrderedDict[str, OCRResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._counters: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    async def key_for(self, image_bytes: bytes) -> Optional[str]:
+        """Cache key of an image (None when a perceptual key cannot be computed)"""
+        if self.key_type == "dhash":
+            image_hash = await asyncio.to_thread(difference_hash, image_bytes)
+            return f"dhash-{image_hash}" if image_hash else None
+        return f"sha256-{hashlib.sha256(image_bytes).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[OCRResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return result
+
+        if self.directory:
+            result = await asyncio.to_thread(self._read, key)
+            if result is not None:
+                self._remember(key, result)
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return result
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, result: OCRResult):
+        self._remember(key, result)
+        if self.directory:
+            await asyncio.to_thread(self._write, key, result)
+
+    def _remember(self, key: str, result: OCRResult):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[-2:], f"{key}.json")
+
+    def _read(self, key: str) -> Optional[OCRResult]:
+        try:
+            with open(self._path(key), encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+            return entry["detected_text"], entry["confidence"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable OCR cache entry {key}: {e}")
+            return None
+
+    def _write(self, key: str, result: OCRResult):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as cache_file:
+                json.dump({"detected_text": result[0], "confidence": result[1]}, cache_file)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write OCR cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % 100 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop the least recently written files beyond VISION_CACHE_DISK_MAX_ENTRIES"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        files.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        excess = len(files) - settings.VISION_CACHE_DISK_MAX_ENTRIES
+        if excess > 0:
+            for _, path in sorted(files)[:excess]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {**self._counters, "entries": len(self._entries), "key": self.key_type, "disk": bool(self.directory)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global OCR result cache instance
+ocr_cache = OCRCache()
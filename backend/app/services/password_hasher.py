@@ -0,0 +1,133 @@
+"""
+Password hashing off the event loop.
+
+bcrypt deliberately takes 100-300 ms per hash or verification. Run inline in
+an async handler it stalls every other request on the worker, so hashing runs
+on a small dedicated thread pool instead (bcrypt releases the GIL). The number
+of operations waiting for the pool is bounded: past that, callers wait a short
+while for a slot and then get PasswordHasherBusy, rather than queueing
+unboundedly during a login burst.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue stays full for longer than the wait timeout"""
+
+
+class PasswordHasher:
+    """Bounded thread pool running passlib bcrypt operations, with counters"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        wait_timeout: Optional[float] = None,
+        rounds: Optional[int] = None
+    ):
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS
+        self.max_pending = max_pending or settings.PASSWORD_HASH_MAX_PENDING
+        self.wait_timeout = wait_timeout if wait_timeout is not None else settings.PASSWORD_HASH_WAIT_SECONDS
+        # Hashes made with a different cost factor are reported by
+        # verify_and_update() so they can be upgraded on login
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__rounds=rounds or settings.BCRYPT_ROUNDS
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._counters: Dict[str, float] = {
+            "hashes": 0,
+            "verifications": 0,
+            "rehashes": 0,
+            "rejected": 0,
+            "queue_wait_seconds": 0.0,
+            "run_seconds": 0.0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, counter: str, function: Callable[..., T], *args) -> T:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._counters["rejected"] += 1
+            logger.warning(f"Password hashing queue full ({self.max_pending} pending), rejecting request")
+            raise PasswordHasherBusy()
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+
+            def timed():
+                started_at = time.perf_counter()
+                return function(*args), started_at, time.perf_counter()
+
+            # Counters are only updated here, on the event loop thread
+            result, started_at, finished_at = await loop.run_in_executor(self._get_executor(), timed)
+            self._counters[counter] += 1
+            self._counters["queue_wait_seconds"] += started_at - queued_at
+            self._counters["run_seconds"] += finished_at - started_at
+            return result
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with the configured cost factor"""
+        return await self._run("hashes", self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """Check a password against a stored hash"""
+        return await self._run("verifications", self.context.verify, password, password_hash)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """Check a password; also returns a new hash if the stored one uses an outdated cost factor"""
+        valid, new_hash = await self._run(
+            "verifications", self.context.verify_and_update, password, password_hash
+        )
+        if new_hash is not None:
+            self._counters["rehashes"] += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, float]:
+        """Counters since startup, plus current pool occupancy"""
+        completed = self._counters["hashes"] + self._counters["verifications"]
+        return {
+            **self._counters,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+            "average_run_ms": round(self._counters["run_seconds"] * 1000 / completed, 2) if completed else 0.0,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads (waits for running operations)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Global password hasher instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,176 @@
+"""
+In-process spatial index over active, verified pharmacies.
+
+The pharmacy set changes rarely, so proximity lookups are answered from an
+immutable uniform-grid snapshot held in memory. A new snapshot is built and
+swapped in whenever a pharmacy is created or updated (and after a TTL, so that
+changes made by other worker processes are picked up).
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.geo import bounding_box, haversine_km
+from app.models import Pharmacy
+
+logger = logging.getLogger(__name__)
+
+GRID_CELL_DEGREES = 0.05  # ~5.5km cells
+MAX_GRID_CELLS_SCANNED = 10000  # Above this a linear scan is cheaper
+EARTH_HALF_CIRCUMFERENCE_KM = 20038.0
+
+
+class PharmacyPoint:
+    """Location of a pharmacy in the index"""
+
+    __slots__ = ("id", "latitude", "longitude")
+
+    def __init__(self, id: str, latitude: float, longitude: float):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class PharmacySpatialIndex:
+    """Immutable uniform grid of pharmacy points"""
+
+    def __init__(self, points: Iterable[PharmacyPoint], cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.points: Dict[str, PharmacyPoint] = {}
+        cells = defaultdict(list)
+        for point in points:
+            self.points[point.id] = point
+            cells[self._cell(point.latitude, point.longitude)].append(point)
+        self._cells = {key: tuple(cell_points) for key, cell_points in cells.items()}
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __contains__(self, pharmacy_id: str) -> bool:
+        return pharmacy_id in self.points
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def _candidates(self, latitude: float, longitude: float, radius_km: float) -> Iterable[PharmacyPoint]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > min(MAX_GRID_CELLS_SCANNED, len(self._cells) * 4):
+            return self.points.values()
+
+        candidates = []
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                candidates.extend(self._cells.get((row, col), ()))
+        return candidates
+
+    def within_radius(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """(pharmacy_id, distance_km) pairs strictly within radius_km, nearest first"""
+        excluded = set(exclude or ())
+        matches = []
+        for point in self._candidates(latitude, longitude, radius_km):
+            if point.id in excluded:
+                continue
+            distance = haversine_km(latitude, longitude, point.latitude, point.longitude)
+            if distance < radius_km:
+                matches.append((point.id, distance))
+
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        max_distance_km: Optional[float] = None,
+        exclude: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """The k nearest (pharmacy_id, distance_km) pairs, optionally bounded by max_distance_km"""
+        limit = max_distance_km if max_distance_km is not None else EARTH_HALF_CIRCUMFERENCE_KM
+        radius = min(self.cell_degrees * 111.32, limit)
+
+        # Every point within the radius is returned, so once k are found they are the k nearest
+        while True:
+            matches = self.within_radius(latitude, longitude, radius, exclude=exclude)
+            if len(matches) >= k or radius >= limit:
+                return matches[:k]
+            radius = min(radius * 2, limit)
+
+    def distance_to(self, pharmacy_id: str, latitude: float, longitude: float) -> Optional[float]:
+        """Distance from a point to an indexed pharmacy, None if not indexed"""
+        point = self.points.get(pharmacy_id)
+        if point is None:
+            return None
+        return haversine_km(latitude, longitude, point.latitude, point.longitude)
+
+
+class PharmacyLocator:
+    """Holds the current spatial index snapshot and rebuilds it on demand"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PHARMACY_INDEX_TTL_SECONDS
+        self._index: Optional[PharmacySpatialIndex] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        index = self._index
+        return index is not None and time.monotonic() - index.built_at <= self.ttl_seconds
+
+    async def get_index(self, db: AsyncSession) -> PharmacySpatialIndex:
+        """Return the current snapshot, building it on first use or once stale"""
+        if not self._is_fresh():
+            async with self._lock:
+                # Requests that queued behind a rebuild use its result
+                if not self._is_fresh():
+                    await self._rebuild(db)
+        return self._index
+
+    async def rebuild(self, db: AsyncSession) -> PharmacySpatialIndex:
+        """Load active, verified pharmacies and atomically swap in a new snapshot.
+
+        Always queries, for callers that just changed a pharmacy.
+        """
+        async with self._lock:
+            return await self._rebuild(db)
+
+    async def _rebuild(self, db: AsyncSession) -> PharmacySpatialIndex:
+        result = await db.execute(
+            select(Pharmacy.id, Pharmacy.latitude, Pharmacy.longitude).where(
+                Pharmacy.is_active == True,
+                Pharmacy.is_verified == True,
+                Pharmacy.latitude.is_not(None),
+                Pharmacy.longitude.is_not(None)
+            )
+        )
+        index = PharmacySpatialIndex(
+            PharmacyPoint(pharmacy_id, float(latitude), float(longitude))
+            for pharmacy_id, latitude, longitude in result.all()
+        )
+        self._index = index
+        logger.info(f"Rebuilt pharmacy spatial index with {len(index)} pharmacies")
+        return index
+
+    def invalidate(self):
+        """Drop the current snapshot; the next lookup rebuilds it"""
+        self._index = None
+
+
+# Global pharmacy locator instance
+pharmacy_locator = PharmacyLocator()
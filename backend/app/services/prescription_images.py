@@ -0,0 +1,184 @@
+"""
+Web-sized derivatives of uploaded prescription images.
+
+Pharmacists review prescriptions from phone photos of several megabytes. After
+an upload, a thumbnail (for lists), a preview (for the review screen) and a
+full-size copy (linked as the original) are rendered as WebP on a process pool, so image decoding and resizing neither
+block the event loop nor compete for the GIL, and their URLs are recorded on
+the PrescriptionRequest. Derivatives are written without EXIF metadata (which
+can include the GPS position where the photo was taken), after applying the
+EXIF orientation; the uploaded file itself is only kept for storage and is not
+linked to. PDFs are left as they are. Derivatives are named after the
+source file, which is content-addressed, so a document uploaded again reuses
+the ones already rendered. Files that cannot be rendered are flagged with
+derivatives_failed, and a periodic job re-renders pending requests whose
+derivatives were lost (e.g. with a restarted worker).
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import func, or_, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import PrescriptionRequest, PrescriptionStatus
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = "uploads/prescriptions/derived"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+WEBP_MAX_SIZE = 16383  # Largest side WebP can encode, so "full" keeps the original resolution
+
+# variant -> (longest side in pixels, WebP quality)
+VARIANTS = {
+    "thumbnail": (settings.PRESCRIPTION_THUMBNAIL_SIZE, 70),
+    "preview": (settings.PRESCRIPTION_PREVIEW_SIZE, 80),
+    "full": (WEBP_MAX_SIZE, 90),
+}
+
+
+def render_derivatives(source_path: str, output_dir: str, stem: str) -> Optional[Dict[str, str]]:
+    """Write the WebP variants of an image; returns {variant: filename}, None if not an image.
+
+    Runs in a worker process.
+    """
+    try:
+        with Image.open(source_path) as original:
+            original.draft("RGB", (max(size for size, _ in VARIANTS.values()),) * 2)
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        logger.warning(f"Cannot render derivatives of {source_path}: {e}")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = {}
+    # Largest first, so each variant is resized from the previous one
+    for variant, (size, quality) in sorted(VARIANTS.items(), key=lambda item: -item[1][0]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        filename = f"{stem}_{variant}.webp"
+        path = os.path.join(output_dir, filename)
+        temporary_path = f"{path}.part"
+        # No exif= argument: the metadata is not carried over
+        image.save(temporary_path, format="WEBP", quality=quality, method=4)
+        os.replace(temporary_path, path)
+        filenames[variant] = filename
+    return filenames
+
+
+class PrescriptionImagePipeline:
+    """Renders prescription image derivatives in the background"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.PRESCRIPTION_IMAGE_WORKERS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._rendering: Set[str] = set()  # Prescription request ids with a render in progress
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def schedule(self, prescription_request_id: str, source_path: str):
+        """Start rendering the derivatives of a committed upload"""
+        if os.path.splitext(source_path)[1].lower() not in IMAGE_EXTENSIONS:
+            return
+        if prescription_request_id in self._rendering:
+            return
+        self._rendering.add(prescription_request_id)
+        task = asyncio.create_task(self.process(prescription_request_id, source_path))
+        # Keep a reference until done so the task is not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def process(self, prescription_request_id: str, source_path: str):
+        """Render the derivatives and record their URLs on the prescription request"""
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        try:
+            filenames = {variant: f"{stem}_{variant}.webp" for variant in VARIANTS}
+            if not all(os.path.exists(os.path.join(DERIVED_DIR, filename)) for filename in filenames.values()):
+                loop = asyncio.get_running_loop()
+                try:
+                    filenames = await loop.run_in_executor(
+                        self._get_executor(), render_derivatives, source_path, DERIVED_DIR, stem
+                    )
+                except BrokenProcessPool:
+                    # A worker process died: start a new pool and leave the request to the re-render job
+                    self._executor = None
+                    raise
+                except Exception as e:
+                    logger.warning(f"Cannot render derivatives of {source_path}: {str(e)}")
+                    filenames = None
+
+            if filenames:
+                values = dict(
+                    thumbnail_url=f"/{DERIVED_DIR}/{filenames['thumbnail']}",
+                    preview_url=f"/{DERIVED_DIR}/{filenames['preview']}",
+                    full_size_url=f"/{DERIVED_DIR}/{filenames['full']}",
+                    derivatives_failed=False
+                )
+            else:
+                # Terminal: the review screen offers the document for download instead of a preview
+                values = dict(derivatives_failed=True)
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(PrescriptionRequest)
+                    .where(PrescriptionRequest.id == prescription_request_id)
+                    .values(**values)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error rendering derivatives of prescription {prescription_request_id}: {str(e)}")
+        finally:
+            self._rendering.discard(prescription_request_id)
+
+    async def rerender_missing(self) -> Dict[str, int]:
+        """Render the derivatives of pending image uploads that have none, e.g. lost with a restarted worker"""
+        # Uploads within the grace period may still be rendering in the worker that received them
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.PRESCRIPTION_IMAGE_RERENDER_GRACE_SECONDS)
+        image_url = func.lower(PrescriptionRequest.prescription_image_url)
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(PrescriptionRequest.id, PrescriptionRequest.prescription_image_url)
+                .where(
+                    PrescriptionRequest.status == PrescriptionStatus.PENDING,
+                    PrescriptionRequest.preview_url.is_(None),
+                    PrescriptionRequest.derivatives_failed.is_(False),
+                    PrescriptionRequest.created_at < cutoff,
+                    or_(*[image_url.like(f"%{extension}") for extension in sorted(IMAGE_EXTENSIONS)])
+                )
+                .order_by(PrescriptionRequest.created_at)
+                .limit(settings.PRESCRIPTION_IMAGE_RERENDER_BATCH)
+            )
+            missing = [
+                (prescription_request_id, url) for prescription_request_id, url in result.all()
+                if prescription_request_id not in self._rendering
+            ]
+        self._rendering.update(prescription_request_id for prescription_request_id, _ in missing)
+
+        # URLs are the upload paths with a leading slash
+        await asyncio.gather(*[
+            self.process(prescription_request_id, url.lstrip("/")) for prescription_request_id, url in missing
+        ])
+        if missing:
+            logger.info(f"Re-rendered the derivatives of {len(missing)} prescription requests")
+        return {"rerendered": len(missing)}
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global prescription image pipeline instance
+prescription_image_pipeline = PrescriptionImagePipeline()
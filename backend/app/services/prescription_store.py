@@ -0,0 +1,200 @@
+"""
+Content-addressed storage of prescription files.
+
+The same ordonnance is uploaded again for each pharmacy it is retried with and
+for each product it covers. Files are therefore stored once, under the SHA-256
+of their content (blobs/ab/cd/<sha256><ext>): an upload is streamed and hashed
+to a temporary file, which is dropped when the blob already exists, so disk
+usage, derivative rendering and the permanent copy scale with unique documents.
+
+prescription_files counts, per stored file, the prescription requests whose
+prescription_image_url points at it (maintained by ORM hooks in app.models). A
+periodic sweep recounts the references of files untouched for the grace
+period, since database-level cascades bypass the hooks, and deletes the
+unreferenced ones with their derivatives, as well as files on disk whose
+request was never committed. Files uploaded before content addressing are not
+tracked and are left alone.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import delete, func, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models import PrescriptionFile, PrescriptionRequest
+from app.services.prescription_images import DERIVED_DIR, VARIANTS
+from app.uploads import StoredUpload, stream_to_temporary_file
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads/prescriptions"
+BLOB_DIR = f"{UPLOAD_DIR}/blobs"
+BLOB_URL_PREFIX = f"/{BLOB_DIR}/"
+
+files = PrescriptionFile.__table__
+requests = PrescriptionRequest.__table__
+
+
+def blob_filename(sha256: str, extension: str) -> str:
+    """Path of a blob relative to BLOB_DIR"""
+    return os.path.join(sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+def adjust_file_references(connection, url: Optional[str], delta: int, size: Optional[int] = None):
+    """Add delta to the reference count of a stored file, in the caller's flush"""
+    if not url or not url.startswith(BLOB_URL_PREFIX):
+        return
+    now = datetime.utcnow()
+    if delta <= 0:
+        connection.execute(
+            update(files)
+            .where(files.c.url == url)
+            .values(reference_count=files.c.reference_count + delta, updated_at=now)
+        )
+        return
+
+    # An upsert, so concurrent first references to the same blob cannot both insert its row
+    statement = dialect_insert(connection.dialect.name)(files).values(
+        url=url,
+        sha256=os.path.splitext(os.path.basename(url))[0],
+        size=size,
+        reference_count=delta,
+        created_at=now,
+        updated_at=now
+    )
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[files.c.url],
+            set_={"reference_count": files.c.reference_count + delta, "updated_at": now}
+        )
+    )
+
+
+class PrescriptionFileStore:
+    """Stores prescription uploads by content and collects unreferenced files"""
+
+    def __init__(self, directory: str = BLOB_DIR, grace_seconds: Optional[int] = None):
+        self.directory = directory
+        self.grace_seconds = grace_seconds if grace_seconds is not None else settings.PRESCRIPTION_GC_GRACE_SECONDS
+
+    async def save(self, file: UploadFile, extension: str, max_size: int) -> StoredUpload:
+        """Stream an upload into the store; filename is relative to UPLOAD_DIR.
+
+        Raises UploadTooLarge past max_size bytes.
+        """
+        temporary_path, size, sha256 = await stream_to_temporary_file(file, self.directory, max_size)
+        filename = blob_filename(sha256, extension)
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path):
+            os.remove(temporary_path)
+            # A fresh mtime keeps the sweep off a blob that is about to be referenced again
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary_path, path)
+        return StoredUpload(
+            filename=os.path.relpath(path, UPLOAD_DIR).replace(os.sep, "/"),
+            path=path,
+            size=size,
+            sha256=sha256
+        )
+
+    def _path_of(self, url: str) -> str:
+        return os.path.join(self.directory, url[len(BLOB_URL_PREFIX):])
+
+    async def collect_garbage(self) -> Dict[str, int]:
+        """Delete the files no prescription request refers to any more"""
+        started = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+
+        async with AsyncSessionLocal() as db:
+            reference_count = func.count(requests.c.id)
+            result = await db.execute(
+                select(files.c.url, files.c.reference_count, reference_count)
+                .select_from(files.outerjoin(requests, requests.c.prescription_image_url == files.c.url))
+                .where(files.c.updated_at < cutoff)
+                .group_by(files.c.url, files.c.reference_count)
+            )
+
+            unreferenced = []
+            for url, counted, actual in result.all():
+                if actual == 0:
+                    unreferenced.append(url)
+                elif actual != counted:
+                    # Keep updated_at: only the hooks mark a file as recently referenced
+                    await db.execute(
+                        update(files)
+                        .where(files.c.url == url, files.c.updated_at < cutoff)
+                        .values(reference_count=actual, updated_at=files.c.updated_at)
+                    )
+
+            removed_urls = []
+            for url in unreferenced:
+                # The updated_at condition skips files referenced since they were counted
+                result = await db.execute(
+                    delete(files).where(files.c.url == url, files.c.updated_at < cutoff)
+                )
+                if result.rowcount:
+                    removed_urls.append(url)
+            await db.commit()
+
+            result = await db.execute(select(files.c.url, files.c.sha256))
+            known = result.all()
+
+        known_urls = {url for url, _ in known}
+        known_hashes = {sha256 for _, sha256 in known}
+        removed, orphans = await asyncio.to_thread(
+            self._remove_files, removed_urls, known_urls, known_hashes, cutoff.timestamp()
+        )
+        if removed or orphans:
+            logger.info(
+                f"Deleted {removed} unreferenced and {orphans} orphaned prescription files "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+        return {"unreferenced": removed, "orphaned": orphans}
+
+    def _remove_files(
+        self, urls: Iterable[str], known_urls: Set[str], known_hashes: Set[str], cutoff: float
+    ) -> Tuple[int, int]:
+        """Delete the given blobs and any untracked file older than cutoff"""
+        removed = sum(self._remove_blob(self._path_of(url), known_hashes, cutoff) for url in urls)
+
+        orphans = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith(".part"):
+                    # Left behind by an upload interrupted mid-stream
+                    orphans += self._remove_blob(path, known_hashes, cutoff, derivatives=False)
+                    continue
+                url = BLOB_URL_PREFIX + os.path.relpath(path, self.directory).replace(os.sep, "/")
+                if url not in known_urls:
+                    orphans += self._remove_blob(path, known_hashes, cutoff)
+        return removed, orphans
+
+    def _remove_blob(self, path: str, known_hashes: Set[str], cutoff: float, derivatives: bool = True) -> int:
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                return 0
+            os.remove(path)
+        except OSError:
+            return 0
+
+        sha256 = os.path.splitext(os.path.basename(path))[0]
+        if derivatives and sha256 not in known_hashes:
+            for variant in VARIANTS:
+                try:
+                    os.remove(os.path.join(DERIVED_DIR, f"{sha256}_{variant}.webp"))
+                except OSError:
+                    pass
+        return 1
+
+
+# Global prescription file store instance
+prescription_store = PrescriptionFileStore()
@@ -0,0 +1,215 @@
+"""
+Matching of OCR text from scanned packaging to catalog products.
+
+The words of each product's name, active ingredient, generic name, dosage and
+manufacturer are indexed in memory by character trigram. OCR text is cut into
+words (a number followed by a unit, such as "500 mg", is joined into one
+dosage word). Each word is compared, by trigram Jaccard similarity, to the
+indexed words that share a trigram with it, which tolerates OCR misreads such
+as "parac3tamol". A product scores the weighted share of its fields' words
+that were found, so "Doliprane 1000mg" outranks "Doliprane 500mg" when the box
+says 1000 mg. The index is reloaded after PRODUCT_INDEX_TTL_SECONDS so that
+products written by other worker processes or by scripts are matched.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Product
+from app.search_index import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# Relative importance of the fields a product is matched on
+FIELD_WEIGHTS = {
+    "name": 1.0,
+    "active_ingredient": 0.6,
+    "generic_name": 0.6,
+    "dosage": 0.4,
+    "manufacturer": 0.2,
+}
+# Fields that must match for a product to be a candidate at all
+IDENTIFYING_FIELDS = ("name", "active_ingredient", "generic_name")
+UNITS = {"mg", "g", "mcg", "ug", "ml", "l", "ui", "iu", "%"}
+MIN_WORD_SIMILARITY = 0.5
+
+TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)?|[a-z]+|%")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Normalized words of a text, with "500 mg" joined into "500mg" """
+    tokens = TOKEN_PATTERN.findall(normalize_search_text(text))
+    words = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token[0].isdigit() and i + 1 < len(tokens) and tokens[i + 1] in UNITS:
+            words.append(token.replace(",", ".") + tokens[i + 1])
+            i += 2
+            continue
+        if len(token) > 1 or token.isdigit():
+            words.append(token)
+        i += 1
+    return words
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductMatchIndex:
+    """Trigram index of the words of product fields"""
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        # word -> (product_id, field) occurrences
+        self._postings: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self._trigram_words: Dict[str, Set[str]] = defaultdict(set)
+        self._word_trigrams: Dict[str, Set[str]] = {}
+        # product_id -> field -> distinct words
+        self._fields: Dict[str, Dict[str, Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add_product(self, product_id: str, name: str, **fields: Optional[str]):
+        """Insert or refresh a product (fields: generic_name, active_ingredient, dosage, manufacturer)"""
+        self.remove_product(product_id)
+        product_fields = {}
+        for field, value in {"name": name, **fields}.items():
+            words = set(tokenize(value))
+            if not words:
+                continue
+            product_fields[field] = words
+            for word in words:
+                self._postings[word].add((product_id, field))
+                if word not in self._word_trigrams:
+                    self._word_trigrams[word] = trigrams(word)
+                    for trigram in self._word_trigrams[word]:
+                        self._trigram_words[trigram].add(word)
+        self._fields[product_id] = product_fields
+        self.names[product_id] = name
+
+    def remove_product(self, product_id: str):
+        """Drop a product (its words stay in the trigram index, harmlessly)"""
+        for field, words in self._fields.pop(product_id, {}).items():
+            for word in words:
+                self._postings[word].discard((product_id, field))
+        self.names.pop(product_id, None)
+
+    def _similar_words(self, word: str) -> Dict[str, float]:
+        """Indexed words similar to an OCR word, with their trigram Jaccard similarity"""
+        if word in self._postings and self._postings[word]:
+            return {word: 1.0}
+        if word[0].isdigit():
+            # Dosages must be read exactly: 500mg is not 5000mg
+            return {}
+
+        word_trigrams = trigrams(word)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in word_trigrams:
+            for candidate in self._trigram_words.get(trigram, ()):
+                shared[candidate] += 1
+
+        similar = {}
+        for candidate, count in shared.items():
+            similarity = count / (len(word_trigrams) + len(self._word_trigrams[candidate]) - count)
+            if similarity >= MIN_WORD_SIMILARITY and self._postings[candidate]:
+                similar[candidate] = similarity
+        return similar
+
+    def match(self, text: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """(product_id, score between 0 and 1) for the products named in a text, best first"""
+        # Best similarity of each indexed word to any word of the text
+        found: Dict[str, float] = {}
+        for word in set(tokenize(text)):
+            for candidate, similarity in self._similar_words(word).items():
+                if similarity > found.get(candidate, 0.0):
+                    found[candidate] = similarity
+
+        candidates: Set[str] = set()
+        for word in found:
+            candidates.update(
+                product_id for product_id, field in self._postings[word] if field in IDENTIFYING_FIELDS
+            )
+
+        scores = []
+        for product_id in candidates:
+            fields = self._fields[product_id]
+            total = 0.0
+            weights = 0.0
+            for field, words in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                weights += weight
+                total += weight * sum(found.get(word, 0.0) for word in words) / len(words)
+            scores.append((product_id, round(total / weights, 4)))
+
+        scores.sort(key=lambda item: (-item[1], self.names[item[0]]))
+        return scores[:limit]
+
+
+class ProductMatcher:
+    """Holds the process-wide match index, loaded from the database on first use and once stale"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PRODUCT_INDEX_TTL_SECONDS
+        self._index: Optional[ProductMatchIndex] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._index is not None and time.monotonic() - self._loaded_at <= self.ttl_seconds
+
+    async def get_index(self, db: AsyncSession) -> ProductMatchIndex:
+        if not self._is_fresh():
+            async with self._lock:
+                # Requests that queued behind a reload use its result
+                if not self._is_fresh():
+                    self._index = await self._load(db)
+                    self._loaded_at = time.monotonic()
+        return self._index
+
+    async def _load(self, db: AsyncSession) -> ProductMatchIndex:
+        result = await db.execute(
+            select(
+                Product.id, Product.name, Product.generic_name, Product.active_ingredient,
+                Product.dosage, Product.manufacturer
+            ).where(Product.is_active == True)
+        )
+        index = ProductMatchIndex()
+        for product_id, name, generic_name, active_ingredient, dosage, manufacturer in result.all():
+            index.add_product(
+                product_id, name, generic_name=generic_name, active_ingredient=active_ingredient,
+                dosage=dosage, manufacturer=manufacturer
+            )
+        logger.info(f"Loaded product match index with {len(index)} products")
+        return index
+
+    def refresh_product(self, product: Product):
+        """Apply a committed product create/update to the loaded index"""
+        if self._index is None:
+            return
+        if product.is_active is False:
+            self._index.remove_product(product.id)
+        else:
+            self._index.add_product(
+                product.id, product.name, generic_name=product.generic_name,
+                active_ingredient=product.active_ingredient, dosage=product.dosage,
+                manufacturer=product.manufacturer
+            )
+
+    def invalidate(self):
+        """Drop the index; the next lookup reloads it"""
+        self._index = None
+
+
+# Global product matcher instance
+product_matcher = ProductMatcher()
@@ -0,0 +1,266 @@
+"""
+Typo-tolerant product autocomplete backed by an in-memory prefix trie.
+
+Terms are the normalized (accent-folded, lowercased) product names, generic
+names and active ingredients, both whole and word by word, so that
+"doli", "paracetamol 500" and "amoxiciline" all find their products. Lookups
+never touch the database once the trie is loaded; it is reloaded after
+PRODUCT_INDEX_TTL_SECONDS so that products written by other worker processes
+or by scripts are picked up.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Product
+from app.search_index import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+
+def max_edit_distance(query: str) -> int:
+    """Typos tolerated for a query of this length"""
+    if len(query) <= 3:
+        return 0
+    if len(query) <= 6:
+        return 1
+    return 2
+
+
+def exact_prefix_length(max_distance: int) -> int:
+    """Leading characters that must be typed correctly for fuzzy matching.
+
+    Typos are rare in the first letters; requiring them keeps the trie walk
+    to a small subtree, which is what makes fuzzy lookups cheap.
+    """
+    return 2 if max_distance >= 2 else 1
+
+
+def _next_row(
+    row: List[int],
+    previous_row: Optional[List[int]],
+    char: str,
+    previous_char: Optional[str],
+    query: str,
+    max_distance: int
+) -> List[int]:
+    """Damerau-Levenshtein (optimal string alignment) DP row after appending char.
+
+    Only the diagonal band that can stay within max_distance is computed;
+    cells outside it are capped at max_distance + 1.
+    """
+    depth = row[0] + 1
+    cap = max_distance + 1
+    next_row = [cap] * (len(query) + 1)
+    next_row[0] = depth
+    left = next_row[max(1, depth - max_distance) - 1]
+    for i in range(max(1, depth - max_distance), min(len(query), depth + max_distance) + 1):
+        if query[i - 1] == char:
+            value = row[i - 1]
+        else:
+            value = row[i - 1] + 1
+            if (i > 1 and previous_row is not None and query[i - 2] == char
+                    and query[i - 1] == previous_char and previous_row[i - 2] < value):
+                # Swapped adjacent letters count as a single typo
+                value = previous_row[i - 2] + 1
+        if row[i] < value:
+            value = row[i] + 1
+        if left < value:
+            value = left + 1
+        if value > cap:
+            value = cap
+        next_row[i] = left = value
+    return next_row
+
+
+class TrieNode:
+    __slots__ = ("children", "product_ids")
+
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.product_ids: Set[str] = set()
+
+
+class ProductSuggestIndex:
+    """Prefix trie of normalized product terms"""
+
+    def __init__(self):
+        self.root = TrieNode()
+        self.names: Dict[str, str] = {}
+        self._terms: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def terms_for(name: Optional[str], generic_name: Optional[str], active_ingredient: Optional[str]) -> Set[str]:
+        terms = set()
+        for value in (name, generic_name, active_ingredient):
+            normalized = normalize_search_text(value)
+            if not normalized:
+                continue
+            terms.add(normalized)
+            terms.update(word for word in normalized.split() if len(word) > 1)
+        return terms
+
+    def add_product(
+        self,
+        product_id: str,
+        name: str,
+        generic_name: Optional[str] = None,
+        active_ingredient: Optional[str] = None
+    ):
+        """Insert or refresh a product's terms"""
+        self.remove_product(product_id)
+        terms = self.terms_for(name, generic_name, active_ingredient)
+        for term in terms:
+            node = self.root
+            for char in term:
+                node = node.children.setdefault(char, TrieNode())
+            node.product_ids.add(product_id)
+        self.names[product_id] = name
+        self._terms[product_id] = terms
+
+    def remove_product(self, product_id: str):
+        """Drop a product's terms (emptied trie nodes are left in place)"""
+        for term in self._terms.pop(product_id, ()):
+            node = self.root
+            for char in term:
+                node = node.children.get(char)
+                if node is None:
+                    break
+            else:
+                node.product_ids.discard(product_id)
+        self.names.pop(product_id, None)
+
+    def _collect(self, node: TrieNode, limit: int, seen: Set[str]) -> List[str]:
+        """Product ids under node, shortest terms first"""
+        found = []
+        queue = deque([node])
+        while queue and len(found) < limit:
+            current = queue.popleft()
+            for product_id in current.product_ids:
+                if product_id not in seen:
+                    seen.add(product_id)
+                    found.append(product_id)
+                    if len(found) >= limit:
+                        break
+            queue.extend(current.children.values())
+        return found
+
+    def _fuzzy_nodes(self, query: str, max_distance: int) -> List[Tuple[int, TrieNode]]:
+        """(distance, node) pairs whose path is within max_distance of query.
+
+        Levenshtein-over-trie walk below the exact_prefix_length() leading
+        characters, pruned as soon as no extension can get back within range.
+        """
+        prefix_length = min(exact_prefix_length(max_distance), len(query))
+        node = self.root
+        previous_row = None
+        row = [min(i, max_distance + 1) for i in range(len(query) + 1)]
+        for char in query[:prefix_length]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+            previous_row, row = row, _next_row(row, previous_row, char, None, query, max_distance)
+
+        matches = []
+        stack = [(node, row, previous_row, query[prefix_length - 1])]
+        while stack:
+            node, row, previous_row, last_char = stack.pop()
+            if row[-1] <= max_distance:
+                # Path matches the whole query: the node is a prefix candidate
+                matches.append((row[-1], node))
+            # Row minima never decrease along a path, so stop once nothing can improve
+            best = min(row[1:])
+            if best > max_distance or best >= row[-1]:
+                continue
+            for char, child in node.children.items():
+                stack.append((child, _next_row(row, previous_row, char, last_char, query, max_distance), row, char))
+
+        return matches
+
+    def suggest(self, query: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """(product_id, edit_distance) suggestions, exact prefix matches first"""
+        normalized = normalize_search_text(query)
+        if not normalized:
+            return []
+
+        seen: Set[str] = set()
+        results: List[Tuple[str, int]] = []
+
+        node = self.root
+        for char in normalized:
+            node = node.children.get(char)
+            if node is None:
+                break
+        else:
+            results.extend((product_id, 0) for product_id in self._collect(node, limit, seen))
+
+        max_distance = max_edit_distance(normalized)
+        if len(results) < limit and max_distance:
+            for distance, fuzzy_node in sorted(self._fuzzy_nodes(normalized, max_distance), key=lambda m: m[0]):
+                if distance == 0:
+                    continue
+                for product_id in self._collect(fuzzy_node, limit - len(results), seen):
+                    results.append((product_id, distance))
+                if len(results) >= limit:
+                    break
+
+        return results
+
+
+class ProductSuggester:
+    """Holds the process-wide suggestion trie, loaded from the database on first use and once stale"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PRODUCT_INDEX_TTL_SECONDS
+        self._index: Optional[ProductSuggestIndex] = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._index is not None and time.monotonic() - self._loaded_at <= self.ttl_seconds
+
+    async def get_index(self, db: AsyncSession) -> ProductSuggestIndex:
+        if not self._is_fresh():
+            async with self._lock:
+                # Requests that queued behind a reload use its result
+                if not self._is_fresh():
+                    self._index = await self._load(db)
+                    self._loaded_at = time.monotonic()
+        return self._index
+
+    async def _load(self, db: AsyncSession) -> ProductSuggestIndex:
+        result = await db.execute(
+            select(Product.id, Product.name, Product.generic_name, Product.active_ingredient)
+            .where(Product.is_active == True)
+        )
+        index = ProductSuggestIndex()
+        for product_id, name, generic_name, active_ingredient in result.all():
+            index.add_product(product_id, name, generic_name, active_ingredient)
+        logger.info(f"Loaded product suggestion index with {len(index)} products")
+        return index
+
+    def refresh_product(self, product: Product):
+        """Apply a committed product create/update to the loaded index"""
+        if self._index is None:
+            return
+        if product.is_active is False:
+            self._index.remove_product(product.id)
+        else:
+            self._index.add_product(product.id, product.name, product.generic_name, product.active_ingredient)
+
+    def invalidate(self):
+        """Drop the index; the next lookup reloads it"""
+        self._index = None
+
+
+# Global product suggester instance
+product_suggester = ProductSuggester()
@@ -0,0 +1,83 @@
+"""
+Short-lived cache of authenticated users, keyed by token subject (email).
+
+A page load fires several authenticated API calls; each one used to look the
+user up again. Column values are cached for a few seconds and every hit gets
+its own detached User instance, so requests never share mutable state.
+Entries are dropped as soon as a user row is updated or deleted in this
+process (see the ORM hooks in app.models); the TTL bounds how long other
+worker processes can serve a stale identity.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.config import settings
+from app.models import User
+
+PENDING_INVALIDATIONS_KEY = "invalidated_user_emails"
+
+
+class CurrentUserCache:
+    """LRU cache of user column values with a time-to-live"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.CURRENT_USER_CACHE_TTL_SECONDS
+        self.max_size = max_size if max_size is not None else settings.CURRENT_USER_CACHE_SIZE
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # ORM hooks may invalidate from a worker thread (sync sessions)
+        self._lock = threading.Lock()
+
+    def get(self, email: str) -> Optional[User]:
+        """A detached User built from the cached values, None on a miss"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            cached_at, values = entry
+            if time.monotonic() - cached_at > self.ttl_seconds:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def put(self, user: User):
+        """Cache the column values of a loaded user"""
+        values = {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+        with self._lock:
+            self._entries[user.email] = (time.monotonic(), values)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *emails: str):
+        with self._lock:
+            for email in emails:
+                self._entries.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global current-user cache instance
+current_user_cache = CurrentUserCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    """Invalidate again once user changes are committed.
+
+    The flush-time invalidation leaves a window in which a concurrent request
+    could re-cache the old row before the commit.
+    """
+    emails = session.info.pop(PENDING_INVALIDATIONS_KEY, None)
+    if emails:
+        current_user_cache.invalidate(*emails)
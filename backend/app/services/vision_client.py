@@ -0,0 +1,173 @@
+"""
+Async client for the Google Vision text detection API.
+
+Requests go through one pooled httpx.AsyncClient (kept-alive TLS connections),
+at most VISION_MAX_CONCURRENCY at a time, and each call has a total time budget
+covering the wait for a slot, image preparation and the HTTP round trip.
+Photos are downscaled and recompressed with Pillow in a worker thread before
+upload: OCR does not need full camera resolution, and a phone photo shrinks
+from several megabytes to a few hundred kilobytes. VISION_API_URL can point at
+a local fake server.
+"""
+import asyncio
+import base64
+import io
+import logging
+from typing import Optional, Tuple
+
+import httpx
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.config import settings
+from app.services.ocr_cache import OCRCache, ocr_cache
+
+logger = logging.getLogger(__name__)
+
+
+class VisionError(Exception):
+    """The Vision API call failed or returned an error"""
+
+
+class VisionTimeout(VisionError):
+    """The call did not complete within the time budget"""
+
+
+class VisionRejected(VisionError):
+    """The API answered but could not process the image"""
+
+
+class InvalidImage(VisionError):
+    """The uploaded image could not be decoded"""
+
+
+def prepare_image(image_bytes: bytes, max_dimension: int, quality: int) -> bytes:
+    """Downscale to max_dimension and recompress as JPEG; keeps the original if that is smaller"""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # JPEG photos are decoded directly at a reduced scale
+        image.draft("RGB", (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImage(f"Unreadable image: {e}")
+
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    prepared = output.getvalue()
+    return prepared if len(prepared) < len(image_bytes) else image_bytes
+
+
+class VisionClient:
+    """Pooled, concurrency-limited Vision API client"""
+
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache: Optional[OCRCache] = ocr_cache
+    ):
+        self.api_url = api_url or settings.VISION_API_URL
+        self.api_key = api_key if api_key is not None else settings.GOOGLE_VISION_API_KEY
+        self.max_concurrency = max_concurrency or settings.VISION_MAX_CONCURRENCY
+        self.timeout = timeout or settings.VISION_TIMEOUT_SECONDS
+        self.transport = transport
+        self.cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                transport=self.transport
+            )
+        return self._client
+
+    async def detect_text(self, image_base64: str) -> Tuple[str, float]:
+        """OCR an image; returns (full text, confidence), ("", 0.0) when no text is found"""
+        try:
+            return await asyncio.wait_for(self._detect_text(image_base64), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise VisionTimeout(f"Vision API call exceeded {self.timeout:.0f}s")
+
+    async def _detect_text(self, image_base64: str) -> Tuple[str, float]:
+        try:
+            image_bytes = base64.b64decode(image_base64, validate=True)
+        except ValueError:
+            raise InvalidImage("Image is not valid base64")
+
+        # Repeated scans of the same image are answered from the OCR cache
+        cache_key = await self.cache.key_for(image_bytes) if self.cache is not None else None
+        if cache_key is not None:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        image_bytes = await asyncio.to_thread(
+            prepare_image, image_bytes, settings.VISION_MAX_IMAGE_DIMENSION, settings.VISION_JPEG_QUALITY
+        )
+
+        vision_request = {
+            "requests": [
+                {
+                    "image": {"content": base64.b64encode(image_bytes).decode("ascii")},
+                    "features": [{"type": "TEXT_DETECTION", "maxResults": 50}],
+                    # French and English for pharmaceutical terms
+                    "imageContext": {"languageHints": ["fr", "en"]}
+                }
+            ]
+        }
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        async with self._slots:
+            try:
+                response = await self._get_client().post(
+                    self.api_url, params={"key": self.api_key}, json=vision_request
+                )
+            except httpx.TimeoutException:
+                raise VisionTimeout("Vision API request timed out")
+            except httpx.HTTPError as e:
+                raise VisionError(f"Failed to connect to Vision API: {e}")
+
+        if response.status_code != 200:
+            logger.error(f"Google Vision API error: {response.status_code} - {response.text[:500]}")
+            raise VisionError(f"Google Vision API request failed: {response.status_code}")
+
+        responses = response.json().get("responses") or []
+        if not responses:
+            raise VisionRejected("No response from Google Vision API")
+        vision_response = responses[0]
+        if "error" in vision_response:
+            raise VisionRejected(f"Google Vision API error: {vision_response['error'].get('message', 'Unknown error')}")
+
+        annotations = vision_response.get("textAnnotations")
+        if annotations:
+            # The first annotation contains all detected text
+            result = (annotations[0]["description"].strip(), annotations[0].get("confidence", 0.9))
+        else:
+            result = ("", 0.0)
+
+        if cache_key is not None:
+            await self.cache.put(cache_key, result)
+        return result
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Global Vision API client instance
+vision_client = VisionClient()
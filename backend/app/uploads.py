@@ -0,0 +1,69 @@
+"""
+Streaming storage of uploaded files.
+
+An upload is copied to a temporary file in the target directory chunk by
+chunk, counting bytes and hashing as it goes, so memory use stays at one chunk
+whatever the file size and an oversized file is abandoned as soon as it
+crosses the limit. The complete file is then renamed into place, which is
+atomic: readers never see a partial upload under its final name.
+"""
+import hashlib
+import os
+import uuid
+from typing import NamedTuple, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the allowed size"""
+
+
+class StoredUpload(NamedTuple):
+    filename: str  # Relative to the upload directory
+    path: str
+    size: int
+    sha256: str
+
+
+async def stream_to_temporary_file(file: UploadFile, directory: str, max_size: int) -> Tuple[str, int, str]:
+    """Stream an upload to a temporary file in directory; returns (path, size, sha256).
+
+    Raises UploadTooLarge past max_size bytes. The caller renames or removes the file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = os.path.join(directory, f".{uuid.uuid4()}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temporary_path, "wb") as output:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                await output.write(chunk)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return temporary_path, size, digest.hexdigest()
+
+
+async def save_upload(file: UploadFile, directory: str, extension: str, max_size: int) -> StoredUpload:
+    """Stream an upload to directory/<uuid><extension>, raising UploadTooLarge past max_size bytes"""
+    temporary_path, size, sha256 = await stream_to_temporary_file(file, directory, max_size)
+    filename = f"{uuid.uuid4()}{extension}"
+    path = os.path.join(directory, filename)
+    os.replace(temporary_path, path)
+    return StoredUpload(filename=filename, path=path, size=size, sha256=sha256)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark du rendu des emails de commande (gabarits précompilés)
+
+Simule un lot d'emails de confirmation et de reçu, comme lors d'une journée de
+ventes flash, et mesure le débit de rendu sans envoi ni base de données.
+
+Usage: python benchmark_email_rendering.py [nb_emails] [commandes_par_email]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add app to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.email_service import email_service
+
+RUNS = 5
+
+
+def make_orders(count: int):
+    """Commandes de test, une par pharmacie"""
+    orders = []
+    for i in range(count):
+        items_count = random.randint(1, 6)
+        subtotal = random.randint(1, 20) * 500 * items_count
+        delivery_fee = random.choice([0, 1000, 1500])
+        delivery_type = random.choice(["pickup", "home_delivery"])
+        orders.append({
+            "order_number": f"CMD{random.randint(100000, 999999)}",
+            "pharmacy_name": f"Pharmacie {i + 1}",
+            "delivery_type": delivery_type,
+            "items_count": items_count,
+            "subtotal": subtotal,
+            "delivery_fee": delivery_fee,
+            "total_amount": subtotal + delivery_fee,
+            "pickup_code": f"{random.randint(1000, 9999)}" if delivery_type == "pickup" else None,
+        })
+    return orders
+
+
+def run_benchmark(email_count: int, orders_per_email: int):
+    """Rend email_count confirmations et reçus, plusieurs fois, et affiche le débit"""
+    random.seed(42)
+    batch = [(f"client{i}@pharmafinder.tg", f"Client {i}", make_orders(orders_per_email)) for i in range(email_count)]
+
+    for label, render in (
+        ("confirmation", lambda email, name, orders: email_service.render_order_confirmation_email(name, orders)),
+        ("reçu", lambda email, name, orders: email_service.render_order_receipt_email(email, name, orders, [])),
+    ):
+        timings = []
+        size = 0
+        for _ in range(RUNS):
+            started = time.perf_counter()
+            for email, name, orders in batch:
+                _, html = render(email, name, orders)
+            timings.append(time.perf_counter() - started)
+            size = len(html)
+
+        best = min(timings)
+        print(f"✅ {label}: {email_count} emails en {best * 1000:.1f} ms "
+              f"(médiane {statistics.median(timings) * 1000:.1f} ms), "
+              f"{email_count / best:,.0f} emails/s, {best * 1e6 / email_count:.1f} µs/email, ~{size} octets")
+
+
+if __name__ == "__main__":
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    orders_per_email = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    run_benchmark(emails, orders_per_email)
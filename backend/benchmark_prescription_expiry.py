@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark de l'expiration groupée des prescriptions (expire_timed_out_requests)
+
+Crée dans une base SQLite temporaire des demandes de prescription en attente
+dont le délai de validation est dépassé, comme après une panne, puis les fait
+expirer et vérifie que le nombre de requêtes SQL dépend du nombre de lots et
+non du nombre de demandes (l'ancienne boucle en faisait deux par demande).
+
+Usage: python benchmark_prescription_expiry.py [nb_demandes] [taille_lot]
+"""
+
+import asyncio
+import math
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+# Add app to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.background_tasks import background_task_manager
+from app.models import (
+    Base, Category, Notification, Pharmacy, PrescriptionRequest, PrescriptionStatus, Product, User,
+    UserNotificationCounter, UserRole
+)
+
+PHARMACIES = 50
+PRODUCTS = 100
+USERS = 500
+# UPDATE ... RETURNING, two name lookups, one notification insert and one unread counter upsert per lot
+STATEMENTS_PER_CHUNK = 5
+
+
+async def seed_requests(engine, request_count: int):
+    """Insert users, pharmacies, products and timed-out pending requests"""
+    owner_id = str(uuid.uuid4())
+    category_id = str(uuid.uuid4())
+    user_ids = [str(uuid.uuid4()) for _ in range(USERS)]
+    pharmacy_ids = [str(uuid.uuid4()) for _ in range(PHARMACIES)]
+    product_ids = [str(uuid.uuid4()) for _ in range(PRODUCTS)]
+    timed_out = datetime.utcnow() - timedelta(hours=2)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {
+                "id": user_id, "email": f"client{i}@pharmafinder.tg", "password_hash": "x",
+                "first_name": "Client", "last_name": str(i), "role": role
+            }
+            for i, (user_id, role) in enumerate(
+                [(owner_id, UserRole.PHARMACIST)] + [(user_id, UserRole.CLIENT) for user_id in user_ids]
+            )
+        ])
+        await conn.execute(insert(Category).values(id=category_id, name="Benchmark", slug="benchmark"))
+        await conn.execute(insert(Pharmacy), [
+            {
+                "id": pharmacy_id, "name": f"Pharmacie {i}", "license_number": f"BENCH-{i}",
+                "owner_id": owner_id, "address": "Lomé", "latitude": Decimal("6.13"),
+                "longitude": Decimal("1.22"), "is_active": True, "is_verified": True,
+            }
+            for i, pharmacy_id in enumerate(pharmacy_ids)
+        ])
+        await conn.execute(insert(Product), [
+            {
+                "id": product_id, "name": f"Amoxicilline {i}", "category_id": category_id,
+                "requires_prescription": True, "is_active": True,
+            }
+            for i, product_id in enumerate(product_ids)
+        ])
+        await conn.execute(insert(PrescriptionRequest), [
+            {
+                "id": str(uuid.uuid4()),
+                "user_id": user_ids[i % USERS],
+                "pharmacy_id": pharmacy_ids[i % PHARMACIES],
+                "product_id": product_ids[i % PRODUCTS],
+                "prescription_image_url": f"/uploads/prescriptions/{i}.jpg",
+                "status": PrescriptionStatus.PENDING,
+                "quantity_requested": 1,
+                "validation_timeout_at": timed_out + timedelta(seconds=i % 600),
+            }
+            for i in range(request_count)
+        ])
+
+
+async def run_benchmark(request_count: int, chunk_size: int):
+    """Expire every seeded request and report statements and duration"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'benchmark.db')}")
+        await seed_requests(engine, request_count)
+        session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        print(f"{request_count} demandes expirées en attente, lots de {chunk_size}")
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+        async with session_factory() as db:
+            started = time.perf_counter()
+            expired = await background_task_manager.expire_timed_out_requests(db, chunk_size=chunk_size)
+            elapsed = time.perf_counter() - started
+        event.remove(engine.sync_engine, "before_cursor_execute", count_statement)
+
+        async with session_factory() as db:
+            pending = (await db.execute(
+                select(func.count()).select_from(PrescriptionRequest)
+                .where(PrescriptionRequest.status == PrescriptionStatus.PENDING)
+            )).scalar()
+            notifications = (await db.execute(select(func.count()).select_from(Notification))).scalar()
+            unread = (await db.execute(select(func.sum(UserNotificationCounter.unread_count)))).scalar()
+            sample = (await db.execute(
+                select(PrescriptionRequest.rejection_reason).limit(1)
+            )).scalar()
+
+        # The final empty UPDATE is only issued when the last lot is full
+        budget = STATEMENTS_PER_CHUNK * math.ceil(request_count / chunk_size) + 1
+        print(f"Expirées: {expired}, encore en attente: {pending}, notifications: {notifications} "
+              f"(non lues d'après les compteurs: {unread})")
+        print(f"Exemple de motif: {sample}")
+        print(f"Requêtes SQL: {len(statements)} (budget {budget}, ancienne boucle ~{2 * request_count})")
+        print(f"Durée: {elapsed:.2f} s ({request_count / elapsed:.0f} demandes/s)")
+
+        await engine.dispose()
+
+        assert expired == request_count and pending == 0 and notifications == request_count == unread, \
+            "toutes les demandes doivent être expirées et notifiées"
+        assert len(statements) <= budget, f"{len(statements)} requêtes SQL au lieu de {budget} au plus"
+        print("✅ Expiration groupée")
+
+
+if __name__ == "__main__":
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    chunk = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    asyncio.run(run_benchmark(requests_count, chunk))
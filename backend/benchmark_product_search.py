@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la recherche enrichie (search_products_with_pharmacy_info)
+
+Crée un catalogue de test dans une base SQLite temporaire, où chaque produit
+est sponsorisé par plusieurs pharmacies, puis vérifie que chaque page contient
+exactement `limit` produits distincts (moins pour la dernière), tous parmi les
+produits attendus pour la requête, et mesure la latence.
+
+Usage: python benchmark_product_search.py [nb_produits] [nb_pharmacies]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+# Add app to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import search_products_with_pharmacy_info
+from app.models import Base, Category, Pharmacy, PharmacyInventory, Product, User, UserRole
+from app.offer_summary import rebuild_offer_summaries
+from app.search_index import normalize_search_text, rebuild_search_index
+
+PAGE_SIZE = 20
+PAGES = 10
+RUNS_PER_PAGE = 5
+SPONSORS_PER_PRODUCT = 3
+NAMES = ["Paracétamol", "Amoxicilline", "Ibuprofène", "Doliprane", "Efferalgan", "Aspirine", "Vitamine C", "Smecta"]
+
+
+async def seed_catalog(engine, product_count: int, pharmacy_count: int):
+    """Insert pharmacies, products and inventory with several sponsors per product"""
+    random.seed(42)
+    owner_id = str(uuid.uuid4())
+    category_id = str(uuid.uuid4())
+    pharmacy_ids = [str(uuid.uuid4()) for _ in range(pharmacy_count)]
+    product_ids = [str(uuid.uuid4()) for _ in range(product_count)]
+
+    inventory = []
+    for product_id in product_ids:
+        stocked = random.sample(pharmacy_ids, min(8, pharmacy_count))
+        sponsors = set(stocked[:SPONSORS_PER_PRODUCT])
+        for pharmacy_id in stocked:
+            inventory.append({
+                "id": str(uuid.uuid4()),
+                "pharmacy_id": pharmacy_id,
+                "product_id": product_id,
+                "quantity": random.choice([5, 10, 50]),
+                "price": Decimal(random.randint(500, 5000)),
+                "is_sponsored": pharmacy_id in sponsors,
+                "sponsor_rank": random.randint(1, 5) if pharmacy_id in sponsors else 0,
+            })
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User).values(
+            id=owner_id, email="benchmark@pharmafinder.tg", password_hash="x",
+            first_name="Bench", last_name="Mark", role=UserRole.PHARMACIST
+        ))
+        await conn.execute(insert(Category).values(id=category_id, name="Benchmark", slug="benchmark"))
+        await conn.execute(insert(Pharmacy), [
+            {
+                "id": pharmacy_id, "name": f"Pharmacie {i}", "license_number": f"BENCH-{i}",
+                "owner_id": owner_id, "address": "Lomé", "latitude": Decimal("6.13"),
+                "longitude": Decimal("1.22"), "is_active": True, "is_verified": True,
+            }
+            for i, pharmacy_id in enumerate(pharmacy_ids)
+        ])
+        await conn.execute(insert(Product), [
+            {
+                "id": product_id, "name": f"{NAMES[i % len(NAMES)]} {100 * (i // len(NAMES) + 1)}mg",
+                "generic_name": NAMES[i % len(NAMES)].lower(), "active_ingredient": NAMES[i % len(NAMES)],
+                "category_id": category_id, "is_active": True,
+            }
+            for i, product_id in enumerate(product_ids)
+        ])
+        await conn.execute(insert(PharmacyInventory), inventory)
+        # Bulk inserts bypass the ORM hooks that maintain these
+        await conn.run_sync(rebuild_search_index)
+        await conn.run_sync(rebuild_offer_summaries)
+
+    return len(inventory)
+
+
+async def run_benchmark(product_count: int, pharmacy_count: int):
+    """Page through the enhanced search and report row counts and latency"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'benchmark.db')}")
+        inventory_count = await seed_catalog(engine, product_count, pharmacy_count)
+        session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        print(f"Catalogue: {product_count} produits, {pharmacy_count} pharmacies, "
+              f"{inventory_count} lignes de stock, {SPONSORS_PER_PRODUCT} sponsors par produit")
+
+        async with session_factory() as db:
+            sponsored_offers = (await db.execute(
+                select(func.count()).select_from(PharmacyInventory).where(PharmacyInventory.is_sponsored == True)
+            )).scalar()
+            print(f"Offres sponsorisées (lignes qu'une jointure sans fenêtre dupliquerait): {sponsored_offers}")
+
+            products = (await db.execute(
+                select(Product.id, Product.name, Product.generic_name, Product.active_ingredient)
+            )).all()
+
+            for query in (None, "parac"):
+                # Expected matches computed without the search index, by substring on the normalized fields
+                normalized = normalize_search_text(query)
+                matching = {
+                    product_id for product_id, *fields in products
+                    if any(normalized in normalize_search_text(field) for field in fields)
+                }
+                seen = set()
+                timings = []
+                ok = True
+                for page in range(PAGES):
+                    for _ in range(RUNS_PER_PAGE):
+                        started = time.perf_counter()
+                        results = await search_products_with_pharmacy_info(
+                            db, query=query, skip=page * PAGE_SIZE, limit=PAGE_SIZE
+                        )
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                    ids = [item["id"] for item in results]
+                    expected = min(PAGE_SIZE, max(0, len(matching) - page * PAGE_SIZE))
+                    if len(ids) != expected or len(set(ids)) != len(ids) or seen & set(ids) or set(ids) - matching:
+                        ok = False
+                        print(f"❌ page {page}: {len(ids)} lignes, {len(set(ids))} produits distincts")
+                    seen.update(ids)
+
+                label = query or "(aucune requête)"
+                print(f"{'✅' if ok else '❌'} {label}: {len(seen)} produits distincts sur {PAGES} pages "
+                      f"({len(matching)} correspondants), "
+                      f"médiane {statistics.median(timings):.2f} ms, max {max(timings):.2f} ms")
+                assert ok, f"pagination incorrecte pour la requête {label!r}"
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    pharmacies = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    asyncio.run(run_benchmark(products, pharmacies))
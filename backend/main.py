@@ -1,11 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
 from app.config import settings
-from app.routers import auth, products, pharmacies, orders, categories, partner_analytics, cart, prescriptions, notifications, vision, addresses, payments
+from app.services.password_hasher import password_hasher
+from app.services.email_queue import email_queue
+from app.services.vision_client import vision_client
+from app.services.prescription_images import prescription_image_pipeline
+from app.services.prescription_store import prescription_store
+from app.services.object_storage import object_storage
+from app.services.job_scheduler import job_scheduler
+from app.services.notification_counter import reconcile_unread_counts
+from app.routers import auth, products, pharmacies, orders, categories, partner_analytics, cart, prescriptions, notifications, vision, addresses, payments, storage
 
 # Create FastAPI app
 app = FastAPI(
@@ -37,6 +45,24 @@ app = FastAPI(
     },
 )
 
+# Multipart overhead (boundaries, part headers, small form fields) allowed on top of MAX_UPLOAD_SIZE
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+
+# Registered before CORSMiddleware so that it runs inside it and its 413 carries the CORS headers
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads that announce a body over the limit before it is read and spooled"""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > settings.MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload too large (max {settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB)"}
+            )
+    return await call_next(request)
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +70,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["*"],
+    # Paginated listings return their next cursor in this header
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Trusted hosts middleware (security)
@@ -53,6 +81,7 @@ if not settings.DEBUG:
         allowed_hosts=["pharmafinder.tg", "*.pharmafinder.tg", "localhost", "127.0.0.1"]
     )
 
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(products.router)
@@ -66,6 +95,7 @@ app.include_router(prescriptions.router)
 app.include_router(notifications.router)
 app.include_router(partner_analytics.router)
 app.include_router(vision.router)
+app.include_router(storage.router)
 
 
 # Health check endpoint
@@ -87,7 +117,10 @@ async def health_check():
         "status": "healthy",
         "version": settings.APP_VERSION,
         "database": "connected",  # TODO: Add actual DB health check
-        "timestamp": "2024-01-01T00:00:00Z"  # TODO: Add actual timestamp
+        "timestamp": "2024-01-01T00:00:00Z",  # TODO: Add actual timestamp
+        "password_hashing": password_hasher.stats(),
+        "email_queue": email_queue.stats(),
+        "jobs": job_scheduler.stats()
     }
 
 
@@ -133,6 +166,26 @@ async def startup_event():
     # Start background tasks
     print("⏰ Starting prescription timeout monitor...")
     asyncio.create_task(background_task_manager.start_timeout_monitor())
+    print("📧 Starting email queue worker...")
+    asyncio.create_task(email_queue.run())
+
+    # Periodic jobs: each runs in a single worker, elected through a lease
+    job_scheduler.register(
+        "prescription-timeout-reconciliation", settings.PRESCRIPTION_TIMEOUT_RECONCILE_SECONDS,
+        background_task_manager.reconcile_timeouts
+    )
+    job_scheduler.register(
+        "prescription-file-gc", settings.PRESCRIPTION_GC_INTERVAL_SECONDS, prescription_store.collect_garbage
+    )
+    job_scheduler.register(
+        "prescription-image-rerender", settings.PRESCRIPTION_IMAGE_RERENDER_SECONDS,
+        prescription_image_pipeline.rerender_missing
+    )
+    job_scheduler.register(
+        "notification-count-reconciliation", settings.NOTIFICATION_COUNT_RECONCILE_SECONDS, reconcile_unread_counts
+    )
+    print("🗓️ Starting background job scheduler...")
+    asyncio.create_task(job_scheduler.run())
 
     print("✅ Startup completed successfully")
 
@@ -146,6 +199,12 @@ async def shutdown_event():
 
     # Stop background tasks
     background_task_manager.stop_timeout_monitor()
+    email_queue.stop()
+    password_hasher.shutdown()
+    await vision_client.close()
+    prescription_image_pipeline.shutdown()
+    await job_scheduler.stop()
+    await object_storage.close()
 
     # TODO: Close database connections
     # TODO: Close Redis connections
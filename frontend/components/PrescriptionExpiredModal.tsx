@@ -22,6 +22,7 @@ interface AlternativePharmacy {
   distance_km: number;
   latitude?: number;
   longitude?: number;
+  price?: number;
 }
 
 interface PrescriptionExpiredModalProps {
@@ -374,6 +375,11 @@ const PrescriptionExpiredModal: React.FC<PrescriptionExpiredModalProps> = ({
                         <div className="text-sm text-primary-600 mt-1">
                           📍 À {pharmacy.distance_km.toFixed(1)} km
                         </div>
+                        {pharmacy.price != null && (
+                          <div className="text-sm text-gray-600 mt-1">
+                            En stock · {new Intl.NumberFormat('fr-FR').format(pharmacy.price)} FCFA
+                          </div>
+                        )}
                       </div>
                       <button
                         onClick={() => handleRetryWithPharmacy(pharmacy)}
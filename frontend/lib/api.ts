@@ -367,7 +367,7 @@ export const api = {
     getTracking: (id: string): Promise<AxiosResponse<any>> =>
       apiClient.get(`/orders/${id}/tracking`),
     
-    uploadPrescription: (file: File): Promise<AxiosResponse<{ image_url: string }>> => {
+    uploadPrescription: (file: File): Promise<AxiosResponse<{ image_url: string; download_url: string; expires_in: number }>> => {
       const formData = new FormData();
       formData.append('file', file);
       return apiClient.post('/orders/upload-prescription', formData, {
@@ -19,6 +19,10 @@ interface PrescriptionRequest {
   product_id: string;
   pharmacy_id: string;
   prescription_image_url: string;
+  thumbnail_url?: string | null;
+  preview_url?: string | null;
+  full_size_url?: string | null;
+  derivatives_failed?: boolean;
   original_filename: string;
   status: 'pending' | 'approved' | 'rejected';
   quantity_requested: number;
@@ -219,6 +223,14 @@ const PharmacistPrescriptions = () => {
                 {prescriptions.map((prescription) => (
                   <div key={prescription.id} className="border-b border-gray-200 last:border-b-0 p-6">
                     <div className="flex items-start justify-between">
+                      {prescription.thumbnail_url && (
+                        <img
+                          src={`http://localhost:8001${prescription.thumbnail_url}`}
+                          alt="Ordonnance"
+                          loading="lazy"
+                          className="h-16 w-16 object-cover border rounded mr-4"
+                        />
+                      )}
                       <div className="flex-1">
                         <div className="flex items-center mb-2">
                           {getStatusIcon(prescription.status)}
@@ -305,11 +317,39 @@ const PharmacistPrescriptions = () => {
                     className="border rounded"
                   />
                 ) : (
-                  <img
-                    src={`http://localhost:8001${selectedPrescription.prescription_image_url}`}
-                    alt="Ordonnance"
-                    className="max-w-full h-auto border rounded"
-                  />
+                  <>
+                    {/* The uploaded photo may carry its GPS position: only the derivatives, rendered without EXIF, are shown */}
+                    {selectedPrescription.preview_url ? (
+                      <img
+                        src={`http://localhost:8001${selectedPrescription.preview_url}`}
+                        alt="Ordonnance"
+                        className="max-w-full h-auto border rounded"
+                      />
+                    ) : selectedPrescription.derivatives_failed ? (
+                      <div className="py-12 text-sm text-gray-500">
+                        <p>Aperçu indisponible : le fichier n'a pas pu être lu comme une image.</p>
+                        <a
+                          href={`http://localhost:8001${selectedPrescription.prescription_image_url}`}
+                          download
+                          className="inline-block mt-2 text-primary-600 hover:underline"
+                        >
+                          Télécharger le document
+                        </a>
+                      </div>
+                    ) : (
+                      <p className="py-12 text-sm text-gray-500">Aperçu en cours de préparation…</p>
+                    )}
+                    {selectedPrescription.full_size_url && (
+                      <a
+                        href={`http://localhost:8001${selectedPrescription.full_size_url}`}
+                        target="_blank"
+                        rel="noopener noreferrer"
+                        className="inline-block mt-2 text-sm text-primary-600 hover:underline"
+                      >
+                        Voir l'original
+                      </a>
+                    )}
+                  </>
                 )}
               </div>
             </div>